@@ -1,26 +1,58 @@
 import os
+import json
+import atexit
 import uuid
 import logging
 import tempfile
 import mimetypes
+import math
 import base64
+import hashlib
 import requests
 import time
-from flask import Flask, request, jsonify, session
+import threading
+from functools import wraps
+from flask import Flask, Response, request, jsonify, session, g, redirect
 from flask_cors import CORS
-from flask_session import Session
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, Epilogue, NeedData
 
 # Import S3 uploader module
-from s3_uploader import upload_file_from_memory, save_file_url_to_database
+from s3_uploader import (
+    upload_file_from_memory, upload_files_batch, save_file_url_to_database, save_file_urls_to_database,
+    insert_contribution, insert_contributions,
+    check_s3_health, StreamingUpload,
+    create_multipart_upload, upload_part, complete_multipart_upload, abort_multipart_upload,
+    list_uploaded_parts, generate_presigned_upload_url, generate_presigned_part_urls, generate_presigned_download_url,
+    get_object_info, delete_object, store_object, save_contribution_metadata, generate_object_key, reconcile_media_index, transfer_tuner, transfer_scheduler,
+    index_stored_object, MEDIA_DEDUP,
+    fetch_contributions, CONTRIBUTION_TYPE_COLUMNS,
+    S3_MAX_PARTS, PRESIGNED_URL_EXPIRY, PUBLIC_URL_FORMAT
+)
+from upload_sessions import UploadSessionStore
+from sessions import init_session, stores_on_server
+from auth_tokens import TokenVerifier, InvalidToken, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
+from logging_config import configure_logging, RequestLogSampler
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Gauge, Histogram
+from upload_jobs import UploadJobManager, JobQueueFull
+from transfer_scheduler import SchedulerBusy
+from text_ingest import iter_json_array, iter_ndjson
+from content_sniffing import sniff_content_type, SNIFF_SIZE
+from storage_encoding import text_row, decoded_body, decompress_text, ContentDecodingError
+from ttl_cache import TTLCache
+from derivatives import DerivativePipeline, DERIVATIVES_EAGER, DERIVATIVE_WORKERS, DERIVATIVE_QUEUE_SIZE
+from rate_limit import RateLimiter
+from resilience import Dependency, DependencyUnavailable, OutcomeUnknown, start_deadline, end_deadline, REQUEST_DEADLINE
 
 # Load environment variables
 load_dotenv()
 
-# Enable logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Enable logging; records are written by a background thread (LOG_LEVEL, LOG_FORMAT)
+configure_logging()
 logger = logging.getLogger(__name__)
 logger.info("Starting application...")
 
@@ -28,26 +60,65 @@ logger.info("Starting application...")
 app = Flask(__name__)
 CORS(app)
 
-# Configure session
-app.secret_key = os.getenv("SECRET_KEY", os.urandom(24).hex())
-app.config['SESSION_TYPE'] = 'filesystem'
+# Configure session. SECRET_KEY must be the same for all workers so that
+# every worker accepts the signed session cookies of the others.
+SECRET_KEY = os.getenv("SECRET_KEY")
+app.secret_key = SECRET_KEY or os.urandom(24).hex()
 app.config['SESSION_PERMANENT'] = False
-app.config['SESSION_USE_SIGNER'] = True
-app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session')
 
-# Initialize Flask-Session
-Session(app)
+# Session backend chosen with SESSION_BACKEND (memory, filesystem or cookie)
+init_session(app, secret_key_configured=bool(SECRET_KEY))
+
+# Requests slower than this are logged at WARNING and never sampled out
+LOG_SLOW_REQUEST_SECONDS = float(os.getenv("LOG_SLOW_REQUEST_SECONDS", "5"))
+
+# One sampled line per request
+request_logger = logging.getLogger('app.requests')
+request_logger.addFilter(RequestLogSampler())
+
+# Request metrics, labelled with the route pattern so that ids in URLs do not create new series
+request_seconds = Histogram(
+    'dynocollect_http_request_duration_seconds', 'Duration of HTTP requests', ('method', 'route')
+)
+requests_total = Counter(
+    'dynocollect_http_requests_total', 'Finished HTTP requests', ('method', 'route', 'status')
+)
+request_bytes_received = Counter(
+    'dynocollect_http_request_bytes_received_total', 'Bytes of request bodies with a Content-Length', ('route',)
+)
 
 # Add request logging middleware
 @app.before_request
 def log_request_info():
-    print(f"Request received: {request.method} {request.path}")
-    logger.info(f"Request received: {request.method} {request.path}")
+    g.request_start = time.perf_counter()
+
+# Calls to Supabase made while handling a request share its deadline, which starts with the first call
+@app.before_request
+def start_request_deadline():
+    g.deadline_token = start_deadline(REQUEST_DEADLINE, lazy=True)
+
+@app.teardown_request
+def end_request_deadline(exc):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        end_deadline(token)
 
 @app.after_request
 def log_response_info(response):
-    print(f"Response sent: {response.status}")
-    logger.info(f"Response sent: {response.status}")
+    duration = time.perf_counter() - g.get('request_start', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_seconds.labels(request.method, route).observe(duration)
+    requests_total.labels(request.method, route, response.status_code).inc()
+    if request.content_length:
+        request_bytes_received.labels(route).inc(request.content_length)
+    level = logging.WARNING if response.status_code >= 500 or duration > LOG_SLOW_REQUEST_SECONDS else logging.INFO
+    if request_logger.isEnabledFor(level):
+        request_logger.log(level, "%s %s %s", request.method, request.path, response.status_code, extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2)
+        })
     return response
 
 # Add health check endpoint
@@ -55,10 +126,32 @@ def log_response_info(response):
 def health_check():
     return jsonify({'status': 'ok'}), 200
 
+# Storage health check; also refreshes the shared S3 client if credentials were rotated
+@app.route('/healthz/storage', methods=['GET'])
+def storage_health_check():
+    result = check_s3_health()
+    if not result["success"]:
+        return jsonify({'status': 'error', 'error': result['error']}), 503
+    return jsonify({
+        'status': 'ok',
+        'latency_seconds': result['latency_seconds'],
+        'transfers': transfer_scheduler.stats()
+    }), 200
+
+# Prometheus metrics of requests, uploads, storage and database
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.expose(), content_type=METRICS_CONTENT_TYPE)
+
 # Configure Flask for large file uploads
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload size
 app.config['REQUEST_TIMEOUT'] = 900  # 15 minutes timeout
 
+# Stream upload bodies straight into storage instead of spooling them first.
+# Can also be enabled per request with ?stream=1
+app.config['STREAMING_UPLOADS'] = os.getenv("STREAMING_UPLOADS", "false").lower() in ("1", "true", "yes")
+STREAM_READ_SIZE = 1024 * 1024  # Read the request body in 1MB chunks
+
 # Supabase setup
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -66,11 +159,146 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 # Create Supabase client with default settings
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Calls to Supabase Auth go through a shared timeout, retry and circuit breaker policy
+supabase_auth = Dependency('supabase_auth')
+
 # Buckets are already created in Supabase UI
 # No need to create them programmatically
 
+# Require a valid bearer token on the data collection and upload routes; on by
+# default once a key to verify tokens with is configured
+REQUIRE_AUTH = os.getenv(
+    "REQUIRE_AUTH",
+    "true" if os.getenv("SUPABASE_JWT_SECRET") or os.getenv("SUPABASE_JWKS_URL") else "false"
+).lower() in ("1", "true", "yes")
+
+
+# Supabase users returned by /auth/user, cached by token hash while the token is valid
+user_profiles = TTLCache(max_entries=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+
+def fetch_user_profile(token):
+    """
+    Get the Supabase user of a token and cache it for /auth/user.
+    """
+    # A read, so it may be hedged
+    user = supabase_auth.call(supabase.auth.get_user, token, hedge=True).dict()
+    user_profiles.set(hashlib.sha256(token.encode()).digest(), user)
+    return user
+
+
+def verify_token_with_supabase(token):
+    # Network fallback for tokens that cannot be verified locally
+    fetch_user_profile(token)
+
+
+# Verifies access tokens locally with SUPABASE_JWT_SECRET or the project's JWKS
+token_verifier = TokenVerifier(fallback=verify_token_with_supabase)
+
+
+def bearer_token():
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    return auth_header.split(' ', 1)[1].strip() or None
+
+
+def require_auth(view):
+    """
+    Reject requests without a valid bearer token when REQUIRE_AUTH is enabled.
+
+    The verified token claims are available as g.user (None when auth is not required).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.user = None
+        if REQUIRE_AUTH:
+            token = bearer_token()
+            if not token:
+                return jsonify({'error': 'Unauthorized'}), 401
+            try:
+                g.user = token_verifier.verify(token)
+            except InvalidToken:
+                return jsonify({'error': 'Invalid or expired token'}), 401
+            except DependencyUnavailable as e:
+                return busy_response({'error': 'Authentication service temporarily unavailable'}, e.retry_after)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def current_user_id():
+    """
+    Return the id of the user whose token the request was verified with, or None.
+
+    New contributions are stored with it as their user_id.
+    """
+    return g.user.get('sub') if g.get('user') else None
+
+# State of resumable uploads
+upload_sessions = UploadSessionStore()
+
+# Seconds clients should wait when storage transfers are at capacity
+UPLOAD_RETRY_AFTER = 5
+
+# Seconds clients should wait while another request completes the same upload
+COMPLETION_RETRY_AFTER = 1
+
+# Background pool for uploads accepted with ?async=1 or 'Prefer: respond-async'
+UPLOAD_JOB_RETRY_AFTER = 30  # seconds clients should wait when the job queue is full
+UPLOAD_JOB_MAX_WAIT = 30  # longest long-poll on /jobs/<job_id> in seconds
+upload_jobs = UploadJobManager(
+    max_workers=int(os.getenv("UPLOAD_JOB_WORKERS", "4")),
+    max_pending=int(os.getenv("UPLOAD_JOB_QUEUE_SIZE", "100")),
+    result_ttl=int(os.getenv("UPLOAD_JOB_TTL", "3600"))
+)
+Gauge('dynocollect_upload_job_workers', 'Threads running background upload jobs').set_function(
+    lambda: upload_jobs.stats()["workers"]
+)
+Gauge('dynocollect_upload_jobs_pending', 'Queued and running background upload jobs').set_function(
+    lambda: upload_jobs.stats()["pending"]
+)
+
+# Uploads received and not yet answered, including background jobs
+uploads_in_progress = Gauge('dynocollect_uploads_in_progress', 'Uploads in progress', ('bucket',))
+
+# Thumbnails and video previews, rendered in worker processes and stored next to the originals
+derivative_pipeline = DerivativePipeline(
+    source_url=generate_presigned_download_url,
+    object_info=get_object_info,
+    store=store_object,
+    public_url_format=PUBLIC_URL_FORMAT
+)
+atexit.register(derivative_pipeline.shutdown)
+
+# Derivatives of new uploads are generated by background jobs, one render per job thread
+derivative_jobs = UploadJobManager(max_workers=DERIVATIVE_WORKERS, max_pending=DERIVATIVE_QUEUE_SIZE, result_ttl=60)
+DERIVATIVE_CACHE_SECONDS = 24 * 60 * 60  # how long clients may cache derivative redirects
+
+# Renders a client may start through /derivatives per minute (0 = unlimited). Applies
+# with and without REQUIRE_AUTH; clients are told apart by user, or by address when anonymous.
+DERIVATIVE_RATE_LIMIT = int(os.getenv("DERIVATIVE_RATE_LIMIT", "30"))
+derivative_limiter = RateLimiter(DERIVATIVE_RATE_LIMIT, period=60)
+
+# Completed resumable and presigned uploads are read back and hashed into the
+# deduplication index by a single background thread
+index_jobs = UploadJobManager(max_workers=1, max_pending=1000, result_ttl=60)
+
+# How often the deduplication index is checked against the buckets (0 disables)
+MEDIA_INDEX_RECONCILE_INTERVAL = int(os.getenv("MEDIA_INDEX_RECONCILE_INTERVAL", str(6 * 60 * 60)))
+
+
+def reconcile_media_index_periodically():
+    while True:
+        time.sleep(MEDIA_INDEX_RECONCILE_INTERVAL)
+        reconcile_media_index()
+
+
+if MEDIA_INDEX_RECONCILE_INTERVAL > 0:
+    threading.Thread(target=reconcile_media_index_periodically, name='media-index-reconcile', daemon=True).start()
+
 
 @app.route('/submit-text', methods=['POST'])
+@require_auth
 def submit_text():
     try:
         data = request.json
@@ -79,20 +307,280 @@ def submit_text():
         if not text_data:
             return jsonify({'error': 'No text data provided'}), 400
 
-        result = supabase.table('contributions').insert({
-            'text_data': text_data
-        }).execute()
+        db_result = insert_contribution(text_row(text_data, current_user_id()))
 
-        # Check for error in APIResponse object
-        if hasattr(result, 'error') and result.error:
-            return jsonify({'error': result.error.message}), 500
+        if not db_result["success"]:
+            return jsonify({'error': db_result['error']}), 503 if db_result.get('busy') else 500
 
-        return jsonify({'success': True, 'data': result.data}), 201
+        # Accepted but not yet written when inserts are batched asynchronously
+        if db_result.get('queued'):
+            return jsonify({'success': True, 'queued': True}), 202
+
+        return jsonify({'success': True, 'data': db_result['data']}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+# Rows per bulk insert for /submit-text/batch
+TEXT_BATCH_CHUNK_SIZE = int(os.getenv("TEXT_BATCH_CHUNK_SIZE", "1000"))
+
+
+def text_batch_item(item):
+    """
+    Return the text of a batch item, which is either a string or an object with text_data.
+    """
+    if isinstance(item, dict):
+        item = item.get('text_data')
+    if not isinstance(item, str) or not item.strip():
+        raise ValueError("No text data provided")
+    return item
+
+
+def insert_text_chunk(chunk, results):
+    """
+    Insert a chunk of (index, text) pairs with one bulk insert and record a result per item.
+    """
+    try:
+        user_id = current_user_id()
+        inserted = insert_contributions([text_row(text, user_id) for _, text in chunk])
+        if len(inserted) != len(chunk):
+            raise RuntimeError(f"Bulk insert returned {len(inserted)} rows for {len(chunk)}")
+    except Exception as e:
+        logger.error(f"Bulk insert of {len(chunk)} text rows failed: {str(e)}")
+        results.extend({'index': index, 'success': False, 'error': str(e)} for index, _ in chunk)
+        return
+
+    for (index, _), row in zip(chunk, inserted):
+        results.append({'index': index, 'success': True, 'id': row.get('id')})
+
+
+# Bulk text ingestion: a JSON array or an NDJSON stream of strings or {"text_data": ...} objects.
+# The body is parsed incrementally and inserted in chunks of TEXT_BATCH_CHUNK_SIZE rows.
+# It may be compressed with Content-Encoding gzip (or zstd when zstandard is installed).
+@app.route('/submit-text/batch', methods=['POST'])
+@require_auth
+def submit_text_batch():
+    try:
+        body = decoded_body(request.stream, request.headers.get('Content-Encoding'), app.config['MAX_CONTENT_LENGTH'])
+    except ContentDecodingError as e:
+        return jsonify({'error': str(e)}), 415
+
+    mimetype = request.mimetype
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json-seq'):
+        items = iter_ndjson(body)
+    elif mimetype == 'application/json':
+        items = iter_json_array(body)
+    else:
+        return jsonify({'error': 'Content-Type must be application/json or application/x-ndjson'}), 415
+
+    results = []
+    chunk = []
+    error = None
+    index = -1
+    try:
+        for index, item in enumerate(items):
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                chunk.append((index, text_batch_item(item)))
+            except ValueError as e:
+                results.append({'index': index, 'success': False, 'error': str(e)})
+                continue
+
+            if len(chunk) >= TEXT_BATCH_CHUNK_SIZE:
+                insert_text_chunk(chunk, results)
+                chunk = []
+    except ValueError as e:
+        # The body is malformed past this point; report what was processed before it
+        error = f"Invalid JSON array after item {index}: {str(e)}"
+    except RequestEntityTooLarge:
+        error = "Request body too large"
+    except ContentDecodingError as e:
+        error = str(e)
+    except Exception as e:
+        logger.error(f"Text batch ingestion failed: {str(e)}")
+        error = str(e)
+
+    if chunk:
+        insert_text_chunk(chunk, results)
+
+    results.sort(key=lambda result: result['index'])
+    inserted = sum(1 for result in results if result['success'])
+    payload = {
+        'success': error is None and inserted == len(results),
+        'inserted': inserted,
+        'failed': len(results) - inserted,
+        'partial': error is not None and inserted > 0,
+        'results': results
+    }
+    if error:
+        payload['error'] = error
+        # Items before the error may already be saved; a client must not resend those
+        return jsonify(payload), 207 if payload['partial'] else 400
+
+    return jsonify(payload), 200 if payload['failed'] else 201
+
+
+def busy_response(payload, retry_after):
+    response = jsonify(payload)
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+
+def resolve_content_type(content_type, filename):
+    # Guess content type more reliably
+    if not content_type or content_type == 'text/plain':
+        guessed_type, _ = mimetypes.guess_type(filename)
+        content_type = guessed_type or 'application/octet-stream'
+    return content_type
+
+
+def sniff_upload(file_obj, bucket_name):
+    """
+    Check the first bytes of a seekable upload against the content types allowed in its bucket.
+    
+    The position of file_obj is restored.
+    
+    Returns:
+        dict: Result of sniff_content_type()
+    """
+    position = file_obj.tell()
+    head = file_obj.read(SNIFF_SIZE)
+    file_obj.seek(position)
+    return sniff_content_type(head, bucket_name)
+
+
+def streaming_requested():
+    if 'stream' in request.args:
+        return request.args.get('stream', '').lower() in ('', '1', 'true', 'yes')
+    return app.config['STREAMING_UPLOADS']
+
+
+def async_requested():
+    if 'async' in request.args:
+        return request.args.get('async', '').lower() in ('', '1', 'true', 'yes')
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def generate_derivatives(bucket_name, key, contribution_id):
+    result = derivative_pipeline.generate_all(bucket_name, key)
+    if result["urls"] and contribution_id is not None:
+        saved = save_contribution_metadata(contribution_id, {'derivatives': result["urls"]})
+        if not saved["success"]:
+            return dict(result, success=False, error=f'Database error: {saved["error"]}')
+    return result
+
+
+def schedule_derivatives(bucket_name, key, db_result):
+    """
+    Queue the generation of the thumbnail and preview of a new upload.
+
+    Their URLs are saved in the metadata of the contribution when its row is
+    known. When the queue is full, derivatives are generated on the first
+    request to /derivatives instead.
+    """
+    if not DERIVATIVES_EAGER or not derivative_pipeline.available_kinds(bucket_name):
+        return
+    rows = db_result.get("data") or []
+    contribution_id = rows[0].get("id") if rows else None
+    try:
+        derivative_jobs.submit(generate_derivatives, bucket_name, key, contribution_id)
+    except JobQueueFull:
+        app.logger.warning(f"Derivative queue is full, skipping {bucket_name}/{key}")
+
+
+def schedule_indexing(bucket_name, key, url):
+    """
+    Queue the hashing of an upload that was stored without one into the deduplication index.
+    """
+    if not MEDIA_DEDUP:
+        return
+    try:
+        index_jobs.submit(index_stored_object, bucket_name, key, url)
+    except JobQueueFull:
+        app.logger.warning(f"Index queue is full, skipping {bucket_name}/{key}")
+
+
+def store_uploaded_file(file_data, filename, bucket_name, field_name, content_type, user_id=None):
+    """
+    Upload a received file to storage and save its URL to the database, owned by user_id.
+
+    Returns:
+        tuple: (response payload, HTTP status code)
+    """
+    # Use the S3 uploader for fast, efficient uploads
+    # This handles large files with multipart uploads and optimized transfer settings
+    upload_result = upload_file_from_memory(
+        file_data=file_data,
+        filename=filename,
+        bucket_name=bucket_name,
+        content_type=content_type
+    )
+    
+    if not upload_result["success"]:
+        app.logger.error(f"S3 upload failed: {upload_result['error']}")
+        return {'error': f'Upload failed: {upload_result["error"]}'}, 503 if upload_result.get('busy') else 500
+    
+    # Log upload performance metrics
+    app.logger.info(f"Upload completed in {upload_result['upload_time_seconds']:.2f} seconds at {upload_result['upload_speed_mbps']:.2f} MB/s")
+    
+    # Get the public URL from the upload result
+    file_url = upload_result["url"]
+    app.logger.debug("File URL: %s", file_url)
+    
+    # Save URL to database
+    db_result = save_file_url_to_database(file_url, field_name, user_id)
+    
+    if not db_result["success"]:
+        app.logger.error(f"Database insert failed: {db_result['error']}")
+        return {'error': f'Database error: {db_result["error"]}'}, 503 if db_result.get('busy') else 500
+    
+    schedule_derivatives(bucket_name, upload_result["filename"], db_result)
+    
+    # Return success response with URL and upload metrics
+    return upload_response(file_url, upload_result, db_result)
+
+
+def upload_response(file_url, upload_result, db_result):
+    """
+    Build the response to a stored and saved upload.
+
+    Returns:
+        tuple: (response payload, 201, or 202 when the row is only queued by asynchronous insert batching)
+    """
+    payload = {
+        'success': True,
+        'url': file_url,
+        'upload_time_seconds': upload_result['upload_time_seconds'],
+        'upload_speed_mbps': upload_result['upload_speed_mbps'],
+        'transfer_config': upload_result['transfer_config'],
+        'deduplicated': upload_result['deduplicated']
+    }
+    # Accepted but not yet written when inserts are batched asynchronously
+    if db_result.get('queued'):
+        return dict(payload, queued=True), 202
+    return dict(payload, data=db_result["data"]), 201
+
+
+def run_upload_job(file_data, filename, bucket_name, field_name, content_type, user_id):
+    try:
+        with uploads_in_progress.labels(bucket_name).track_inprogress():
+            payload, _ = store_uploaded_file(file_data, filename, bucket_name, field_name, content_type, user_id)
+        return payload
+    finally:
+        file_data.close()
+
+
 def handle_file_upload(bucket_name, field_name):
+    if async_requested():
+        return handle_async_upload(bucket_name, field_name)
+    with uploads_in_progress.labels(bucket_name).track_inprogress():
+        if streaming_requested():
+            return handle_streaming_upload(bucket_name, field_name)
+        return handle_buffered_upload(bucket_name, field_name)
+
+
+def handle_buffered_upload(bucket_name, field_name):
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file part'}), 400
@@ -102,71 +590,970 @@ def handle_file_upload(bucket_name, field_name):
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
 
-        # Guess content type more reliably
-        content_type = file.content_type
-        if not content_type or content_type == 'text/plain':
-            guessed_type, _ = mimetypes.guess_type(file.filename)
-            content_type = guessed_type or 'application/octet-stream'
+        # Reject files whose content does not belong in the bucket before any storage I/O
+        sniffed = sniff_upload(file.stream, bucket_name)
+        if not sniffed["success"]:
+            return jsonify({'error': sniffed['error']}), 415
+        content_type = sniffed["content_type"] or resolve_content_type(file.content_type, file.filename)
         
         # Log file information for debugging
-        app.logger.debug(f"Processing file upload: {file.filename}, Original Content-Type: {file.content_type}, Using Content-Type: {content_type}")
+        app.logger.debug("Processing file upload: %s, Original Content-Type: %s, Using Content-Type: %s",
+                         file.filename, file.content_type, content_type)
         
-        # Use the S3 uploader for fast, efficient uploads
-        # This handles large files with multipart uploads and optimized transfer settings
-        upload_result = upload_file_from_memory(
-            file_data=file,
-            filename=file.filename,
-            bucket_name=bucket_name,
-            content_type=content_type
+        payload, status = store_uploaded_file(
+            file, file.filename, bucket_name, field_name, content_type, current_user_id()
         )
-        
+        if status == 503:
+            return busy_response(payload, UPLOAD_RETRY_AFTER)
+        return jsonify(payload), status
+
+    except Exception as e:
+        app.logger.error(f"Error in handle_file_upload: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+
+def handle_async_upload(bucket_name, field_name):
+    """
+    Accept the file and return 202 right away; the storage transfer and the
+    database insert run as a background job that clients poll at /jobs/<job_id>.
+    """
+    spooled = None
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file part'}), 400
+
+        file = request.files['file']
+
+        if file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+
+        sniffed = sniff_upload(file.stream, bucket_name)
+        if not sniffed["success"]:
+            return jsonify({'error': sniffed['error']}), 415
+        content_type = sniffed["content_type"] or resolve_content_type(file.content_type, file.filename)
+
+        # The request's own upload buffer is closed when the request ends,
+        # so hand the job a copy that it owns; the same goes for the user
+        spooled = tempfile.TemporaryFile()
+        file.save(spooled)
+        spooled.seek(0)
+
+        job_id = upload_jobs.submit(
+            run_upload_job, spooled, file.filename, bucket_name, field_name, content_type, current_user_id()
+        )
+        spooled = None
+
+        response = jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/jobs/{job_id}'
+        })
+        response.headers['Location'] = f'/jobs/{job_id}'
+        return response, 202
+
+    except JobQueueFull as e:
+        return busy_response({'error': str(e)}, UPLOAD_JOB_RETRY_AFTER)
+    except Exception as e:
+        app.logger.error(f"Error in handle_async_upload: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+    finally:
+        if spooled is not None:
+            spooled.close()
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_upload_job(job_id):
+    # ?wait=<seconds> holds the request until the job finishes (long polling)
+    wait = min(request.args.get('wait', 0, type=float), UPLOAD_JOB_MAX_WAIT)
+    job = upload_jobs.get(job_id, wait=max(wait, 0))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+
+def handle_streaming_upload(bucket_name, field_name):
+    """
+    Parse the multipart request body incrementally and forward the 'file' part
+    to storage while it is still being received.
+    """
+    upload = None
+    try:
+        mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+        if mimetype != 'multipart/form-data' or 'boundary' not in options:
+            return jsonify({'error': 'Expected a multipart/form-data request'}), 400
+
+        # request.stream does not enforce MAX_CONTENT_LENGTH, so check the
+        # announced length here and count the bytes of chunked bodies below
+        max_length = app.config['MAX_CONTENT_LENGTH']
+        if request.content_length is not None and request.content_length > max_length:
+            raise RequestEntityTooLarge()
+
+        decoder = MultipartDecoder(options['boundary'].encode('latin-1'))
+        stream = request.stream
+        received = 0
+        in_file_part = False
+        file_part = None
+        head = bytearray()
+        finished = False
+
+        while not finished:
+            chunk = stream.read(STREAM_READ_SIZE)
+            received += len(chunk)
+            if received > max_length:
+                # Leaving through the handler aborts the multipart upload
+                raise RequestEntityTooLarge()
+            decoder.receive_data(chunk or None)
+
+            event = decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, File):
+                    in_file_part = event.name == 'file' and file_part is None
+                    if in_file_part:
+                        if event.filename == '':
+                            return jsonify({'error': 'No selected file'}), 400
+                        file_part = event
+                elif isinstance(event, Data):
+                    if in_file_part and upload is None:
+                        # Hold back the first bytes until the content type is known
+                        head += event.data
+                        if len(head) >= SNIFF_SIZE or not event.more_data:
+                            sniffed = sniff_content_type(head[:SNIFF_SIZE], bucket_name)
+                            if not sniffed["success"]:
+                                return jsonify({'error': sniffed['error']}), 415
+
+                            content_type = sniffed["content_type"] or resolve_content_type(
+                                file_part.headers.get('Content-Type'), file_part.filename
+                            )
+                            app.logger.debug("Streaming file upload: %s, Using Content-Type: %s", file_part.filename, content_type)
+                            # The file is not sized up front; the length of the whole
+                            # body is an upper bound of it, which is enough for tuning
+                            upload = StreamingUpload(
+                                file_part.filename,
+                                bucket_name,
+                                content_type=content_type,
+                                expected_size=request.content_length
+                            )
+                            upload.write(bytes(head))
+                            head = None
+                    elif in_file_part:
+                        upload.write(event.data)
+                    if in_file_part and not event.more_data:
+                        in_file_part = False
+                elif isinstance(event, Epilogue):
+                    finished = True
+                    break
+                else:
+                    # Preamble or a regular form field
+                    in_file_part = False
+                event = decoder.next_event()
+
+            if not chunk:
+                finished = True
+
+        if upload is None:
+            return jsonify({'error': 'No file part'}), 400
+
+        upload_result = upload.complete()
+        upload = None
+
         if not upload_result["success"]:
             app.logger.error(f"S3 upload failed: {upload_result['error']}")
-            return jsonify({'error': f'Upload failed: {upload_result["error"]}'}), 500
-        
-        # Log upload performance metrics
+            payload = {'error': f'Upload failed: {upload_result["error"]}'}
+            if upload_result.get('busy'):
+                return busy_response(payload, UPLOAD_RETRY_AFTER)
+            return jsonify(payload), 500
+
         app.logger.info(f"Upload completed in {upload_result['upload_time_seconds']:.2f} seconds at {upload_result['upload_speed_mbps']:.2f} MB/s")
-        
-        # Get the public URL from the upload result
+
         file_url = upload_result["url"]
-        app.logger.debug(f"File URL: {file_url}")
-        
-        # Save URL to database
-        db_result = save_file_url_to_database(file_url, field_name)
-        
+        db_result = save_file_url_to_database(file_url, field_name, current_user_id())
+
         if not db_result["success"]:
             app.logger.error(f"Database insert failed: {db_result['error']}")
-            return jsonify({'error': f'Database error: {db_result["error"]}'}), 500
-        
-        # Return success response with URL and upload metrics
-        return jsonify({
-            'success': True, 
-            'url': file_url, 
-            'data': db_result["data"],
-            'upload_time_seconds': upload_result['upload_time_seconds'],
-            'upload_speed_mbps': upload_result['upload_speed_mbps']
-        }), 201
+            payload = {'error': f'Database error: {db_result["error"]}'}
+            if db_result.get('busy'):
+                return busy_response(payload, UPLOAD_RETRY_AFTER)
+            return jsonify(payload), 500
 
+        schedule_derivatives(bucket_name, upload_result["filename"], db_result)
+
+        payload, status = upload_response(file_url, upload_result, db_result)
+        return jsonify(payload), status
+
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'File too large'}), 413
+    except SchedulerBusy as e:
+        return busy_response({'error': str(e)}, UPLOAD_RETRY_AFTER)
     except Exception as e:
-        app.logger.error(f"Error in handle_file_upload: {str(e)}")
+        app.logger.error(f"Error in handle_streaming_upload: {str(e)}")
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+    finally:
+        if upload is not None:
+            upload.abort()
 
 
 @app.route('/upload-audio', methods=['POST'])
+@require_auth
 def upload_audio():
     return handle_file_upload('audio', 'audio_url')
 
 
 @app.route('/upload-video', methods=['POST'])
+@require_auth
 def upload_video():
     return handle_file_upload('video', 'video_url')
 
 
 @app.route('/upload-image', methods=['POST'])
+@require_auth
 def upload_image():
     return handle_file_upload('images', 'image_url')
 
 
+@app.route('/derivatives/<bucket_name>/<kind>/<path:key>', methods=['GET'])
+@require_auth
+def get_derivative(bucket_name, kind, key):
+    """
+    Redirect to the thumbnail or preview of a stored object, generating it on first request.
+
+    Concurrent requests for the same derivative share one render, and each
+    client may start at most DERIVATIVE_RATE_LIMIT renders per minute.
+    """
+    client = current_user_id() or request.remote_addr
+    result = derivative_pipeline.get(bucket_name, key, kind, admit=lambda: derivative_limiter.acquire(client))
+    if result["success"]:
+        response = redirect(result["url"])
+        response.headers['Cache-Control'] = f'private, max-age={DERIVATIVE_CACHE_SECONDS}'
+        return response
+    if result.get("rate_limited"):
+        response = jsonify({'error': result["error"]})
+        response.headers['Retry-After'] = str(result["retry_after"])
+        return response, 429
+    if result.get("busy"):
+        return busy_response({'error': result["error"]}, UPLOAD_RETRY_AFTER)
+    if result.get("not_found"):
+        return jsonify({'error': result["error"]}), 404
+    if result.get("unavailable"):
+        return jsonify({'error': result["error"]}), 501
+    return jsonify({'error': result["error"]}), 500
+
+
+# Columns of contributions that /contributions can return, all of them by default
+CONTRIBUTION_COLUMNS = (
+    'id', 'user_id', 'text_data', 'audio_url', 'video_url', 'image_url', 'metadata', 'submitted_at', 'updated_at'
+)
+
+# Rows per page of /contributions, by default and at most
+CONTRIBUTIONS_DEFAULT_LIMIT = 50
+CONTRIBUTIONS_MAX_LIMIT = int(os.getenv("CONTRIBUTIONS_MAX_LIMIT", "200"))
+
+# Pages of /contributions are cached for CONTRIBUTIONS_CACHE_TTL seconds (0 disables),
+# at most CONTRIBUTIONS_CACHE_SIZE of them, least recently used evicted first
+CONTRIBUTIONS_CACHE_TTL = float(os.getenv("CONTRIBUTIONS_CACHE_TTL", "10"))
+CONTRIBUTIONS_CACHE_SIZE = int(os.getenv("CONTRIBUTIONS_CACHE_SIZE", "1000"))
+contributions_cache = TTLCache(max_entries=CONTRIBUTIONS_CACHE_SIZE, ttl=CONTRIBUTIONS_CACHE_TTL)
+
+DB_RETRY_AFTER = 1  # seconds clients should wait when the database is unavailable
+
+
+def encode_cursor(sort, order, row):
+    """
+    Return the opaque cursor of the page that follows row.
+    """
+    position = json.dumps([sort, order, row[sort], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort, order):
+    """
+    Return the (sort value, id) position of a cursor made by encode_cursor().
+
+    Raises:
+        ValueError: If the cursor is malformed or was made for another sort order
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        cursor_sort, cursor_order, sort_value, row_id = position
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError("The cursor belongs to another sort order")
+    return sort_value, row_id
+
+
+def contributions_query(args):
+    """
+    Validate the query parameters of /contributions.
+
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    fields = [field for field in args.get('fields', '').split(',') if field] or list(CONTRIBUTION_COLUMNS)
+    unknown = [field for field in fields if field not in CONTRIBUTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(CONTRIBUTION_COLUMNS)}")
+
+    sort = args.get('sort', 'submitted_at')
+    if sort not in ('submitted_at', 'id'):
+        raise ValueError("sort must be submitted_at or id")
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+
+    try:
+        limit = int(args.get('limit', CONTRIBUTIONS_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= CONTRIBUTIONS_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {CONTRIBUTIONS_MAX_LIMIT}")
+
+    contribution_type = args.get('type')
+    if contribution_type and contribution_type not in CONTRIBUTION_TYPE_COLUMNS:
+        raise ValueError(f"type must be one of: {', '.join(CONTRIBUTION_TYPE_COLUMNS)}")
+
+    user_id = args.get('user_id')
+    if user_id == 'me':
+        if not g.user:
+            raise ValueError("user_id=me needs an authenticated request")
+        user_id = g.user.get('sub')
+
+    cursor = args.get('cursor')
+    return {
+        'fields': fields,
+        'sort': sort,
+        'order': order,
+        'limit': limit,
+        'type': contribution_type,
+        'user_id': user_id,
+        'after': decode_cursor(cursor, sort, order) if cursor else None
+    }
+
+
+def contribution_item(row, fields):
+    """
+    Return the requested fields of a row, with compressed texts restored.
+    """
+    metadata = row.get('metadata') or {}
+    if 'text_data' in fields and metadata.get('text_encoding'):
+        row = dict(row, text_data=decompress_text(row['text_data'], metadata))
+        # The text is returned as it was submitted, so its encoding no longer applies
+        row['metadata'] = {key: value for key, value in metadata.items() if key not in ('text_encoding', 'text_size')}
+    return {field: row.get(field) for field in fields}
+
+
+def contributions_page(query):
+    """
+    Read a page of contributions and serialize it.
+
+    Returns:
+        tuple: (response body, error result); the body is None when the read failed
+    """
+    fields = query['fields']
+    # The cursor needs the sort keys, and compressed texts their metadata
+    columns = list(dict.fromkeys(fields + ['id', query['sort']] + (['metadata'] if 'text_data' in fields else [])))
+    result = fetch_contributions(
+        columns,
+        sort=query['sort'],
+        descending=query['order'] == 'desc',
+        after=query['after'],
+        # One row more than the page tells whether another page follows
+        limit=query['limit'] + 1,
+        contribution_type=query['type'],
+        user_id=query['user_id']
+    )
+    if not result["success"]:
+        return None, result
+
+    rows = result["data"]
+    has_more = len(rows) > query['limit']
+    rows = rows[:query['limit']]
+    body = json.dumps({
+        'success': True,
+        'data': [contribution_item(row, fields) for row in rows],
+        'has_more': has_more,
+        'next_cursor': encode_cursor(query['sort'], query['order'], rows[-1]) if has_more else None
+    }, separators=(',', ':'), default=str)
+    return body.encode(), None
+
+
+# Contributions, newest first by default, with keyset pagination: pass the
+# next_cursor of a page as ?cursor= to get the next one. Pages are served
+# from a short-lived LRU cache and carry an ETag, so unchanged pages are
+# answered with 304 Not Modified when the client sends If-None-Match.
+@app.route('/contributions', methods=['GET'])
+@require_auth
+def list_contributions():
+    try:
+        query = contributions_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    cache_key = json.dumps(query, sort_keys=True, default=str)
+    cached = contributions_cache.get(cache_key)
+    if cached is None:
+        body, error = contributions_page(query)
+        if error:
+            if error.get('busy'):
+                return busy_response({'error': error['error']}, DB_RETRY_AFTER)
+            return jsonify({'error': f'Database error: {error["error"]}'}), 500
+        cached = (hashlib.sha256(body).hexdigest()[:32], body)
+        if CONTRIBUTIONS_CACHE_TTL > 0:
+            contributions_cache.set(cache_key, cached)
+
+    etag, body = cached
+    response = Response(body, content_type='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+# Media types accepted by the resumable upload API, mapped to bucket and contributions field
+UPLOAD_TYPES = {
+    'audio': ('audio', 'audio_url'),
+    'video': ('video', 'video_url'),
+    'image': ('images', 'image_url')
+}
+
+# Most files accepted by one /upload-batch request
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "500"))
+
+
+def parse_upload_manifest(raw):
+    """
+    Parse the optional manifest of a batch upload into a filename -> type mapping.
+
+    The manifest is either an object mapping filenames to types or a list of
+    {"filename": ..., "type": ...} objects.
+    """
+    if not raw:
+        return {}
+    manifest = json.loads(raw)
+    if isinstance(manifest, list):
+        manifest = {entry.get('filename'): entry.get('type') for entry in manifest if isinstance(entry, dict)}
+    if not isinstance(manifest, dict):
+        raise ValueError("Manifest must be an object or a list")
+    return manifest
+
+
+def batch_upload_type(filename, content_type, manifest, default_type):
+    # The manifest wins, then the request-wide type, then the file's media type
+    upload_type = manifest.get(filename) or default_type
+    if not upload_type:
+        major_type = content_type.split('/', 1)[0]
+        upload_type = major_type if major_type in UPLOAD_TYPES else None
+    return upload_type
+
+
+# Upload many files in one multipart request. Files are sent as repeated 'files'
+# parts; their type comes from the optional 'manifest' field, the 'type' field
+# or their content type. All transfers share one transfer manager and all URLs
+# are saved with a single bulk insert.
+@app.route('/upload-batch', methods=['POST'])
+@require_auth
+def upload_batch():
+    try:
+        files = [file for file in request.files.getlist('files') if file.filename]
+        if not files:
+            return jsonify({'error': 'No files provided'}), 400
+        if len(files) > BATCH_UPLOAD_MAX_FILES:
+            return jsonify({'error': f'Too many files. At most {BATCH_UPLOAD_MAX_FILES} per request'}), 400
+
+        try:
+            manifest = parse_upload_manifest(request.form.get('manifest'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid manifest: {str(e)}'}), 400
+
+        default_type = request.form.get('type')
+        results = [None] * len(files)
+        batch = []
+        for index, file in enumerate(files):
+            content_type = resolve_content_type(file.content_type, file.filename)
+            upload_type = batch_upload_type(file.filename, content_type, manifest, default_type)
+            if upload_type not in UPLOAD_TYPES:
+                results[index] = {'success': False, 'error': f"Invalid type. Must be one of: {', '.join(UPLOAD_TYPES)}"}
+                continue
+
+            bucket_name, field_name = UPLOAD_TYPES[upload_type]
+            sniffed = sniff_upload(file.stream, bucket_name)
+            if not sniffed["success"]:
+                results[index] = {'success': False, 'error': sniffed['error']}
+                continue
+            content_type = sniffed["content_type"] or content_type
+
+            batch.append((index, field_name, {
+                'file_data': file.stream,
+                'filename': file.filename,
+                'bucket_name': bucket_name,
+                'content_type': content_type
+            }))
+
+        upload_results = upload_files_batch([item for _, _, item in batch])
+        if upload_results and all(upload_result.get('busy') for upload_result in upload_results):
+            return busy_response({'error': upload_results[0]['error']}, UPLOAD_RETRY_AFTER)
+
+        stored = []
+        for (index, field_name, item), upload_result in zip(batch, upload_results):
+            if not upload_result['success']:
+                app.logger.error(f"S3 upload of {item['filename']} failed: {upload_result['error']}")
+                results[index] = {'success': False, 'error': f'Upload failed: {upload_result["error"]}'}
+                continue
+            results[index] = upload_result
+            stored.append((index, field_name, item['bucket_name']))
+
+        # Save every stored URL with one bulk insert
+        db_result = save_file_urls_to_database(
+            [(results[index]['url'], field_name) for index, field_name, _ in stored], current_user_id()
+        )
+        for position, (index, _, bucket_name) in enumerate(stored):
+            upload_result = results[index]
+            if db_result['success']:
+                schedule_derivatives(bucket_name, upload_result['filename'], {'data': [db_result['data'][position]]})
+                results[index] = {
+                    'success': True,
+                    'url': upload_result['url'],
+                    'data': [db_result['data'][position]],
+                    'size_bytes': upload_result['size_bytes'],
+                    'deduplicated': upload_result['deduplicated']
+                }
+            else:
+                results[index] = {'success': False, 'url': upload_result['url'], 'error': f'Database error: {db_result["error"]}'}
+
+        for file, result in zip(files, results):
+            result['filename'] = file.filename
+
+        uploaded = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': uploaded == len(results),
+            'uploaded': uploaded,
+            'failed': len(results) - uploaded,
+            'results': results
+        }), 201 if uploaded == len(results) else 200
+
+    except Exception as e:
+        app.logger.error(f"Error in upload_batch: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+# How often abandoned resumable uploads are cleaned up
+UPLOAD_CLEANUP_INTERVAL = 10 * 60  # 10 minutes
+_last_upload_cleanup = 0
+
+
+def cleanup_stale_uploads():
+    """
+    Abort resumable uploads that were abandoned by their clients.
+    """
+    global _last_upload_cleanup
+    now = time.time()
+    if now - _last_upload_cleanup < UPLOAD_CLEANUP_INTERVAL:
+        return
+    _last_upload_cleanup = now
+
+    for stale in upload_sessions.stale():
+        if stale['status'] == 'in_progress' or (stale['status'] == 'completing' and not stale['url']):
+            if stale['storage_upload_id']:
+                abort_multipart_upload(stale['bucket'], stale['object_key'], stale['storage_upload_id'])
+            else:
+                # Presigned single PUT that was never confirmed
+                delete_object(stale['bucket'], stale['object_key'])
+        upload_sessions.delete(stale['upload_id'])
+        app.logger.info(f"Expired resumable upload {stale['upload_id']}")
+
+
+def upload_session_status(upload_session):
+    parts = upload_sessions.list_parts(upload_session['upload_id'])
+    return {
+        'upload_id': upload_session['upload_id'],
+        'status': upload_session['status'],
+        'filename': upload_session['filename'],
+        'part_size': upload_session['part_size'],
+        'total_size': upload_session['total_size'],
+        'received_bytes': sum(part['size'] for part in parts),
+        'parts': [{'part_number': part['part_number'], 'size': part['size']} for part in parts],
+        'url': upload_session['url']
+    }
+
+
+@app.route('/uploads', methods=['POST'])
+@require_auth
+def init_resumable_upload():
+    try:
+        cleanup_stale_uploads()
+
+        data = request.json or {}
+        upload_type = data.get('type')
+        filename = data.get('filename')
+        total_size = data.get('size')
+
+        if upload_type not in UPLOAD_TYPES:
+            return jsonify({'error': f"Invalid type. Must be one of: {', '.join(UPLOAD_TYPES)}"}), 400
+        if not filename:
+            return jsonify({'error': 'No filename provided'}), 400
+        if total_size is not None and (not isinstance(total_size, int) or total_size < 0):
+            return jsonify({'error': 'Size must be a non-negative integer'}), 400
+        if total_size and total_size > app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({'error': 'File too large'}), 413
+
+        bucket_name, field_name = UPLOAD_TYPES[upload_type]
+        content_type = resolve_content_type(data.get('content_type'), filename)
+        part_size = transfer_tuner.choose(total_size)['part_size_bytes']
+
+        result = create_multipart_upload(filename, bucket_name, content_type=content_type)
+        if not result["success"]:
+            app.logger.error(f"Failed to start multipart upload: {result['error']}")
+            return jsonify({'error': f'Upload failed: {result["error"]}'}), 500
+
+        upload_session = upload_sessions.create(
+            storage_upload_id=result['upload_id'],
+            bucket=bucket_name,
+            object_key=result['key'],
+            field_name=field_name,
+            filename=filename,
+            content_type=content_type,
+            part_size=part_size,
+            total_size=total_size
+        )
+
+        return jsonify({'success': True, **upload_session_status(upload_session)}), 201
+
+    except Exception as e:
+        app.logger.error(f"Error in init_resumable_upload: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+
+@app.route('/uploads/presign', methods=['POST'])
+@require_auth
+def presign_upload():
+    """
+    Issue presigned URLs so the client uploads straight to storage.
+
+    Files up to one part get a single PUT URL, larger files a multipart upload
+    with one URL per part. Once done, the client calls
+    POST /uploads/<upload_id>/complete, which verifies the object and saves it.
+    """
+    try:
+        cleanup_stale_uploads()
+
+        data = request.json or {}
+        upload_type = data.get('type')
+        filename = data.get('filename')
+        total_size = data.get('size')
+
+        if upload_type not in UPLOAD_TYPES:
+            return jsonify({'error': f"Invalid type. Must be one of: {', '.join(UPLOAD_TYPES)}"}), 400
+        if not filename:
+            return jsonify({'error': 'No filename provided'}), 400
+        if not isinstance(total_size, int) or total_size <= 0:
+            return jsonify({'error': 'Size must be a positive integer'}), 400
+        if total_size > app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({'error': 'File too large'}), 413
+
+        bucket_name, field_name = UPLOAD_TYPES[upload_type]
+        content_type = resolve_content_type(data.get('content_type'), filename)
+        part_size = transfer_tuner.choose(total_size)['part_size_bytes']
+
+        if total_size <= part_size:
+            key = generate_object_key(filename)
+            presigned = generate_presigned_upload_url(bucket_name, key, content_type=content_type)
+            if not presigned["success"]:
+                return jsonify({'error': f'Presigning failed: {presigned["error"]}'}), 500
+
+            upload_session = upload_sessions.create(
+                storage_upload_id='',
+                bucket=bucket_name,
+                object_key=key,
+                field_name=field_name,
+                filename=filename,
+                content_type=content_type,
+                part_size=part_size,
+                total_size=total_size
+            )
+            return jsonify({
+                'success': True,
+                'upload_id': upload_session['upload_id'],
+                'mode': 'put',
+                'url': presigned['url'],
+                'headers': presigned['headers'],
+                'expires_in': PRESIGNED_URL_EXPIRY
+            }), 201
+
+        result = create_multipart_upload(filename, bucket_name, content_type=content_type)
+        if not result["success"]:
+            app.logger.error(f"Failed to start multipart upload: {result['error']}")
+            return jsonify({'error': f'Upload failed: {result["error"]}'}), 500
+
+        part_count = -(-total_size // part_size)
+        presigned = generate_presigned_part_urls(
+            bucket_name, result['key'], result['upload_id'], range(1, part_count + 1)
+        )
+        if not presigned["success"]:
+            abort_multipart_upload(bucket_name, result['key'], result['upload_id'])
+            return jsonify({'error': f'Presigning failed: {presigned["error"]}'}), 500
+
+        upload_session = upload_sessions.create(
+            storage_upload_id=result['upload_id'],
+            bucket=bucket_name,
+            object_key=result['key'],
+            field_name=field_name,
+            filename=filename,
+            content_type=content_type,
+            part_size=part_size,
+            total_size=total_size
+        )
+        return jsonify({
+            'success': True,
+            'upload_id': upload_session['upload_id'],
+            'mode': 'multipart',
+            'part_size': part_size,
+            'parts': presigned['parts'],
+            'expires_in': PRESIGNED_URL_EXPIRY
+        }), 201
+
+    except Exception as e:
+        app.logger.error(f"Error in presign_upload: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@require_auth
+def get_resumable_upload(upload_id):
+    upload_session = upload_sessions.get(upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'success': True, **upload_session_status(upload_session)}), 200
+
+
+@app.route('/uploads/<upload_id>/parts/<int:part_number>', methods=['PUT'])
+@require_auth
+def upload_resumable_part(upload_id, part_number):
+    try:
+        upload_session = upload_sessions.get(upload_id)
+        if not upload_session:
+            return jsonify({'error': 'Upload not found'}), 404
+        if upload_session['status'] != 'in_progress':
+            return jsonify({'error': f"Upload is {upload_session['status']}"}), 409
+        if not upload_session['storage_upload_id']:
+            return jsonify({'error': 'Upload does not accept parts'}), 409
+        if not 1 <= part_number <= S3_MAX_PARTS:
+            return jsonify({'error': f'Part number must be between 1 and {S3_MAX_PARTS}'}), 400
+
+        body = request.get_data(cache=False)
+        if not body:
+            return jsonify({'error': 'Empty part'}), 400
+        part_size = upload_session['part_size']
+        if len(body) > part_size:
+            return jsonify({'error': f"Part exceeds the part size of {part_size} bytes"}), 413
+        # Every part but the last must be exactly part_size bytes, or storage rejects the assembly
+        size_error = check_part_size(upload_session, part_number, len(body))
+        if size_error:
+            return jsonify({'error': size_error}), 400
+        if part_number == 1:
+            # The first part starts the file; check it before it reaches storage
+            sniffed = sniff_content_type(body[:SNIFF_SIZE], upload_session['bucket'])
+            if not sniffed["success"]:
+                return jsonify({'error': sniffed['error']}), 415
+
+        result = upload_part(
+            upload_session['bucket'],
+            upload_session['object_key'],
+            upload_session['storage_upload_id'],
+            part_number,
+            body
+        )
+        if not result["success"]:
+            app.logger.error(f"Part upload failed: {result['error']}")
+            if result.get('busy'):
+                return busy_response({'error': result['error']}, UPLOAD_RETRY_AFTER)
+            return jsonify({'error': f'Upload failed: {result["error"]}'}), 502
+
+        upload_sessions.record_part(upload_id, part_number, result['etag'], len(body))
+
+        return jsonify({'success': True, 'part_number': part_number, 'size': len(body)}), 200
+
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Part too large'}), 413
+    except Exception as e:
+        app.logger.error(f"Error in upload_resumable_part: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+
+def check_part_size(upload_session, part_number, size):
+    """
+    Check the size of a part against the parts that come before and after it.
+
+    Returns:
+        str: What is wrong with the part, or None if its size fits
+    """
+    part_size = upload_session['part_size']
+    total_size = upload_session['total_size']
+    if total_size:
+        part_count = math.ceil(total_size / part_size)
+        if part_number > part_count:
+            return f"The upload has {part_count} parts of {part_size} bytes"
+        expected = part_size if part_number < part_count else total_size - (part_count - 1) * part_size
+        if size != expected:
+            return f"Part {part_number} must be {expected} bytes"
+        return None
+
+    # Without a total size, a short part marks the last part
+    for part in upload_sessions.list_parts(upload_session['upload_id']):
+        if part['part_number'] > part_number and size < part_size:
+            return f"Only the last part may be smaller than {part_size} bytes"
+        if part['part_number'] < part_number and part['size'] < part_size:
+            return f"Part {part['part_number']} was the last part"
+    return None
+
+
+def assemble_uploaded_object(upload_session):
+    """
+    Finish the storage side of an in-progress upload session.
+
+    Multipart uploads are completed from the parts recorded by the part
+    endpoint, or, for presigned uploads whose parts went straight to storage,
+    from the parts storage reports. Presigned single PUT uploads are verified
+    with a HEAD request.
+
+    Returns:
+        tuple: (file URL, None) on success or (None, error response)
+    """
+    bucket_name = upload_session['bucket']
+    key = upload_session['object_key']
+    storage_upload_id = upload_session['storage_upload_id']
+    total_size = upload_session['total_size']
+
+    if storage_upload_id:
+        parts = [
+            (part['part_number'], part['etag'], part['size'])
+            for part in upload_sessions.list_parts(upload_session['upload_id'])
+        ]
+        if not parts:
+            listed = list_uploaded_parts(bucket_name, key, storage_upload_id)
+            if not listed["success"]:
+                return None, (jsonify({'error': f'Upload failed: {listed["error"]}'}), 502)
+            parts = listed['parts']
+        if not parts:
+            return None, (jsonify({'error': 'No parts uploaded'}), 409)
+
+        received = {part_number for part_number, _, _ in parts}
+        missing = [n for n in range(1, max(received) + 1) if n not in received]
+        if missing:
+            return None, (jsonify({'error': 'Missing parts', 'missing_parts': missing}), 409)
+
+        received_bytes = sum(size for _, _, size in parts)
+        if total_size is not None and received_bytes != total_size:
+            return None, (jsonify({'error': f"Received {received_bytes} of {total_size} bytes"}), 409)
+        # Parts sent straight to storage were not checked when they arrived
+        short = [part_number for part_number, _, size in parts[:-1] if size != upload_session['part_size']]
+        if short:
+            return None, (jsonify({'error': f"Parts must be {upload_session['part_size']} bytes except the last",
+                                   'invalid_parts': short}), 409)
+
+        upload_result = complete_multipart_upload(
+            bucket_name,
+            key,
+            storage_upload_id,
+            [(part_number, etag) for part_number, etag, _ in parts]
+        )
+        if not upload_result["success"]:
+            app.logger.error(f"Completing multipart upload failed: {upload_result['error']}")
+            return None, (jsonify({'error': f'Upload failed: {upload_result["error"]}'}), 500)
+        return upload_result["url"], None
+
+    # Presigned single PUT: check that the client actually stored the object
+    info = get_object_info(bucket_name, key)
+    if not info["success"]:
+        return None, (jsonify({'error': f'Upload verification failed: {info["error"]}'}), 502)
+    if not info["exists"]:
+        return None, (jsonify({'error': 'File has not been uploaded'}), 409)
+    if total_size is not None and info["size_bytes"] != total_size:
+        delete_object(bucket_name, key)
+        return None, (jsonify({'error': f"Uploaded {info['size_bytes']} bytes, expected {total_size}"}), 409)
+    return PUBLIC_URL_FORMAT.format(bucket=bucket_name, filename=key), None
+
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@require_auth
+def complete_resumable_upload(upload_id):
+    release_status = None
+    try:
+        # Only one request assembles the object and saves the row; concurrent ones
+        # are asked to come back for the result
+        upload_session, claimed = upload_sessions.begin_completion(upload_id)
+        if not upload_session:
+            return jsonify({'error': 'Upload not found'}), 404
+        if not claimed:
+            if upload_session['status'] == 'completed':
+                return jsonify({'success': True, 'url': upload_session['url']}), 200
+            return busy_response({'error': 'Upload is being completed'}, COMPLETION_RETRY_AFTER)
+
+        if upload_session['url'] is None:
+            release_status = 'in_progress'
+            file_url, error_response = assemble_uploaded_object(upload_session)
+            if error_response:
+                return error_response
+            upload_sessions.mark_stored(upload_id, file_url)
+        else:
+            # The object was stored but saving it to the database failed earlier
+            file_url = upload_session['url']
+        release_status = 'stored'
+
+        db_result = save_file_url_to_database(file_url, upload_session['field_name'], current_user_id())
+
+        if not db_result["success"]:
+            app.logger.error(f"Database insert failed: {db_result['error']}")
+            payload = {'error': f'Database error: {db_result["error"]}'}
+            if db_result.get('busy'):
+                return busy_response(payload, UPLOAD_RETRY_AFTER)
+            return jsonify(payload), 500
+
+        upload_sessions.mark_completed(upload_id)
+        release_status = None
+        schedule_derivatives(upload_session['bucket'], upload_session['object_key'], db_result)
+        schedule_indexing(upload_session['bucket'], upload_session['object_key'], file_url)
+
+        if db_result.get('queued'):
+            return jsonify({'success': True, 'url': file_url, 'queued': True}), 202
+        return jsonify({
+            'success': True,
+            'url': file_url,
+            'data': db_result["data"]
+        }), 201
+
+    except Exception as e:
+        app.logger.error(f"Error in complete_resumable_upload: {str(e)}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+    finally:
+        if release_status:
+            # Not completed; leave the upload where it was so completing it can be retried
+            upload_sessions.end_completion(upload_id, release_status)
+
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@require_auth
+def abort_resumable_upload(upload_id):
+    upload_session = upload_sessions.get(upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload not found'}), 404
+    if upload_session['status'] == 'completing':
+        return jsonify({'error': 'Upload is being completed'}), 409
+
+    if upload_session['status'] == 'in_progress':
+        if upload_session['storage_upload_id']:
+            result = abort_multipart_upload(
+                upload_session['bucket'],
+                upload_session['object_key'],
+                upload_session['storage_upload_id']
+            )
+        else:
+            result = delete_object(upload_session['bucket'], upload_session['object_key'])
+        if not result["success"]:
+            return jsonify({'error': f'Abort failed: {result["error"]}'}), 500
+
+    upload_sessions.delete(upload_id)
+    return jsonify({'success': True, 'message': 'Upload aborted'}), 200
+
+
 @app.route('/auth/register', methods=['POST'])
 def register():
     try:
@@ -180,50 +1567,34 @@ def register():
         # Log registration attempt
         app.logger.info(f"Registration attempt for email: {email}")
         
-        # Register user with Supabase Auth with retry logic
-        max_retries = 3
-        retry_count = 0
-        retry_delay = 2  # seconds
-        
-        while retry_count < max_retries:
-            try:
-                # Attempt to register the user
-                user = supabase.auth.sign_up({
-                    "email": email,
-                    "password": password,
-                })
-                
-                app.logger.info(f"Registration successful for email: {email}")
-                return jsonify({
-                    'success': True,
-                    'user': user.dict(),
-                    'message': 'Registration successful. Please check your email for verification.'
-                }), 201
-                
-            except Exception as e:
-                error_str = str(e)
-                
-                # Check if user already exists
-                if 'User already registered' in error_str:
-                    app.logger.info(f"User already exists: {email}")
-                    return jsonify({'error': 'User with this email already exists'}), 409
-                
-                # Check for timeout errors
-                if 'timeout' in error_str.lower() or 'timed out' in error_str.lower() or 'after 29 seconds' in error_str.lower():
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        app.logger.warning(f"Timeout during registration. Retrying ({retry_count}/{max_retries})...")
-                        time.sleep(retry_delay)
-                        # Increase delay for next retry
-                        retry_delay *= 2
-                        continue
-                    else:
-                        app.logger.error(f"Registration failed after {max_retries} retries: {error_str}")
-                        return jsonify({'error': 'Registration service temporarily unavailable. Please try again later.'}), 503
-                else:
-                    # For other errors, don't retry
-                    raise e
-                
+        # Register user with Supabase Auth. Sign-ups are only retried when the request never
+        # reached Auth; a slow or failing Auth service is reported instead of waited for.
+        try:
+            user = supabase_auth.call(supabase.auth.sign_up, {
+                "email": email,
+                "password": password,
+            }, idempotent=False)
+        except DependencyUnavailable as e:
+            app.logger.warning(f"Registration rejected: {str(e)}")
+            return busy_response({'error': 'Registration service temporarily unavailable. Please try again later.'}, e.retry_after)
+        except OutcomeUnknown as e:
+            # The sign-up may still go through, so the client is not asked to retry it
+            app.logger.warning(f"Registration outcome unknown: {str(e)}")
+            return jsonify({'error': 'Registration did not finish in time. Check your email before registering again.'}), 504
+        except Exception as e:
+            # Check if user already exists
+            if 'User already registered' in str(e):
+                app.logger.info(f"User already exists: {email}")
+                return jsonify({'error': 'User with this email already exists'}), 409
+            raise
+
+        app.logger.info(f"Registration successful for email: {email}")
+        return jsonify({
+            'success': True,
+            'user': user.dict(),
+            'message': 'Registration successful. Please check your email for verification.'
+        }), 201
+
     except Exception as e:
         app.logger.error(f"Registration error: {str(e)}")
         return jsonify({'error': 'An error occurred during registration. Please try again later.'}), 500
@@ -241,18 +1612,22 @@ def login():
             
         # Sign in with Supabase Auth
         try:
-            response = supabase.auth.sign_in_with_password({
+            response = supabase_auth.call(supabase.auth.sign_in_with_password, {
                 "email": email,
                 "password": password
             })
             
             # Store session data
-            session['user'] = {
+            session_user = {
                 'id': response.user.id,
-                'email': response.user.email,
-                'access_token': response.session.access_token,
-                'refresh_token': response.session.refresh_token
+                'email': response.user.email
             }
+            # The cookie backend sends the session to the browser readable, so tokens
+            # are only kept in sessions stored on the server
+            if stores_on_server():
+                session_user['access_token'] = response.session.access_token
+                session_user['refresh_token'] = response.session.refresh_token
+            session['user'] = session_user
             
             return jsonify({
                 'success': True,
@@ -261,6 +1636,9 @@ def login():
                 'message': 'Login successful'
             }), 200
             
+        except DependencyUnavailable as e:
+            app.logger.warning(f"Login rejected: {str(e)}")
+            return busy_response({'error': 'Authentication service temporarily unavailable. Please try again later.'}, e.retry_after)
         except Exception as e:
             if 'Invalid login credentials' in str(e):
                 return jsonify({'error': 'Invalid email or password'}), 401
@@ -281,6 +1659,7 @@ def logout():
             token = auth_token.split(' ')[1]
             # Sign out from Supabase
             supabase.auth.sign_out(token)
+            token_verifier.revoke(token)
         
         # Clear session
         session.pop('user', None)
@@ -305,13 +1684,19 @@ def get_user():
             
         token = auth_token.split(' ')[1]
         
-        # Get user from Supabase
+        # Verify the token locally first, so invalid and revoked tokens never reach
+        # Supabase; the full user is then fetched from Supabase once per token
         try:
-            user = supabase.auth.get_user(token)
+            token_verifier.verify(token)
+            user = user_profiles.get(hashlib.sha256(token.encode()).digest())
+            if user is None:
+                user = fetch_user_profile(token)
             return jsonify({
                 'success': True,
-                'user': user.dict()
+                'user': user
             }), 200
+        except DependencyUnavailable as e:
+            return busy_response({'error': 'Authentication service temporarily unavailable'}, e.retry_after)
         except Exception as e:
             return jsonify({'error': 'Invalid or expired token'}), 401
             
@@ -321,5 +1706,8 @@ def get_user():
 
 
 if __name__ == '__main__':
+    # Spawned worker processes re-run the main script, and with it all of the
+    # setup above, so the development server renders derivatives in threads
+    derivative_pipeline.use_processes = False
     print("Starting Flask server...")
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True, use_reloader=False)
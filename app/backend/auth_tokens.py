@@ -0,0 +1,175 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+from ttl_cache import TTLCache
+from resilience import DependencyUnavailable
+
+try:
+    # Optional: only needed to verify asymmetrically signed tokens against the project's JWKS
+    import jwt
+except ImportError:
+    jwt = None
+
+# Legacy HS256 secret of the Supabase project (Settings > API > JWT Secret)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+# Signing keys of projects using asymmetric JWTs; requires PyJWT
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL",
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+
+# Claims every accepted token must carry
+JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "authenticated")
+JWT_ISSUER = os.getenv("JWT_ISSUER")
+JWT_LEEWAY = 30  # seconds of clock skew tolerated on exp and nbf
+
+# Verified tokens are cached by their hash until they expire, at most this long
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))
+JWKS_CACHE_TTL = 3600  # seconds signing keys are reused before the JWKS is fetched again
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+
+
+class InvalidToken(Exception):
+    """Raised when a token is malformed, expired or not signed by a trusted key."""
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+class TokenVerifier:
+    """
+    Verify Supabase access tokens without a round trip to Supabase Auth.
+
+    HS256 tokens are checked with the project's JWT secret, asymmetrically
+    signed tokens with the project's JWKS (when PyJWT is installed). Tokens
+    that cannot be checked locally are passed to the fallback, typically a
+    call to Supabase Auth. Expiry, not-before, audience and issuer are
+    checked in every case.
+
+    Verified claims are cached by the SHA-256 of the token until the token
+    expires, so repeated requests with the same token cost a dictionary lookup.
+    """
+
+    def __init__(self, secret=SUPABASE_JWT_SECRET, jwks_url=SUPABASE_JWKS_URL, audience=JWT_AUDIENCE,
+                 issuer=JWT_ISSUER, leeway=JWT_LEEWAY, fallback=None, cache_size=TOKEN_CACHE_SIZE,
+                 cache_ttl=TOKEN_CACHE_TTL):
+        """
+        Args:
+            secret (str, optional): HS256 secret
+            jwks_url (str, optional): URL of the JSON Web Key Set
+            audience (str, optional): Required aud claim
+            issuer (str, optional): Required iss claim
+            leeway (float): Seconds of clock skew tolerated
+            fallback (callable, optional): Called with a token that cannot be verified locally; raises if it is invalid
+            cache_size (int): Maximum number of cached tokens
+            cache_ttl (float): Longest time a verified token is cached
+        """
+        self.secret = secret.encode() if secret else None
+        self.audience = audience
+        self.issuer = issuer
+        self.leeway = leeway
+        self.fallback = fallback
+        self._cache = TTLCache(max_entries=cache_size, ttl=cache_ttl)
+        self._revoked = TTLCache(max_entries=cache_size, ttl=24 * 60 * 60)
+        self._jwks_client = None
+        if jwks_url and jwt is not None:
+            self._jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=JWKS_CACHE_TTL)
+
+    def verify(self, token):
+        """
+        Verify a token and return its claims.
+
+        Raises:
+            InvalidToken: If the token is not valid
+            DependencyUnavailable: If the token needs the fallback and it could not be called
+        """
+        cache_key = hashlib.sha256(token.encode()).digest()
+        claims = self._cache.get(cache_key)
+        if claims is not None:
+            return claims
+        if self._revoked.get(cache_key):
+            raise InvalidToken("Token was revoked")
+
+        claims = self._verify_uncached(token)
+        remaining = claims['exp'] + self.leeway - time.time()
+        self._cache.set(cache_key, claims, ttl=min(self._cache.ttl, remaining))
+        return claims
+
+    def revoke(self, token):
+        """
+        Stop accepting a token, e.g. after logout, until it expires.
+        """
+        cache_key = hashlib.sha256(token.encode()).digest()
+        self._cache.delete(cache_key)
+        try:
+            expires_at = json.loads(_b64decode(token.split('.')[1]))['exp']
+            ttl = expires_at + self.leeway - time.time()
+        except (ValueError, IndexError, KeyError, TypeError):
+            ttl = None
+        if ttl is None or ttl > 0:
+            self._revoked.set(cache_key, True, ttl=ttl)
+
+    def _verify_uncached(self, token):
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            header = json.loads(_b64decode(header_segment))
+            claims = json.loads(_b64decode(payload_segment))
+            signature = _b64decode(signature_segment)
+        except ValueError:
+            raise InvalidToken("Malformed token")
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise InvalidToken("Malformed token")
+
+        algorithm = header.get('alg')
+        if algorithm == 'HS256' and self.secret:
+            signing_input = f"{header_segment}.{payload_segment}".encode()
+            expected = hmac.new(self.secret, signing_input, hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, signature):
+                raise InvalidToken("Invalid signature")
+        elif algorithm in ASYMMETRIC_ALGORITHMS and self._jwks_client is not None:
+            try:
+                signing_key = self._jwks_client.get_signing_key_from_jwt(token)
+                # Claims are checked below, the same way for every algorithm
+                jwt.decode(token, signing_key.key, algorithms=[algorithm], options={
+                    'verify_exp': False, 'verify_nbf': False, 'verify_aud': False, 'verify_iss': False
+                })
+            except jwt.PyJWTError as e:
+                raise InvalidToken(f"Invalid signature: {str(e)}")
+        elif self.fallback is not None:
+            try:
+                self.fallback(token)
+            except DependencyUnavailable:
+                # Supabase Auth could not be asked; that says nothing about the token
+                raise
+            except Exception as e:
+                raise InvalidToken(f"Token rejected: {str(e)}")
+        else:
+            raise InvalidToken(f"Cannot verify {algorithm} tokens")
+
+        self._check_claims(claims)
+        return claims
+
+    def _check_claims(self, claims):
+        now = time.time()
+        if not isinstance(claims.get('exp'), (int, float)):
+            raise InvalidToken("Token has no expiry")
+        if claims['exp'] + self.leeway < now:
+            raise InvalidToken("Token expired")
+        if isinstance(claims.get('nbf'), (int, float)) and claims['nbf'] - self.leeway > now:
+            raise InvalidToken("Token not yet valid")
+
+        if self.audience:
+            audience = claims.get('aud')
+            audiences = [audience] if isinstance(audience, str) else audience or []
+            if self.audience not in audiences:
+                raise InvalidToken("Invalid audience")
+        if self.issuer and claims.get('iss') != self.issuer:
+            raise InvalidToken("Invalid issuer")
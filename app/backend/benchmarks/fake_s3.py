@@ -0,0 +1,337 @@
+"""
+Minimal S3-compatible server for benchmarks and load tests.
+
+Implements the requests the backend makes: head_bucket, list_objects_v2,
+put_object, head_object, get_object, delete_object and the multipart upload
+calls. Authentication is not checked. Object bodies are discarded unless
+--keep-data is given, so large uploads do not fill memory; only sizes,
+content types and metadata are kept.
+
+Every request can be delayed by a fixed latency, and request bodies are read
+no faster than a bandwidth limit shared by all connections, to approximate a
+remote storage provider.
+
+Run from app/backend and point the backend at it:
+
+    python benchmarks/fake_s3.py --port 9000 --latency 0.02 --bandwidth 50
+    S3_ENDPOINT=http://127.0.0.1:9000 python app.py
+"""
+import re
+import sys
+import time
+import uuid
+import argparse
+import threading
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class Throttle:
+    """
+    Limit the combined rate of all callers to bytes_per_second.
+
+    Callers reserve consecutive time slots, so concurrent connections share
+    the bandwidth instead of each getting the full rate.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + size / self.bytes_per_second
+            delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StoredObject:
+    def __init__(self, size, headers, data=None):
+        self.size = size
+        self.data = data
+        self.etag = f'"{uuid.uuid4().hex}"'
+        self.last_modified = formatdate(usegmt=True)
+        self.headers = {
+            name: value for name, value in headers.items()
+            if name.lower().startswith('x-amz-meta-') or name.lower() == 'content-type'
+        }
+
+
+class FakeS3Server(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the buckets and multipart uploads in memory.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, bandwidth=None, keep_data=False):
+        """
+        Args:
+            address (tuple): Host and port to listen on; port 0 picks a free port
+            latency (float): Seconds every request is delayed
+            bandwidth (float, optional): Bytes per second of request bodies across all connections
+            keep_data (bool): Keep object bodies so they can be read back
+        """
+        super().__init__(address, FakeS3Handler)
+        self.latency = latency
+        self.throttle = Throttle(bandwidth) if bandwidth else None
+        self.keep_data = keep_data
+        self.objects = {}  # (bucket, key) -> StoredObject
+        self.uploads = {}  # upload id -> {'bucket', 'key', 'headers', 'parts': {number: StoredObject}}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # Request helpers
+
+    def _parse(self):
+        url = urlparse(self.path)
+        bucket, _, key = url.path.lstrip('/').partition('/')
+        return bucket, unquote(key), parse_qs(url.query, keep_blank_values=True)
+
+    def _read_chunks(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    # Trailers end with an empty line
+                    while self.rfile.readline().strip():
+                        pass
+                    return
+                yield from self._read_exactly(size)
+                self.rfile.readline()
+        else:
+            yield from self._read_exactly(int(self.headers.get('Content-Length') or 0))
+
+    def _read_exactly(self, size):
+        throttle = self.server.throttle
+        while size > 0:
+            chunk = self.rfile.read(min(size, READ_CHUNK_SIZE))
+            if not chunk:
+                raise ConnectionError("Client closed the connection")
+            size -= len(chunk)
+            if throttle:
+                throttle.consume(len(chunk))
+            yield chunk
+
+    def _read_body(self, keep):
+        """
+        Read the request body; return its size and, if keep is set, its bytes.
+        """
+        size = 0
+        data = bytearray() if keep else None
+        for chunk in self._read_chunks():
+            size += len(chunk)
+            if keep:
+                data += chunk
+        with self.server.lock:
+            self.server.bytes_received += size
+        return size, bytes(data) if keep else None
+
+    def _send(self, status, body=b'', headers=None):
+        headers = headers or {}
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if 'Content-Length' not in headers:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _error(self, status, code, message=''):
+        self._send(status, f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code>'
+                           f'<Message>{escape(message)}</Message></Error>')
+
+    def _begin(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    # S3 operations
+
+    def do_HEAD(self):
+        self._begin()
+        bucket, key, _ = self._parse()
+        if not key:
+            return self._send(200)
+        stored = self.server.objects.get((bucket, key))
+        if stored is None:
+            return self._send(404)
+        self._send(200, headers=dict(stored.headers, **{
+            'Content-Length': str(stored.size), 'ETag': stored.etag, 'Last-Modified': stored.last_modified
+        }))
+
+    def do_GET(self):
+        self._begin()
+        bucket, key, query = self._parse()
+        if 'uploadId' in query:
+            return self._list_parts(bucket, key, query['uploadId'][0])
+        if not key:
+            return self._list_objects(bucket, query)
+
+        stored = self.server.objects.get((bucket, key))
+        if stored is None:
+            return self._error(404, 'NoSuchKey', key)
+        data = stored.data if stored.data is not None else bytes(stored.size)
+        byte_range = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if byte_range:
+            start = int(byte_range.group(1))
+            end = int(byte_range.group(2)) if byte_range.group(2) else stored.size - 1
+            return self._send(206, data[start:end + 1], dict(stored.headers, **{
+                'Content-Range': f'bytes {start}-{end}/{stored.size}', 'ETag': stored.etag
+            }))
+        self._send(200, data, dict(stored.headers, ETag=stored.etag))
+
+    def do_PUT(self):
+        self._begin()
+        bucket, key, query = self._parse()
+        size, data = self._read_body(self.server.keep_data)
+        stored = StoredObject(size, self.headers, data)
+
+        if 'uploadId' in query:
+            with self.server.lock:
+                upload = self.server.uploads.get(query['uploadId'][0])
+                if upload is None:
+                    return self._error(404, 'NoSuchUpload')
+                upload['parts'][int(query['partNumber'][0])] = stored
+        else:
+            with self.server.lock:
+                self.server.objects[(bucket, key)] = stored
+        self._send(200, headers={'ETag': stored.etag})
+
+    def do_POST(self):
+        self._begin()
+        bucket, key, query = self._parse()
+        _, body = self._read_body(keep=True)
+
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.uploads[upload_id] = {
+                    'bucket': bucket, 'key': key, 'headers': dict(self.headers), 'parts': {}
+                }
+            return self._send(200, f'<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+                                   f'<Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>'
+                                   f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+
+        if 'uploadId' in query:
+            with self.server.lock:
+                upload = self.server.uploads.pop(query['uploadId'][0], None)
+            if upload is None:
+                return self._error(404, 'NoSuchUpload')
+            numbers = [int(number) for number in re.findall(rb'<PartNumber>(\d+)</PartNumber>', body)]
+            if any(number not in upload['parts'] for number in numbers):
+                return self._error(400, 'InvalidPart')
+            parts = [upload['parts'][number] for number in numbers]
+            data = b''.join(part.data for part in parts) if self.server.keep_data else None
+            stored = StoredObject(sum(part.size for part in parts), upload['headers'], data)
+            with self.server.lock:
+                self.server.objects[(bucket, key)] = stored
+            return self._send(200, f'<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+                                   f'<Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>'
+                                   f'<ETag>{stored.etag}</ETag></CompleteMultipartUploadResult>')
+
+        self._error(400, 'InvalidRequest')
+
+    def do_DELETE(self):
+        self._begin()
+        bucket, key, query = self._parse()
+        with self.server.lock:
+            if 'uploadId' in query:
+                self.server.uploads.pop(query['uploadId'][0], None)
+            else:
+                self.server.objects.pop((bucket, key), None)
+        self._send(204)
+
+    def _list_parts(self, bucket, key, upload_id):
+        upload = self.server.uploads.get(upload_id)
+        if upload is None:
+            return self._error(404, 'NoSuchUpload')
+        parts = ''.join(
+            f'<Part><PartNumber>{number}</PartNumber><ETag>{part.etag}</ETag><Size>{part.size}</Size></Part>'
+            for number, part in sorted(upload['parts'].items())
+        )
+        self._send(200, f'<?xml version="1.0" encoding="UTF-8"?><ListPartsResult><Bucket>{bucket}</Bucket>'
+                        f'<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>'
+                        f'<IsTruncated>false</IsTruncated>{parts}</ListPartsResult>')
+
+    def _list_objects(self, bucket, query):
+        prefix = query.get('prefix', [''])[0]
+        with self.server.lock:
+            keys = sorted(
+                (key, stored) for (stored_bucket, key), stored in self.server.objects.items()
+                if stored_bucket == bucket and key.startswith(prefix)
+            )
+        contents = ''.join(
+            f'<Contents><Key>{escape(key)}</Key><Size>{stored.size}</Size><ETag>{stored.etag}</ETag></Contents>'
+            for key, stored in keys
+        )
+        self._send(200, f'<?xml version="1.0" encoding="UTF-8"?><ListBucketResult><Name>{bucket}</Name>'
+                        f'<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(keys)}</KeyCount>'
+                        f'<IsTruncated>false</IsTruncated>{contents}</ListBucketResult>')
+
+
+def start(latency=0.0, bandwidth=None, keep_data=False, host='127.0.0.1', port=0):
+    """
+    Start a fake S3 server on a background thread.
+
+    Returns:
+        FakeS3Server: The running server; its endpoint attribute is the URL for S3_ENDPOINT
+    """
+    server = FakeS3Server((host, port), latency=latency, bandwidth=bandwidth, keep_data=keep_data)
+    threading.Thread(target=server.serve_forever, name='fake-s3', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000, help='Port to listen on, 0 picks a free one')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='Upload bandwidth in MB/s shared by all connections (0 = unlimited)')
+    parser.add_argument('--keep-data', action='store_true', help='Keep object bodies so they can be downloaded')
+    args = parser.parse_args()
+
+    server = FakeS3Server(
+        (args.host, args.port),
+        latency=args.latency,
+        bandwidth=args.bandwidth * 1024 * 1024 or None,
+        keep_data=args.keep_data
+    )
+    # First line of output is the endpoint, for scripts that start the server with port 0
+    print(server.endpoint, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
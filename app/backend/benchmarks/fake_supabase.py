@@ -0,0 +1,256 @@
+"""
+Minimal stand-in for the Supabase REST (PostgREST) and Auth (GoTrue) APIs.
+
+Covers what the backend calls: inserts into contributions, sign up, password
+login, fetching the user and logout. Users and rows live in memory. Access
+tokens are HS256 JWTs signed with --jwt-secret, so a backend started with the
+same SUPABASE_JWT_SECRET verifies them locally like real Supabase tokens.
+
+Database and auth requests can be delayed separately to approximate the
+latency of a hosted project.
+
+Run from app/backend:
+
+    python benchmarks/fake_supabase.py --port 54321 --db-latency 0.02 --auth-latency 0.08
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_JWT_SECRET=load-test-secret python app.py
+"""
+import sys
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_JWT_SECRET = 'load-test-secret'
+TOKEN_LIFETIME = 3600  # seconds
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeSupabaseServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding users, sessions and table rows in memory.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), db_latency=0.0, auth_latency=0.0, jwt_secret=DEFAULT_JWT_SECRET):
+        """
+        Args:
+            address (tuple): Host and port to listen on; port 0 picks a free port
+            db_latency (float): Seconds every /rest/v1 request is delayed
+            auth_latency (float): Seconds every /auth/v1 request is delayed
+            jwt_secret (str): Secret access tokens are signed with
+        """
+        super().__init__(address, FakeSupabaseHandler)
+        self.db_latency = db_latency
+        self.auth_latency = auth_latency
+        self.jwt_secret = jwt_secret.encode()
+        self.users = {}  # email -> user
+        self.passwords = {}  # email -> password hash
+        self.tables = {}  # table -> rows
+        self.lock = threading.Lock()
+        self._next_id = 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def insert(self, table, rows):
+        with self.lock:
+            inserted = []
+            for row in rows:
+                inserted.append(dict(row, id=self._next_id, created_at=_now()))
+                self._next_id += 1
+            self.tables.setdefault(table, []).extend(inserted)
+        return inserted
+
+    def issue_token(self, user):
+        issued_at = int(time.time())
+        claims = {
+            'sub': user['id'],
+            'email': user['email'],
+            'aud': 'authenticated',
+            'role': 'authenticated',
+            'iat': issued_at,
+            'exp': issued_at + TOKEN_LIFETIME,
+            'session_id': str(uuid.uuid4()),
+            'app_metadata': user['app_metadata'],
+            'user_metadata': user['user_metadata']
+        }
+        signing_input = _b64encode(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode()) + '.' + \
+            _b64encode(json.dumps(claims).encode())
+        signature = hmac.new(self.jwt_secret, signing_input.encode(), hashlib.sha256).digest()
+        return f'{signing_input}.{_b64encode(signature)}'
+
+    def user_for_token(self, token):
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            expected = hmac.new(self.jwt_secret, f'{header_segment}.{payload_segment}'.encode(), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64decode(signature_segment)):
+                return None
+            claims = json.loads(_b64decode(payload_segment))
+        except ValueError:
+            return None
+        if claims.get('exp', 0) < time.time():
+            return None
+        return self.users.get(claims.get('email'))
+
+
+class FakeSupabaseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def _send(self, status, payload=None):
+        body = b'' if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/rest/v1/'):
+            delay = self.server.db_latency
+        elif url.path.startswith('/auth/v1/'):
+            delay = self.server.auth_latency
+        else:
+            return None, None
+        if delay:
+            time.sleep(delay)
+        return url.path, parse_qs(url.query)
+
+    def _bearer_user(self):
+        header = self.headers.get('Authorization', '')
+        return self.server.user_for_token(header[7:]) if header.startswith('Bearer ') else None
+
+    def do_POST(self):
+        path, query = self._route()
+        body = self._read_json()
+
+        if path and path.startswith('/rest/v1/'):
+            rows = body if isinstance(body, list) else [body]
+            inserted = self.server.insert(path[len('/rest/v1/'):], rows)
+            return self._send(201, inserted)
+
+        if path == '/auth/v1/signup':
+            return self._sign_up(body)
+        if path == '/auth/v1/token' and query.get('grant_type') == ['password']:
+            return self._sign_in(body)
+        if path == '/auth/v1/logout':
+            return self._send(204)
+        self._send(404, {'msg': 'Not found'})
+
+    def do_GET(self):
+        path, _ = self._route()
+        if path and path.startswith('/rest/v1/'):
+            with self.server.lock:
+                rows = list(self.server.tables.get(path[len('/rest/v1/'):], []))
+            return self._send(200, rows)
+        if path == '/auth/v1/user':
+            user = self._bearer_user()
+            if user is None:
+                return self._send(401, {'msg': 'Invalid token'})
+            return self._send(200, user)
+        self._send(404, {'msg': 'Not found'})
+
+    def _sign_up(self, body):
+        email = body.get('email')
+        with self.server.lock:
+            if email in self.server.users:
+                return self._send(400, {'code': 400, 'msg': 'User already registered'})
+            user = {
+                'id': str(uuid.uuid4()),
+                'aud': 'authenticated',
+                'role': 'authenticated',
+                'email': email,
+                'app_metadata': {'provider': 'email', 'providers': ['email']},
+                'user_metadata': body.get('data') or {},
+                'created_at': _now(),
+                'updated_at': _now(),
+                'email_confirmed_at': _now()
+            }
+            self.server.users[email] = user
+            self.server.passwords[email] = hashlib.sha256(body.get('password', '').encode()).hexdigest()
+        self._send(200, user)
+
+    def _sign_in(self, body):
+        email = body.get('email')
+        password_hash = hashlib.sha256(body.get('password', '').encode()).hexdigest()
+        user = self.server.users.get(email)
+        if user is None or not hmac.compare_digest(self.server.passwords[email], password_hash):
+            return self._send(400, {'error': 'invalid_grant', 'error_description': 'Invalid login credentials'})
+        self._send(200, {
+            'access_token': self.server.issue_token(user),
+            'token_type': 'bearer',
+            'expires_in': TOKEN_LIFETIME,
+            'expires_at': int(time.time()) + TOKEN_LIFETIME,
+            'refresh_token': uuid.uuid4().hex,
+            'user': user
+        })
+
+
+def start(db_latency=0.0, auth_latency=0.0, jwt_secret=DEFAULT_JWT_SECRET, host='127.0.0.1', port=0):
+    """
+    Start a fake Supabase server on a background thread.
+
+    Returns:
+        FakeSupabaseServer: The running server; its url attribute is the value for SUPABASE_URL
+    """
+    server = FakeSupabaseServer((host, port), db_latency=db_latency, auth_latency=auth_latency, jwt_secret=jwt_secret)
+    threading.Thread(target=server.serve_forever, name='fake-supabase', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321, help='Port to listen on, 0 picks a free one')
+    parser.add_argument('--db-latency', type=float, default=0.0, help='Seconds added to every REST request')
+    parser.add_argument('--auth-latency', type=float, default=0.0, help='Seconds added to every Auth request')
+    parser.add_argument('--jwt-secret', default=DEFAULT_JWT_SECRET, help='HS256 secret of the access tokens')
+    args = parser.parse_args()
+
+    server = FakeSupabaseServer(
+        (args.host, args.port),
+        db_latency=args.db_latency,
+        auth_latency=args.auth_latency,
+        jwt_secret=args.jwt_secret
+    )
+    # First line of output is the URL, for scripts that start the server with port 0
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
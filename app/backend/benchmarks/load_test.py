@@ -0,0 +1,426 @@
+"""
+HTTP load test of the backend against local stand-ins for Supabase and storage.
+
+Starts benchmarks/fake_supabase.py and benchmarks/fake_s3.py in subprocesses,
+then the real app under gunicorn pointed at them (or uses --target to load an
+app that is already running). A pool of users is registered and logged in
+through the API; their access tokens are sent with every request.
+
+Load runs in stages:
+
+- open loop (--rates): requests arrive as a Poisson process at each rate,
+  whether or not earlier ones finished. Latency is measured from the
+  scheduled arrival, so queueing in the server is included.
+- closed loop (--users): each of N simulated clients sends its next request
+  as soon as the previous one finished.
+
+Every request picks an operation by the weights of the workload profile.
+Per stage and endpoint the test reports throughput, p50/p90/p99/max latency
+and error rate, and from the app's /metrics the mean time spent in the
+route, in database inserts and in storage requests, which shows the layer
+that saturates first.
+
+Run from app/backend:
+
+    python benchmarks/load_test.py --profile mixed --rates 5,10,20,40 --duration 30
+    python benchmarks/load_test.py --profile text --users 1,8,32 --require-auth --output load.json
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# Operation -> relative weight
+PROFILES = {
+    'mixed': {'submit-text': 80, 'upload-image': 10, 'upload-audio': 4, 'upload-video': 1, 'auth-login': 3, 'auth-user': 2},
+    'text': {'submit-text': 100},
+    'uploads': {'upload-image': 60, 'upload-audio': 30, 'upload-video': 10},
+    'auth': {'auth-register': 10, 'auth-login': 40, 'auth-user': 50}
+}
+
+# Upload operation -> (endpoint, file name, default size)
+UPLOADS = {
+    'upload-image': ('/upload-image', 'photo.jpg', 200 * 1024),
+    'upload-audio': ('/upload-audio', 'clip.wav', 2 * 1024 * 1024),
+    'upload-video': ('/upload-video', 'video.mp4', 50 * 1024 * 1024)
+}
+
+WORDS = 'the quick brown fox jumps over a lazy dog while data is collected from many contributors'.split()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] if ordered else None
+
+
+class Stack:
+    """
+    The fake services and the app under test, started as subprocesses.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = []
+        self.log_dir = tempfile.mkdtemp(prefix='dynocollect-load-')
+
+    def _spawn_fake(self, script, *options):
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARK_DIR, script), '--port', '0', *options],
+            stdout=subprocess.PIPE, text=True
+        )
+        self.processes.append(process)
+        return process.stdout.readline().strip()
+
+    def start(self):
+        args = self.args
+        s3_endpoint = self._spawn_fake(
+            'fake_s3.py', '--latency', str(args.s3_latency), '--bandwidth', str(args.s3_bandwidth)
+        )
+        supabase_url = self._spawn_fake(
+            'fake_supabase.py', '--db-latency', str(args.db_latency), '--auth-latency', str(args.auth_latency),
+            '--jwt-secret', args.jwt_secret
+        )
+
+        port = free_port()
+        env = dict(
+            os.environ,
+            SUPABASE_URL=supabase_url,
+            SUPABASE_KEY='eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.load-test',
+            SUPABASE_JWT_SECRET=args.jwt_secret,
+            S3_ENDPOINT=s3_endpoint,
+            REQUIRE_AUTH='true' if args.require_auth else 'false',
+            MEDIA_INDEX_DB=os.path.join(self.log_dir, 'media_index.db'),
+            UPLOAD_STATE_DB=os.path.join(self.log_dir, 'upload_state.db'),
+            SECRET_KEY='load-test',
+            LOG_LEVEL='WARNING'
+        )
+        log = open(os.path.join(self.log_dir, 'app.log'), 'w')
+        self.processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--chdir', BACKEND_DIR, '--bind', f'127.0.0.1:{port}',
+             '--workers', str(args.workers), '--worker-class', 'gthread', '--threads', str(args.threads),
+             '--timeout', '900', 'app:app'],
+            env=env, stdout=log, stderr=subprocess.STDOUT
+        ))
+
+        target = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f'{target}/healthz', timeout=1).ok:
+                    return target
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"App did not start, see {log.name}")
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class LoadClient:
+    """
+    Issue the requests of one operation and record their outcome.
+    """
+
+    def __init__(self, target, accounts, upload_sizes):
+        self.target = target
+        self.accounts = accounts
+        self.payloads = {name: os.urandom(size) for name, size in upload_sizes.items()}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples = []  # (operation, latency, ok)
+
+    def session(self):
+        # One pooled session per client thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def request(self, operation):
+        account = random.choice(self.accounts)
+        headers = {'Authorization': f"Bearer {account['token']}"}
+        url = self.target
+
+        if operation == 'submit-text':
+            text = ' '.join(random.choices(WORDS, k=40))
+            return self.session().post(f'{url}/submit-text', json={'text_data': text}, headers=headers)
+        if operation in UPLOADS:
+            path, filename, _ = UPLOADS[operation]
+            # Unique content, so the deduplication index does not skip the transfer
+            payload = os.urandom(16) + self.payloads[operation][16:]
+            return self.session().post(f'{url}{path}', files={'file': (filename, payload)}, headers=headers)
+        if operation == 'auth-login':
+            return self.session().post(f'{url}/auth/login', json={
+                'email': account['email'], 'password': account['password']
+            })
+        if operation == 'auth-user':
+            return self.session().get(f'{url}/auth/user', headers=headers)
+        if operation == 'auth-register':
+            return self.session().post(f'{url}/auth/register', json={
+                'email': f'load-{uuid.uuid4().hex}@example.com', 'password': 'load-test-password'
+            })
+        raise ValueError(f"Unknown operation: {operation}")
+
+    def run(self, operation, scheduled):
+        try:
+            ok = self.request(operation).status_code < 400
+        except requests.RequestException:
+            ok = False
+        latency = time.monotonic() - scheduled
+        with self._lock:
+            self.samples.append((operation, latency, ok))
+
+    def take_samples(self):
+        with self._lock:
+            samples, self.samples = self.samples, []
+        return samples
+
+
+def create_accounts(target, count):
+    accounts = []
+    for i in range(count):
+        email = f'load-user-{i}-{uuid.uuid4().hex[:8]}@example.com'
+        password = 'load-test-password'
+        requests.post(f'{target}/auth/register', json={'email': email, 'password': password}).raise_for_status()
+        response = requests.post(f'{target}/auth/login', json={'email': email, 'password': password})
+        response.raise_for_status()
+        accounts.append({'email': email, 'password': password, 'token': response.json()['session']['access_token']})
+    return accounts
+
+
+def run_open_loop(client, profile, rate, duration, max_in_flight):
+    """
+    Send requests at Poisson arrival times for duration seconds.
+
+    Returns:
+        int: Requests not sent because max_in_flight requests were outstanding
+    """
+    operations, weights = zip(*profile.items())
+    in_flight = threading.Semaphore(max_in_flight)
+    dropped = 0
+
+    def send(operation, scheduled):
+        try:
+            client.run(operation, scheduled)
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='load') as executor:
+        start = time.monotonic()
+        arrival = start
+        while True:
+            arrival += random.expovariate(rate)
+            if arrival - start >= duration:
+                break
+            delay = arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not in_flight.acquire(blocking=False):
+                dropped += 1
+                continue
+            executor.submit(send, random.choices(operations, weights)[0], arrival)
+    return dropped
+
+
+def run_closed_loop(client, profile, users, duration):
+    operations, weights = zip(*profile.items())
+    deadline = time.monotonic() + duration
+
+    def user():
+        while time.monotonic() < deadline:
+            client.run(random.choices(operations, weights)[0], time.monotonic())
+
+    threads = [threading.Thread(target=user, name=f'load-user-{i}') for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return 0
+
+
+def scrape_metrics(target):
+    """
+    Return {(name, labels): value} from the app's /metrics, or {} if it is not available.
+    """
+    try:
+        text = requests.get(f'{target}/metrics', timeout=5).text
+    except requests.RequestException:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+        if match:
+            labels = tuple(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ''))
+            values[(match.group(1), labels)] = float(match.group(3))
+    return values
+
+
+def server_breakdown(before, after):
+    """
+    Mean seconds spent per route, database insert and storage operation during a stage.
+    """
+    def mean(name, labels):
+        count = after.get((f'{name}_count', labels), 0) - before.get((f'{name}_count', labels), 0)
+        total = after.get((f'{name}_sum', labels), 0) - before.get((f'{name}_sum', labels), 0)
+        return round(total / count, 4) if count else None
+
+    breakdown = {'routes': {}, 'storage': {}}
+    for name, labels in after:
+        if name == 'dynocollect_http_request_duration_seconds_count':
+            breakdown['routes'][' '.join(value for _, value in labels)] = mean('dynocollect_http_request_duration_seconds', labels)
+        elif name == 'dynocollect_storage_request_duration_seconds_count':
+            breakdown['storage'][labels[0][1]] = mean('dynocollect_storage_request_duration_seconds', labels)
+    breakdown['db_insert'] = mean('dynocollect_db_insert_duration_seconds', ())
+    breakdown['transfer_busy_workers'] = after.get(('dynocollect_transfer_busy_workers', ()))
+    return breakdown
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for operation in sorted({sample[0] for sample in samples}):
+        latencies = [latency for name, latency, _ in samples if name == operation]
+        errors = sum(1 for name, _, ok in samples if name == operation and not ok)
+        endpoints[operation] = {
+            'requests': len(latencies),
+            'throughput': round(len(latencies) / elapsed, 2),
+            'error_rate': round(errors / len(latencies), 4),
+            'p50': round(percentile(latencies, 0.5), 4),
+            'p90': round(percentile(latencies, 0.9), 4),
+            'p99': round(percentile(latencies, 0.99), 4),
+            'max': round(max(latencies), 4)
+        }
+    return endpoints
+
+
+def load_profile(value):
+    if value in PROFILES:
+        return PROFILES[value]
+    if os.path.exists(value):
+        with open(value) as profile_file:
+            return json.load(profile_file)
+    return json.loads(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='mixed',
+                        help=f"One of {', '.join(PROFILES)}, or a JSON object / file of operation weights")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--rates', help='Open loop: comma-separated arrival rates in requests/second, one stage each')
+    load.add_argument('--users', help='Closed loop: comma-separated numbers of concurrent clients, one stage each')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per stage')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Open loop: most outstanding requests; further arrivals are dropped')
+    parser.add_argument('--accounts', type=int, default=10, help='Users registered before the test')
+    parser.add_argument('--image-size', type=int, default=UPLOADS['upload-image'][2])
+    parser.add_argument('--audio-size', type=int, default=UPLOADS['upload-audio'][2])
+    parser.add_argument('--video-size', type=int, default=UPLOADS['upload-video'][2])
+    parser.add_argument('--target', help='URL of a running app; nothing is started')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes (/metrics covers one of them)')
+    parser.add_argument('--threads', type=int, default=32, help='Threads per gunicorn worker')
+    parser.add_argument('--require-auth', action='store_true', help='Start the app with REQUIRE_AUTH')
+    parser.add_argument('--db-latency', type=float, default=0.02, help='Seconds added to every fake database request')
+    parser.add_argument('--auth-latency', type=float, default=0.05, help='Seconds added to every fake auth request')
+    parser.add_argument('--s3-latency', type=float, default=0.02, help='Seconds added to every fake storage request')
+    parser.add_argument('--s3-bandwidth', type=float, default=0.0, help='Fake storage bandwidth in MB/s (0 = unlimited)')
+    parser.add_argument('--jwt-secret', default='load-test-secret')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    profile = load_profile(args.profile)
+    unknown = set(profile) - {'submit-text', 'auth-login', 'auth-user', 'auth-register'} - set(UPLOADS)
+    if unknown:
+        parser.error(f"Unknown operations in profile: {', '.join(sorted(unknown))}")
+    if args.users:
+        stages = [('users', int(users)) for users in args.users.split(',')]
+    else:
+        stages = [('rate', float(rate)) for rate in (args.rates or '5,10,20').split(',')]
+
+    stack = None
+    target = args.target
+    if target is None:
+        stack = Stack(args)
+        target = stack.start()
+        print(f"App running at {target}, logs in {stack.log_dir}", file=sys.stderr)
+
+    report = {'profile': profile, 'target': args.target or 'local', 'stages': []}
+    try:
+        upload_sizes = {
+            name: size for name, size in (
+                ('upload-image', args.image_size), ('upload-audio', args.audio_size), ('upload-video', args.video_size)
+            ) if name in profile
+        }
+        client = LoadClient(target, create_accounts(target, args.accounts), upload_sizes)
+
+        for kind, level in stages:
+            before = scrape_metrics(target)
+            start = time.monotonic()
+            if kind == 'rate':
+                dropped = run_open_loop(client, profile, level, args.duration, args.max_in_flight)
+            else:
+                dropped = run_closed_loop(client, profile, level, args.duration)
+            elapsed = time.monotonic() - start
+            samples = client.take_samples()
+
+            stage = {
+                kind: level,
+                'duration_seconds': round(elapsed, 2),
+                'requests': len(samples),
+                'dropped': dropped,
+                'throughput': round(len(samples) / elapsed, 2),
+                'error_rate': round(sum(1 for *_, ok in samples if not ok) / len(samples), 4) if samples else None,
+                'endpoints': summarize(samples, elapsed),
+                'server': server_breakdown(before, scrape_metrics(target))
+            }
+            report['stages'].append(stage)
+
+            print(f"\n{kind} {level}: {stage['throughput']} req/s, error rate {stage['error_rate']}, dropped {dropped}",
+                  file=sys.stderr)
+            for operation, result in stage['endpoints'].items():
+                print(f"  {operation:<14} {result['requests']:6d} req  {result['throughput']:8.2f}/s"
+                      f"  p50 {result['p50']:7.3f}s  p90 {result['p90']:7.3f}s  p99 {result['p99']:7.3f}s"
+                      f"  errors {result['error_rate']:.1%}", file=sys.stderr)
+            print(f"  server: db insert {stage['server']['db_insert']}s, storage {stage['server']['storage']}",
+                  file=sys.stderr)
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
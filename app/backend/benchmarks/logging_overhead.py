@@ -0,0 +1,88 @@
+"""
+Measure the per-request cost of request logging in the request thread.
+
+"before" replays the old hooks: two print() calls and two INFO lines written
+synchronously by a StreamHandler. "after" replays the current hook: one
+structured line handed to the background writer, with and without sampling.
+Output goes to os.devnull, so the numbers are the logging work itself and not
+terminal speed.
+
+Run from app/backend:
+
+    python benchmarks/logging_overhead.py --requests 50000
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logging_config import configure_logging, stop_logging, RequestLogSampler, TEXT_FORMAT
+
+METHOD, PATH, STATUS = 'POST', '/upload-image', 201
+
+
+def old_hooks(logger):
+    print(f"Request received: {METHOD} {PATH}")
+    logger.info(f"Request received: {METHOD} {PATH}")
+    print(f"Response sent: {STATUS} CREATED")
+    logger.info(f"Response sent: {STATUS} CREATED")
+
+
+def new_hooks(logger):
+    start = time.perf_counter()
+    duration = time.perf_counter() - start
+    if logger.isEnabledFor(logging.INFO):
+        logger.log(logging.INFO, "%s %s %s", METHOD, PATH, STATUS, extra={
+            'method': METHOD,
+            'path': PATH,
+            'status': STATUS,
+            'duration_ms': round(duration * 1000, 2)
+        })
+
+
+def run(hooks, logger, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        hooks(logger)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000, help='Simulated requests per scenario')
+    args = parser.parse_args()
+
+    results = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # Old setup: synchronous handler at DEBUG level
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+        results.append(('before: print + sync INFO x2', run(old_hooks, logging.getLogger('bench.old'), args.requests)))
+
+        scenarios = [
+            ('after: queued JSON, no sampling', RequestLogSampler(sample_rate=1.0, max_per_second=0)),
+            ('after: queued JSON, 1% sample', RequestLogSampler(sample_rate=0.01, max_per_second=0)),
+            ('after: queued JSON, 100/s limit', RequestLogSampler(sample_rate=1.0, max_per_second=100)),
+        ]
+        for name, sampler in scenarios:
+            configure_logging(level='INFO', fmt='json', stream=devnull, queue_size=args.requests)
+            logger = logging.getLogger(f'bench.{len(results)}')
+            logger.addFilter(sampler)
+            results.append((name, run(new_hooks, logger, args.requests)))
+            stop_logging()
+
+    for name, seconds in results:
+        print(f"{name:<36} {seconds * 1e6:8.2f} us per request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare the per-request overhead of the session backends.
+
+Every backend serves the same three routes through the Flask test client
+to a logged-in client: one that does not touch the session, one that reads
+the logged-in user and one that rewrites it. Flask opens the session of every
+request, so even the first route pays for loading it. The overhead is the
+difference to a request without any session cookie.
+
+Run from app/backend:
+
+    python benchmarks/session_overhead.py --requests 5000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, session
+from sessions import init_session, SESSION_BACKENDS
+
+# Roughly what /auth/login stores
+SESSION_USER = {
+    'id': '7f1c2a9e-3b4d-4c5e-8f60-718293a4b5c6',
+    'email': 'contributor@example.com',
+    'access_token': 'x' * 900,
+    'refresh_token': 'y' * 40
+}
+
+
+def make_app(backend, session_dir):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    app.config['SESSION_PERMANENT'] = False
+    app.config['SESSION_FILE_DIR'] = session_dir
+    init_session(app, backend)
+
+    @app.route('/plain')
+    def plain():
+        return 'ok'
+
+    @app.route('/read')
+    def read():
+        return 'ok' if session.get('user') else 'missing'
+
+    @app.route('/write')
+    def write():
+        session['user'] = dict(SESSION_USER, seen=time.time())
+        return 'ok'
+
+    return app
+
+
+def measure(client, path, requests):
+    for _ in range(min(requests, 100)):
+        client.get(path)  # Warm up
+
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get(path)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per route and backend')
+    parser.add_argument('--backends', nargs='+', default=list(SESSION_BACKENDS), choices=SESSION_BACKENDS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as session_dir:
+        client = make_app('cookie', session_dir).test_client()
+        baseline = statistics.mean(measure(client, '/plain', args.requests))
+    print(f"Baseline without a session: {baseline * 1e6:.1f} us per request")
+
+    print(f"{'backend':<12} {'route':<6} {'mean us':>9} {'p99 us':>9} {'overhead us':>12}")
+    for backend in args.backends:
+        with tempfile.TemporaryDirectory() as session_dir:
+            client = make_app(backend, session_dir).test_client()
+            client.get('/write')  # Log in once so that /read finds a session
+
+            results = {path: measure(client, f'/{path}', args.requests) for path in ('plain', 'read', 'write')}
+            for path, timings in results.items():
+                mean = statistics.mean(timings)
+                p99 = statistics.quantiles(timings, n=100)[98]
+                print(f"{backend:<12} {path:<6} {mean * 1e6:>9.1f} {p99 * 1e6:>9.1f} {(mean - baseline) * 1e6:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""
+Measure upload throughput of the storage transfer path against a local S3 server.
+
+Uploads files of every size in --sizes through upload_file_from_memory() and
+upload_file_to_supabase(), for every combination of --part-sizes and
+--concurrency ('auto' lets the transfer tuner choose, as in production). A
+fake S3 server (benchmarks/fake_s3.py) is started in a subprocess with the
+given latency and bandwidth, unless --endpoint points at another server.
+
+Every configuration reports MB/s, p50/p99 upload latency, peak RSS and the
+peak number of threads of this process. Results are written as JSON; with
+--baseline, configurations whose throughput dropped by more than --tolerance
+against an earlier result file are listed and the exit status is 1.
+
+Run from app/backend:
+
+    python benchmarks/storage_throughput.py --sizes 100KB,10MB,100MB --output storage.json
+    python benchmarks/storage_throughput.py --latency 0.03 --bandwidth 100 --baseline storage.json
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import itertools
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+DEFAULT_SIZES = '100KB,1MB,10MB,100MB,500MB'
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(value):
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*', value.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * UNITS[match.group(2) or 'B'])
+
+
+def parse_list(value, parse):
+    return [None if item.strip() == 'auto' else parse(item) for item in value.split(',')]
+
+
+def format_size(size):
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f'{size // UNITS[unit]}{unit}'
+    return f'{size}B'
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def start_fake_s3(latency, bandwidth):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARK_DIR, 'fake_s3.py'), '--port', '0',
+         '--latency', str(latency), '--bandwidth', str(bandwidth)],
+        stdout=subprocess.PIPE, text=True
+    )
+    return process, process.stdout.readline().strip()
+
+
+class ResourceSampler:
+    """
+    Sample the resident set size and thread count of this process in the background.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_threads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+
+    @staticmethod
+    def rss():
+        try:
+            with open('/proc/self/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        # Lifetime peak where /proc is not available
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _sample(self):
+        self.peak_rss = max(self.peak_rss, self.rss())
+        # The sampler itself does not count
+        self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def make_tuner(s3_uploader, part_size, concurrency):
+    """
+    Return a fresh transfer tuner that uses the given part size and concurrency where they are set.
+    """
+
+    class SweepTuner(s3_uploader.TransferTuner):
+        def choose(self, file_size):
+            params = super().choose(file_size)
+            if part_size is None and concurrency is None:
+                return params
+            chosen_part_size = part_size or params["part_size_bytes"]
+            chosen_concurrency = concurrency or self.max_concurrency
+            part_count = math.ceil(file_size / chosen_part_size) if file_size else None
+            if part_count:
+                chosen_concurrency = min(chosen_concurrency, part_count)
+            return {
+                "part_size_bytes": chosen_part_size,
+                "max_concurrency": chosen_concurrency,
+                "part_count": part_count
+            }
+
+    return SweepTuner()
+
+
+def run_config(s3_uploader, function, payload, path, repeat):
+    durations = []
+    errors = []
+    with ResourceSampler() as sampler:
+        start = time.perf_counter()
+        for i in range(repeat):
+            upload_start = time.perf_counter()
+            if function == 'memory':
+                result = s3_uploader.upload_file_from_memory(payload, f'bench-{i}.bin', 'video', 'application/octet-stream')
+            else:
+                result = s3_uploader.upload_file_to_supabase(path, 'video', content_type='application/octet-stream')
+            durations.append(time.perf_counter() - upload_start)
+            if not result["success"]:
+                errors.append(result["error"])
+        elapsed = time.perf_counter() - start
+
+    size = len(payload)
+    return {
+        "mb_per_s": round(size * repeat / elapsed / UNITS['MB'], 2),
+        "latency_p50_seconds": round(percentile(durations, 0.5), 4),
+        "latency_p99_seconds": round(percentile(durations, 0.99), 4),
+        "peak_rss_mb": round(sampler.peak_rss / UNITS['MB'], 1),
+        "peak_threads": sampler.peak_threads,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the configurations whose throughput dropped by more than tolerance against the baseline.
+    """
+    def config_key(entry):
+        return (entry["function"], entry["size_bytes"], entry["part_size"], entry["concurrency"])
+
+    previous = {config_key(entry): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get(config_key(entry))
+        if old and old["mb_per_s"] and entry["mb_per_s"] < old["mb_per_s"] * (1 - tolerance):
+            regressions.append((entry, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'File sizes (default: {DEFAULT_SIZES})')
+    parser.add_argument('--part-sizes', default='auto,8MB,32MB', help="Multipart part sizes, 'auto' = tuner (minimum 5MB)")
+    parser.add_argument('--concurrency', default='auto,4,16', help="Parallel parts per upload, 'auto' = tuner")
+    parser.add_argument('--functions', default='memory,file', help='upload_file_from_memory (memory) and/or upload_file_to_supabase (file)')
+    parser.add_argument('--repeat', type=int, default=3, help='Uploads per configuration')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the fake server adds to every request')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='Fake server bandwidth in MB/s (0 = unlimited)')
+    parser.add_argument('--endpoint', help='Use this S3 endpoint instead of starting the fake server')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    parser.add_argument('--baseline', help='Earlier JSON results to compare throughput against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative throughput drop against the baseline')
+    args = parser.parse_args()
+
+    sizes = parse_list(args.sizes, parse_size)
+    part_sizes = parse_list(args.part_sizes, parse_size)
+    concurrencies = parse_list(args.concurrency, int)
+    functions = args.functions.split(',')
+
+    server = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        server, endpoint = start_fake_s3(args.latency, args.bandwidth)
+
+    # Configure the uploader before importing it
+    os.environ['S3_ENDPOINT'] = endpoint
+    os.environ['MEDIA_DEDUP'] = 'false'
+    os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+    os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark')
+    import s3_uploader
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for part_size in part_sizes:
+        if part_size is not None and part_size < s3_uploader.S3_MIN_PART_SIZE:
+            parser.error(f"Part sizes must be at least {format_size(s3_uploader.S3_MIN_PART_SIZE)}")
+
+    results = []
+    seen = set()
+    try:
+        # Open pooled connections before anything is measured
+        s3_uploader.upload_file_from_memory(b'warm-up', 'warm-up.bin', 'video')
+
+        for size in sizes:
+            payload = os.urandom(size)
+            with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as file:
+                file.write(payload)
+            try:
+                for function, part_size, concurrency in itertools.product(functions, part_sizes, concurrencies):
+                    tuner = make_tuner(s3_uploader, part_size, concurrency)
+                    plan = tuner.choose(size)
+                    # Fixed settings that result in the same plan are measured once
+                    if part_size is not None or concurrency is not None:
+                        parts = plan["part_count"] or 1
+                        plan_key = (function, size, parts, plan["part_size_bytes"] if parts > 1 else None,
+                                    plan["max_concurrency"] if parts > 1 else None)
+                        if plan_key in seen:
+                            continue
+                        seen.add(plan_key)
+
+                    s3_uploader.transfer_tuner = tuner
+                    entry = {
+                        "function": function,
+                        "size_bytes": size,
+                        "part_size": part_size or 'auto',
+                        "concurrency": concurrency or 'auto',
+                        "planned_parts": plan["part_count"],
+                        "repeat": args.repeat
+                    }
+                    entry.update(run_config(s3_uploader, function, payload, file.name, args.repeat))
+                    results.append(entry)
+                    print(f"{function:<7} {format_size(size):>6}  part {format_size(part_size) if part_size else 'auto':>5}"
+                          f"  x{concurrency or 'auto':<4}  {entry['mb_per_s']:9.2f} MB/s"
+                          f"  p50 {entry['latency_p50_seconds']:8.3f}s  p99 {entry['latency_p99_seconds']:8.3f}s"
+                          f"  rss {entry['peak_rss_mb']:7.1f}MB  threads {entry['peak_threads']:3d}"
+                          f"{'  errors ' + str(entry['errors']) if entry['errors'] else ''}", file=sys.stderr)
+            finally:
+                os.unlink(file.name)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "endpoint": endpoint if args.endpoint else 'fake_s3',
+            "latency_seconds": args.latency,
+            "bandwidth_mb_per_s": args.bandwidth or None,
+            "transfer_workers": s3_uploader.TRANSFER_WORKERS,
+            "max_inflight_bytes": s3_uploader.TRANSFER_MAX_INFLIGHT_BYTES
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for entry, old in regressions:
+            print(f"Regression: {entry['function']} {format_size(entry['size_bytes'])} part {entry['part_size']} "
+                  f"x{entry['concurrency']}: {old['mb_per_s']} -> {entry['mb_per_s']} MB/s", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import os
+
+# Check the first bytes of every upload against the allowed types of its bucket
+CONTENT_SNIFFING = os.getenv("CONTENT_SNIFFING", "true").lower() in ("1", "true", "yes")
+
+# Bytes of the start of a file needed to recognize its type
+SNIFF_SIZE = 4096
+
+# Content types accepted per bucket
+ALLOWED_CONTENT_TYPES = {
+    'audio': {
+        'audio/wav', 'audio/mpeg', 'audio/mp4', 'audio/aac', 'audio/ogg', 'audio/webm', 'audio/flac',
+        'audio/aiff', 'audio/amr', 'audio/3gpp', 'audio/x-matroska', 'audio/x-ms-wma', 'audio/x-caf'
+    },
+    'video': {
+        'video/mp4', 'video/quicktime', 'video/webm', 'video/x-matroska', 'video/x-msvideo', 'video/ogg',
+        'video/3gpp', 'video/mp2t', 'video/mpeg', 'video/x-flv', 'video/x-ms-asf'
+    },
+    'images': {
+        'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff', 'image/heic',
+        'image/avif', 'image/x-icon'
+    }
+}
+
+# Containers that hold audio or video report a type for each bucket
+_AUDIO_OR_VIDEO = {
+    'video/mp4': {'video': 'video/mp4', 'audio': 'audio/mp4'},
+    'video/webm': {'video': 'video/webm', 'audio': 'audio/webm'},
+    'video/x-matroska': {'video': 'video/x-matroska', 'audio': 'audio/x-matroska'},
+    'video/ogg': {'video': 'video/ogg', 'audio': 'audio/ogg'},
+    'video/3gpp': {'video': 'video/3gpp', 'audio': 'audio/3gpp'},
+    'video/x-ms-asf': {'video': 'video/x-ms-asf', 'audio': 'audio/x-ms-wma'}
+}
+
+# Fixed magic numbers: (offset, bytes, content type)
+_MAGIC_NUMBERS = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'\x00\x00\x01\x00', 'image/x-icon'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'#!AMR', 'audio/amr'),
+    (0, b'caff', 'audio/x-caf'),
+    (0, b'FLV\x01', 'video/x-flv'),
+    (0, b'\x00\x00\x01\xba', 'video/mpeg'),
+    (0, b'\x00\x00\x01\xb3', 'video/mpeg'),
+    (0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11', 'video/x-ms-asf')
+]
+
+_RIFF_TYPES = {b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo', b'WEBP': 'image/webp'}
+_AUDIO_BRANDS = {b'M4A ', b'M4B ', b'M4P ', b'F4A '}
+_HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1'}
+
+
+def _iso_media_type(head):
+    # ISO base media files (MP4, MOV, 3GP, HEIF) start with an ftyp box listing their brands
+    box_size = int.from_bytes(head[0:4], 'big')
+    major_brand = head[8:12]
+    brands = {major_brand} | {head[i:i + 4] for i in range(16, min(box_size, len(head)) - 3, 4)}
+    if b'avif' in brands or b'avis' in brands:
+        return 'image/avif'
+    if major_brand in _HEIF_BRANDS:
+        return 'image/heic'
+    if major_brand in _AUDIO_BRANDS:
+        return 'audio/mp4'
+    if major_brand == b'qt  ':
+        return 'video/quicktime'
+    if major_brand.startswith(b'3g'):
+        return 'video/3gpp'
+    return 'video/mp4'
+
+
+def _ogg_type(head):
+    if b'\x80theora' in head:
+        return 'video/ogg'
+    if b'OpusHead' in head or b'\x01vorbis' in head or b'\x7fFLAC' in head or b'Speex' in head:
+        return 'audio/ogg'
+    return 'video/ogg'
+
+
+def detect_content_type(head):
+    """
+    Recognize the type of a file from its first bytes.
+
+    Args:
+        head (bytes): Start of the file, ideally SNIFF_SIZE bytes
+
+    Returns:
+        str: The detected content type, or None if the content is not recognized
+    """
+    for offset, magic, content_type in _MAGIC_NUMBERS:
+        if head[offset:offset + len(magic)] == magic:
+            return content_type
+
+    if head[4:8] == b'ftyp':
+        return _iso_media_type(head)
+    if head[:4] == b'RIFF':
+        return _RIFF_TYPES.get(head[8:12])
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'audio/aiff'
+    if head[:4] == b'OggS':
+        return _ogg_type(head)
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        # Matroska; WebM declares its DocType in the EBML header
+        return 'video/webm' if b'webm' in head[:64] else 'video/x-matroska'
+    if len(head) >= 2 and head[0] == 0xff and head[1] & 0xe0 == 0xe0:
+        # MPEG audio frame sync; layer bits 00 mean AAC in ADTS framing
+        return 'audio/aac' if head[1] & 0x06 == 0 else 'audio/mpeg'
+    if head[:1] == b'\x47' and len(head) > 376 and head[188] == 0x47 and head[376] == 0x47:
+        return 'video/mp2t'
+    return None
+
+
+def sniff_content_type(head, bucket_name):
+    """
+    Check the first bytes of an upload against the content types allowed in its bucket.
+
+    Args:
+        head (bytes): Start of the file, SNIFF_SIZE bytes unless the file is shorter
+        bucket_name (str): Name of the bucket (video, audio, or images)
+
+    Returns:
+        dict: Dictionary containing success status, the content type to store (None when
+        sniffing is disabled), and an error message if the content is not allowed
+    """
+    if not CONTENT_SNIFFING:
+        return {"success": True, "content_type": None}
+
+    detected = detect_content_type(bytes(head))
+    content_type = _AUDIO_OR_VIDEO.get(detected, {}).get(bucket_name, detected)
+    if content_type in ALLOWED_CONTENT_TYPES.get(bucket_name, ()):
+        return {"success": True, "content_type": content_type}
+
+    kind = 'image' if bucket_name == 'images' else bucket_name
+    return {
+        "success": False,
+        "error": f"File content is not an allowed {kind} type (detected: {detected or 'unknown'})"
+    }
@@ -0,0 +1,134 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class BatcherFull(Exception):
+    """Raised when a row cannot be queued because the batcher is at capacity."""
+
+
+class InsertBatcher:
+    """
+    Coalesce single-row inserts into bulk inserts.
+
+    Rows are queued by submit() and written by a background thread, which
+    flushes as soon as max_batch_size rows are waiting or the oldest waiting
+    row is max_delay seconds old. Every row gets a Future that resolves to the
+    inserted row as returned by the database.
+    """
+
+    def __init__(self, insert_many, max_batch_size=100, max_delay=0.05, max_queue_size=10000,
+                 enqueue_timeout=1.0, name='insert-batcher'):
+        """
+        Args:
+            insert_many (callable): Inserts a list of rows and returns the inserted rows in the same order
+            max_batch_size (int): Maximum number of rows per bulk insert
+            max_delay (float): Maximum time in seconds a row waits before it is flushed
+            max_queue_size (int): Maximum number of queued rows
+            enqueue_timeout (float): Time submit() waits for room in a full queue
+            name (str): Name of the background thread
+        """
+        self.insert_many = insert_many
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = threading.Event()
+        # Held by submit() from the closed check to the put, so that close()
+        # cannot finish in between and strand the row in the queue
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """
+        Queue a row for insertion.
+
+        Returns:
+            Future: Resolves to the inserted row, or to the insert error
+
+        Raises:
+            BatcherFull: If the queue stayed full for enqueue_timeout seconds
+            RuntimeError: If the batcher is closed
+        """
+        deadline = time.monotonic() + self.enqueue_timeout
+        # Other callers hold the lock while they wait for room in a full queue
+        if not self._lock.acquire(timeout=self.enqueue_timeout):
+            raise BatcherFull("Too many pending inserts")
+        try:
+            if self._closed.is_set():
+                raise RuntimeError("Batcher is closed")
+
+            future = Future()
+            self._queue.put((row, future), timeout=max(deadline - time.monotonic(), 0))
+        except queue.Full:
+            raise BatcherFull("Too many pending inserts")
+        finally:
+            self._lock.release()
+        return future
+
+    def _collect(self):
+        """
+        Wait for the next row, then gather more until the batch is full or its deadline passes.
+        """
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        # PostgREST requires every row of a bulk insert to have the same columns
+        groups = {}
+        for row, future in batch:
+            groups.setdefault(tuple(sorted(row)), []).append((row, future))
+
+        for items in groups.values():
+            try:
+                inserted = self.insert_many([row for row, _ in items])
+                if len(inserted) != len(items):
+                    raise RuntimeError(f"Bulk insert returned {len(inserted)} rows for {len(items)}")
+            except Exception as e:
+                logger.error(f"Bulk insert of {len(items)} rows failed: {str(e)}")
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), inserted_row in zip(items, inserted):
+                future.set_result(inserted_row)
+
+    def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def stats(self):
+        """
+        Return the number of queued rows.
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue_size": self._queue.maxsize
+        }
+
+    def close(self, timeout=10.0):
+        """
+        Stop accepting rows and flush everything still queued.
+        """
+        with self._lock:
+            self._closed.set()
+        self._thread.join(timeout)
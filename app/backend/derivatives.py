@@ -0,0 +1,372 @@
+import io
+import os
+import shutil
+import signal
+import logging
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+import urllib.request
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from ttl_cache import TTLCache
+
+# Pillow is optional; without it no image thumbnails are generated
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Generate derivatives right after image and video uploads. When disabled, or
+# when the queue is full, they are generated on the first request instead.
+DERIVATIVES_EAGER = os.getenv("DERIVATIVES_EAGER", "true").lower() in ("1", "true", "yes")
+
+# Worker processes rendering derivatives, and renders queued or running before requests get 503
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", "2"))
+DERIVATIVE_QUEUE_SIZE = int(os.getenv("DERIVATIVE_QUEUE_SIZE", "100"))
+
+# Longest time one render may take in seconds
+DERIVATIVE_TIMEOUT = float(os.getenv("DERIVATIVE_TIMEOUT", "120"))
+
+# Thumbnails fit into a THUMBNAIL_SIZE x THUMBNAIL_SIZE box
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+
+# Video previews: first PREVIEW_SECONDS seconds, at most PREVIEW_HEIGHT pixels high, at PREVIEW_BITRATE
+PREVIEW_SECONDS = float(os.getenv("PREVIEW_SECONDS", "10"))
+PREVIEW_HEIGHT = int(os.getenv("PREVIEW_HEIGHT", "360"))
+PREVIEW_BITRATE = os.getenv("PREVIEW_BITRATE", "300k")
+
+# Largest image that is downloaded to render a thumbnail
+DERIVATIVE_MAX_SOURCE_BYTES = int(os.getenv("DERIVATIVE_MAX_SOURCE_BYTES", str(50 * 1024 * 1024)))
+
+# ffmpeg renders video thumbnails and previews; without it none are generated
+FFMPEG = shutil.which(os.getenv("FFMPEG_PATH", "ffmpeg"))
+
+# Derivatives of each bucket: kind -> (key suffix, content type). A derivative
+# is stored in the bucket of its original, under the original key plus the suffix.
+DERIVATIVES = {
+    'images': {
+        'thumbnail': ('.thumb.jpg', 'image/jpeg')
+    },
+    'video': {
+        'thumbnail': ('.thumb.jpg', 'image/jpeg'),
+        'preview': ('.preview.mp4', 'video/mp4')
+    }
+}
+
+_DERIVATIVE_SUFFIXES = tuple({suffix for kinds in DERIVATIVES.values() for suffix, _ in kinds.values()})
+
+
+def derivative_key(key, bucket_name, kind):
+    """
+    Return the object key of a derivative, or None if the bucket has no such derivative.
+    """
+    if kind not in DERIVATIVES.get(bucket_name, {}):
+        return None
+    return key + DERIVATIVES[bucket_name][kind][0]
+
+
+def missing_dependency(bucket_name, kind):
+    """
+    Return the name of the missing tool needed to render a derivative, or None if it can be rendered.
+    """
+    if bucket_name == 'images':
+        return 'Pillow' if Image is None else None
+    return 'ffmpeg' if FFMPEG is None else None
+
+
+# Rendering; runs in the worker processes
+
+
+def _read_source(url, max_bytes):
+    with urllib.request.urlopen(url, timeout=DERIVATIVE_TIMEOUT) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Source is larger than {max_bytes} bytes")
+    return data
+
+
+def _run_ffmpeg(args):
+    completed = subprocess.run(
+        [FFMPEG, '-nostdin', '-hide_banner', '-loglevel', 'error'] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=DERIVATIVE_TIMEOUT
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {completed.stderr.decode(errors='replace').strip()[-500:]}")
+    return completed.stdout
+
+
+def render_image_thumbnail(source_url, size):
+    data = _read_source(source_url, DERIVATIVE_MAX_SOURCE_BYTES)
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs are decoded at a reduced scale, much faster than a full decode
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            # Transparent areas become white instead of black
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=80, optimize=True)
+    return output.getvalue()
+
+
+def render_video_thumbnail(source_url, size):
+    scale = f"scale='min({size},iw)':'min({size},ih)':force_original_aspect_ratio=decrease"
+    # A frame one second in is more telling than the first; very short clips fall back to the start
+    for offset in ('1', '0'):
+        frame = _run_ffmpeg([
+            '-ss', offset, '-i', source_url, '-frames:v', '1', '-vf', scale,
+            '-c:v', 'mjpeg', '-q:v', '4', '-f', 'image2', 'pipe:1'
+        ])
+        if frame:
+            return frame
+    raise RuntimeError("Video has no frames")
+
+
+def render_video_preview(source_url, seconds, height, bitrate):
+    # MP4 with the index at the front needs a seekable output, so render into a temporary file.
+    # Only the first seconds of the source are read; ffmpeg fetches them with range requests.
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'preview.mp4')
+        _run_ffmpeg([
+            '-i', source_url, '-t', str(seconds),
+            '-vf', f"scale=-2:'min({height},trunc(ih/2)*2)'",
+            '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', bitrate, '-maxrate', bitrate, '-bufsize', bitrate,
+            '-c:a', 'aac', '-b:a', '64k', '-ac', '1',
+            '-movflags', '+faststart', '-y', path
+        ])
+        with open(path, 'rb') as preview:
+            return preview.read()
+
+
+def render_derivative(bucket_name, kind, source_url):
+    """
+    Render a derivative from the original at source_url.
+
+    Returns:
+        bytes: The encoded derivative
+    """
+    if bucket_name == 'images':
+        return render_image_thumbnail(source_url, THUMBNAIL_SIZE)
+    if kind == 'thumbnail':
+        return render_video_thumbnail(source_url, THUMBNAIL_SIZE)
+    return render_video_preview(source_url, PREVIEW_SECONDS, PREVIEW_HEIGHT, PREVIEW_BITRATE)
+
+
+def _init_worker():
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class DerivativePipeline:
+    """
+    Generate thumbnails and previews of stored media in a pool of worker processes.
+
+    Derivatives are generated lazily and at most once: a derivative already in
+    storage is reused, concurrent requests for the same derivative wait for a
+    single render, and results are cached so repeated requests do not reach
+    storage. Failures are cached for a short time.
+
+    Storage is accessed through the functions passed in, which return result
+    dictionaries like the ones of s3_uploader.
+
+    Worker processes are spawned fresh and only import this module, which has
+    no side effects on import. Spawned processes also re-run the main module
+    of the parent, though, so a script with setup code at module level (such
+    as app.py run directly) should set use_processes to False; renders then
+    run in threads of the parent instead.
+    """
+
+    def __init__(self, source_url, object_info, store, public_url_format, workers=DERIVATIVE_WORKERS,
+                 max_pending=DERIVATIVE_QUEUE_SIZE, timeout=DERIVATIVE_TIMEOUT, cache_size=10000,
+                 cache_ttl=24 * 60 * 60, failure_ttl=60, use_processes=True):
+        """
+        Args:
+            source_url (callable): (bucket, key) -> result with a URL the worker processes can read the original from
+            object_info (callable): (bucket, key) -> result telling whether an object exists
+            store (callable): (bucket, key, body, content_type) -> result with the public URL of the stored object
+            public_url_format (str): Format of public URLs, with {bucket} and {filename} placeholders
+            workers (int): Number of worker processes
+            max_pending (int): Renders queued or running before new ones are rejected as busy
+            timeout (float): Seconds a render may take
+            cache_size (int): Maximum number of cached results
+            cache_ttl (float): Seconds generated derivatives are cached
+            failure_ttl (float): Seconds failed generations are cached
+            use_processes (bool): Render in worker processes rather than threads
+        """
+        self.source_url = source_url
+        self.object_info = object_info
+        self.store = store
+        self.public_url_format = public_url_format
+        self.workers = workers
+        self.timeout = timeout
+        self.failure_ttl = failure_ttl
+        self.use_processes = use_processes
+        self._cache = TTLCache(max_entries=cache_size, ttl=cache_ttl)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def available_kinds(self, bucket_name):
+        """
+        Return the derivative kinds of a bucket that can be rendered with the installed tools.
+        """
+        return [kind for kind in DERIVATIVES.get(bucket_name, {}) if missing_dependency(bucket_name, kind) is None]
+
+    def get(self, bucket_name, key, kind, admit=None):
+        """
+        Return the URL of a derivative, generating it if it does not exist yet.
+
+        Args:
+            bucket_name (str): Bucket of the original
+            key (str): Object key of the original
+            kind (str): thumbnail or preview
+            admit (callable, optional): Called before a render starts; returns 0 to let it
+                start, or the seconds to wait before asking again
+
+        Returns:
+            dict: Dictionary containing success status, URL, and any error message;
+            not_found, unavailable or busy is set when the derivative cannot be generated
+            because of a missing original, a missing tool or a full queue, and
+            rate_limited with retry_after when admit refused the render
+        """
+        target = derivative_key(key, bucket_name, kind)
+        if target is None or key.endswith(_DERIVATIVE_SUFFIXES):
+            return {"success": False, "error": f"No {kind} for {bucket_name}", "not_found": True}
+
+        cache_key = (bucket_name, key, kind)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(cache_key)
+            owner = future is None
+            if owner:
+                future = self._inflight[cache_key] = Future()
+
+        if not owner:
+            # Another thread is generating the same derivative
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                return {"success": False, "error": f"Generating the {kind} timed out"}
+
+        try:
+            result = self._generate(bucket_name, key, kind, target, admit)
+        except Exception as e:
+            logger.error(f"Generating {kind} of {bucket_name}/{key} failed: {str(e)}")
+            result = {"success": False, "error": f"Generating the {kind} failed: {str(e)}"}
+
+        if not result.get("busy") and not result.get("rate_limited"):
+            self._cache.set(cache_key, result, ttl=None if result["success"] else self.failure_ttl)
+        with self._lock:
+            del self._inflight[cache_key]
+        future.set_result(result)
+        return result
+
+    def generate_all(self, bucket_name, key):
+        """
+        Generate every available derivative of an original.
+
+        Returns:
+            dict: Dictionary containing success status, URLs by kind, and errors by kind
+        """
+        urls = {}
+        errors = {}
+        for kind in self.available_kinds(bucket_name):
+            result = self.get(bucket_name, key, kind)
+            if result["success"]:
+                urls[kind] = result["url"]
+            else:
+                errors[kind] = result["error"]
+        return {"success": not errors, "urls": urls, "errors": errors}
+
+    def _generate(self, bucket_name, key, kind, target, admit=None):
+        # Derivatives are stored under fixed keys, so one generated earlier or by another worker is reused
+        existing = self.object_info(bucket_name, target)
+        if not existing["success"]:
+            return existing
+        if existing["exists"]:
+            return {"success": True, "url": self.public_url_format.format(bucket=bucket_name, filename=target)}
+
+        missing = missing_dependency(bucket_name, kind)
+        if missing:
+            return {"success": False, "error": f"Cannot generate the {kind}: {missing} is not installed", "unavailable": True}
+
+        original = self.object_info(bucket_name, key)
+        if not original["success"]:
+            return original
+        if not original["exists"]:
+            return {"success": False, "error": "Object not found", "not_found": True}
+
+        source = self.source_url(bucket_name, key)
+        if not source["success"]:
+            return source
+
+        # Only renders count against the caller's limit; existing derivatives are free
+        retry_after = admit() if admit is not None else 0
+        if retry_after:
+            return {"success": False, "error": "Too many derivatives requested", "rate_limited": True,
+                    "retry_after": retry_after}
+
+        if not self._slots.acquire(blocking=False):
+            return {"success": False, "error": "Too many derivatives being generated", "busy": True}
+        try:
+            body = self._render(bucket_name, kind, source["url"])
+        finally:
+            self._slots.release()
+
+        _, content_type = DERIVATIVES[bucket_name][kind]
+        stored = self.store(bucket_name, target, body, content_type)
+        if stored["success"]:
+            logger.info(f"Generated {kind} of {bucket_name}/{key} ({len(body)} bytes)")
+        return stored
+
+    def _render(self, bucket_name, kind, source_url):
+        with self._lock:
+            if self._executor is None and self.use_processes:
+                # Fresh interpreters instead of forks of this multi-threaded process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+            elif self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='derivative-render')
+            executor = self._executor
+
+        future = executor.submit(render_derivative, bucket_name, kind, source_url)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Rendering took longer than {self.timeout} seconds")
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a new pool for the next render
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Level of the root logger (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# 'json' writes one JSON object per line, 'text' a human-readable line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Records waiting for the writer thread; further records are dropped while it is full
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Per-request log lines: fraction that is logged and upper bound per second (0 = unlimited).
+# Failed and slow requests are logged at WARNING and always pass.
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "1.0"))
+LOG_REQUEST_RATE_LIMIT = int(os.getenv("LOG_REQUEST_RATE_LIMIT", "100"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as single-line JSON objects, including fields passed with extra=.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z'
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that drops records instead of blocking when the queue is full.
+
+    Records are queued as they are and formatted by the writer thread, so
+    the logging thread pays neither for the message nor for the traceback.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # QueueHandler.prepare() formats the message and drops exc_info and args,
+        # which only matters when records cross a process boundary
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestLogSampler(logging.Filter):
+    """
+    Let through a sample of INFO records, at most max_per_second of them.
+
+    Records at WARNING and above always pass.
+    """
+
+    def __init__(self, sample_rate=LOG_REQUEST_SAMPLE_RATE, max_per_second=LOG_REQUEST_RATE_LIMIT):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._window = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.max_per_second:
+            window = int(time.monotonic())
+            with self._lock:
+                if window != self._window:
+                    self._window = window
+                    self._count = 0
+                if self._count >= self.max_per_second:
+                    return False
+                self._count += 1
+        return True
+
+
+_listener = None
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None, queue_size=LOG_QUEUE_SIZE):
+    """
+    Route all logging through a queue to a background writer thread.
+
+    Handlers already installed on the root logger are replaced, so calling
+    this again reconfigures logging.
+
+    Args:
+        level (str or int): Level of the root logger
+        fmt (str): 'json' or 'text'
+        stream: Stream the writer thread writes to, defaults to stderr
+        queue_size (int): Maximum number of records waiting to be written
+
+    Returns:
+        QueueListener: The running writer
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """
+    Write out all queued records and stop the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
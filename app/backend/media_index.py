@@ -0,0 +1,78 @@
+import os
+import time
+import sqlite3
+import threading
+
+# SQLite database mapping content hashes to stored objects
+MEDIA_INDEX_DB = os.getenv(
+    "MEDIA_INDEX_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media_index.db')
+)
+
+
+class MediaIndex:
+    """
+    Persistent index of stored media by SHA-256 of their content.
+
+    Entries are scoped to a bucket, so the same bytes uploaded as audio and as
+    video are stored once per bucket.
+    """
+
+    def __init__(self, path=MEDIA_INDEX_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS media_objects (
+                sha256 TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                object_key TEXT NOT NULL,
+                url TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (sha256, bucket)
+            );
+            CREATE INDEX IF NOT EXISTS media_objects_key ON media_objects (bucket, object_key);
+        """)
+
+    def lookup(self, sha256, bucket):
+        """
+        Return the stored object with the given content hash in a bucket, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM media_objects WHERE sha256 = ? AND bucket = ?", (sha256, bucket)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def add(self, sha256, bucket, object_key, url, size):
+        """
+        Record a stored object. An existing entry for the same content is kept.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO media_objects VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, bucket, object_key, url, size, time.time())
+            )
+
+    def remove(self, bucket, object_key):
+        """
+        Drop the entries pointing at an object.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM media_objects WHERE bucket = ? AND object_key = ?", (bucket, object_key)
+            )
+
+    def keys(self, bucket):
+        """
+        Return the set of object keys indexed for a bucket.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT object_key FROM media_objects WHERE bucket = ?", (bucket,)
+            ).fetchall()
+        return {row['object_key'] for row in rows}
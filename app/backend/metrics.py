@@ -0,0 +1,299 @@
+import abc
+import math
+import bisect
+import threading
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _ThreadShards:
+    """
+    Per-thread dictionaries of metric values.
+
+    Every thread only ever writes its own shard, so recording a value needs
+    no lock; collecting sums all shards. Shards of threads that have exited
+    are folded into one retired shard, so short-lived request threads do not
+    pile up.
+    """
+
+    def __init__(self, merge):
+        self._merge = merge
+        self._local = threading.local()
+        self._shards = []  # (thread, shard)
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) % 64 == 0:
+                    self._retire_exited()
+            return shard
+
+    def collect(self):
+        """
+        Return the values of all threads merged into one dictionary.
+        """
+        with self._lock:
+            self._retire_exited()
+            merged = {}
+            for shard in [self._retired] + [shard for _, shard in self._shards]:
+                # Copy first: the owning thread may add keys meanwhile
+                for key, value in list(shard.items()):
+                    merged[key] = self._merge(merged.get(key), value)
+            return merged
+
+    def _retire_exited(self):
+        # Called with the lock held
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                for key, value in shard.items():
+                    self._retired[key] = self._merge(self._retired.get(key), value)
+        self._shards = alive
+
+
+def _add(total, value):
+    return value if total is None else total + value
+
+
+def _add_lists(total, values):
+    return list(values) if total is None else [a + b for a, b in zip(total, values)]
+
+
+class _Metric(abc.ABC):
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        """
+        Return the child metric for one combination of label values.
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._children_lock:
+                child = self._children.setdefault(key, self._child(key))
+        return child
+
+    @abc.abstractmethod
+    def _child(self, key):
+        """
+        Create the child metric for one combination of label values.
+        """
+
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    @abc.abstractmethod
+    def samples(self):
+        """
+        Return (suffix, labels, value) tuples of the current values.
+        """
+
+
+class _CounterChild:
+    def __init__(self, shards, key):
+        self._shards = shards
+        self._key = key
+
+    def inc(self, amount=1):
+        shard = self._shards.get()
+        shard[self._key] = shard.get(self._key, 0) + amount
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, e.g. of requests or bytes.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self._shards = _ThreadShards(_add)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self, key):
+        return _CounterChild(self._shards, key)
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def samples(self):
+        return [('', key, value) for key, value in sorted(self._shards.collect().items())]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def track_inprogress(self):
+        return _InProgress(self)
+
+
+class _InProgress:
+    def __init__(self, gauge):
+        self._gauge = gauge
+
+    def __enter__(self):
+        self._gauge.inc()
+
+    def __exit__(self, *exc_info):
+        self._gauge.dec()
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down.
+
+    Gauges are changed with inc() and dec() only, which keeps them lock-free.
+    A gauge whose value is read from elsewhere, e.g. a pool's stats(), is
+    created with set_function() instead.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self._function = None
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self, key):
+        return _GaugeChild(self._shards, key)
+
+    def dec(self, amount=1):
+        self._unlabelled().dec(amount)
+
+    def track_inprogress(self):
+        """
+        Return a context manager that increments the gauge while it is entered.
+        """
+        return self._unlabelled().track_inprogress()
+
+    def set_function(self, function):
+        """
+        Report the return value of function at collection time.
+        """
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            return [('', (), self._function())]
+        return super().samples()
+
+
+class _HistogramChild:
+    def __init__(self, shards, key, buckets):
+        self._shards = shards
+        self._key = key
+        self._buckets = buckets
+
+    def observe(self, value):
+        shard = self._shards.get()
+        counts = shard.get(self._key)
+        if counts is None:
+            # One count per bucket plus +Inf, followed by the sum of observations
+            counts = shard[self._key] = [0] * (len(self._buckets) + 2)
+        counts[bisect.bisect_left(self._buckets, value)] += 1
+        counts[-1] += value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. request durations.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards(_add_lists)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self, key):
+        return _HistogramChild(self._shards, key, self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def samples(self):
+        samples = []
+        for key, counts in sorted(self._shards.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(('_bucket', key + (_format_value(bound),), cumulative))
+            samples.append(('_sum', key, counts[-1]))
+            samples.append(('_count', key, cumulative))
+        return samples
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def expose(self):
+        """
+        Return the current value of every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation, quotes=False)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            labelnames = metric.labelnames + (('le',) if metric.type == 'histogram' else ())
+            for suffix, values, value in metric.samples():
+                names = labelnames if suffix == '_bucket' else metric.labelnames
+                labels = ','.join(f'{name}="{_escape(label)}"' for name, label in zip(names, values))
+                lines.append(f"{metric.name}{suffix}{{{labels}}} {_format_value(value)}" if labels
+                             else f"{metric.name}{suffix} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value, quotes=True):
+    value = value.replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+# Registry exposed at /metrics
+REGISTRY = Registry()
@@ -0,0 +1,47 @@
+import time
+import math
+import threading
+
+from ttl_cache import TTLCache
+
+
+class RateLimiter:
+    """
+    Allow each key at most limit events per period seconds.
+
+    Events are counted in fixed windows of period seconds. Counters live in
+    an LRU cache, so memory stays bounded however many keys show up; a key
+    evicted from it simply starts a fresh window.
+    """
+
+    def __init__(self, limit, period=60.0, max_keys=10000):
+        """
+        Args:
+            limit (int): Events allowed per key and window; 0 disables the limit
+            period (float): Length of a window in seconds
+            max_keys (int): Maximum number of keys tracked at once
+        """
+        self.limit = limit
+        self.period = period
+        self._windows = TTLCache(max_entries=max_keys, ttl=period)
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Count an event of a key.
+
+        Returns:
+            int: 0 if the event is allowed, otherwise the seconds until the key's window ends
+        """
+        if not self.limit:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or window[0] <= now:
+                window = [now + self.period, 0]
+                self._windows.set(key, window)
+            if window[1] >= self.limit:
+                return max(math.ceil(window[0] - now), 1)
+            window[1] += 1
+        return 0
@@ -0,0 +1,418 @@
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import httpx
+from gotrue.errors import AuthRetryableError
+from postgrest.exceptions import APIError
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Longest time a request may spend calling Supabase, in seconds from its first call
+# (so the time taken to receive an upload does not count); calls made after it
+# has passed fail right away instead of holding the worker
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "30"))
+
+# Total time a request may spend backing off between retries, over all of its
+# calls, in seconds; once it is spent, failed calls are reported right away
+REQUEST_RETRY_BUDGET = float(os.getenv("REQUEST_RETRY_BUDGET", "1"))
+
+# Longest single call to Supabase, in seconds
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+# Calls to each Supabase service running at the same time; further calls are
+# rejected right away instead of queueing behind a slow service
+SUPABASE_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "32"))
+
+# Attempts per call, and the jittered exponential backoff between them in seconds
+SUPABASE_RETRY_ATTEMPTS = int(os.getenv("SUPABASE_RETRY_ATTEMPTS", "3"))
+SUPABASE_RETRY_BASE_DELAY = float(os.getenv("SUPABASE_RETRY_BASE_DELAY", "0.1"))
+SUPABASE_RETRY_MAX_DELAY = float(os.getenv("SUPABASE_RETRY_MAX_DELAY", "1"))
+
+# Consecutive failures that open a service's circuit, and how long it stays open in seconds
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Send a second copy of a read that has not answered after this many seconds (0 disables)
+SUPABASE_HEDGE_DELAY = float(os.getenv("SUPABASE_HEDGE_DELAY", "0"))
+
+# Dependency metrics, exposed at /metrics
+dependency_calls = Counter(
+    'dynocollect_dependency_calls_total', 'Calls to upstream services by outcome', ('dependency', 'outcome')
+)
+dependency_call_seconds = Histogram(
+    'dynocollect_dependency_call_duration_seconds', 'Duration of calls to upstream services', ('dependency',)
+)
+circuits_open = Gauge('dynocollect_circuit_open', 'Whether the circuit of an upstream service is open', ('dependency',))
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DependencyUnavailable(Exception):
+    """Raised when a call to an upstream service is not made or not finished; retry after retry_after seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(DependencyUnavailable):
+    """Raised when a service's circuit is open after repeated failures."""
+
+
+class DependencyBusy(DependencyUnavailable):
+    """Raised when all call slots of a service are taken."""
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    """Raised when a call cannot finish before the deadline."""
+
+
+class DependencyFailed(DependencyUnavailable):
+    """Raised when a service kept failing for every attempt of a call; the last error is its __cause__."""
+
+
+class OutcomeUnknown(Exception):
+    """
+    Raised when a call that must not be repeated failed or timed out after it reached the service.
+
+    The call may still take effect, so unlike DependencyUnavailable this does
+    not invite a retry; the last error, if any, is its __cause__.
+    """
+
+
+class _Deadline:
+    def __init__(self, seconds, started=True, retry_budget=REQUEST_RETRY_BUDGET):
+        self.seconds = seconds
+        self.until = time.monotonic() + seconds if started else None
+        self.retry_budget = retry_budget
+
+    def remaining(self):
+        if self.until is None:
+            # Deadlines started lazily run from the first time they are checked
+            self.until = time.monotonic() + self.seconds
+        return self.until - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Bound the time that calls made in this block may take, together.
+
+    A nested deadline can only shorten an enclosing one.
+    """
+    enclosing = _deadline.get()
+    if enclosing is None:
+        current = _Deadline(seconds)
+    else:
+        current = _Deadline(min(seconds, enclosing.remaining()), retry_budget=enclosing.retry_budget)
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def start_deadline(seconds, lazy=False):
+    """
+    Start a deadline that lasts until end_deadline() is called with the returned token.
+
+    Args:
+        seconds (float): Length of the deadline
+        lazy (bool): Start counting at the first call made under the deadline rather than now
+    """
+    return _deadline.set(_Deadline(seconds, started=not lazy))
+
+
+def end_deadline(token):
+    _deadline.reset(token)
+
+
+def time_remaining():
+    """
+    Return the seconds left until the current deadline, or None if there is none.
+    """
+    current = _deadline.get()
+    return None if current is None else current.remaining()
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def _take_backoff(delay):
+    """
+    Charge a backoff to the current deadline's retry budget.
+
+    Returns:
+        float: Seconds to sleep, at most delay, or None if the budget is spent or
+        the deadline would pass; without a deadline, delay itself
+    """
+    current = _deadline.get()
+    if current is None:
+        return delay
+    delay = min(delay, current.retry_budget)
+    if current.retry_budget <= 0 or current.remaining() <= delay:
+        return None
+    current.retry_budget -= delay
+    return delay
+
+
+def supabase_error_kind(error):
+    """
+    Tell whether an error of the Supabase client means the service is failing.
+
+    Returns:
+        str: 'unsent' if the request never reached the service (safe to retry
+        any call), 'transient' if the service failed while handling it (safe to
+        retry reads), or None if the service answered, e.g. with a 4xx error
+    """
+    # The Auth client wraps network errors in AuthRetryableError
+    if isinstance(error, AuthRetryableError) and isinstance(error.__context__, httpx.TransportError):
+        error = error.__context__
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return 'unsent'
+    if isinstance(error, (httpx.TransportError, AuthRetryableError)):
+        return 'transient'
+    if isinstance(error, APIError):
+        # PostgREST errors carry the HTTP status when the body was not JSON
+        status = str(error.code)
+        if status in ('429', '503'):
+            return 'unsent'
+        if status in ('500', '502', '504'):
+            return 'transient'
+    return None
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a service keeps failing.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected for reset_timeout seconds. Then one trial call is let
+    through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpen: If the circuit is open, or half open with its trial call running
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpen(f"{self.name} is unavailable", retry_after=max(1, round(remaining)))
+            self._trial_running = True
+
+    def release_trial(self):
+        """
+        Let another call be the trial call when the current one was not made.
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.opened_at is not None:
+                self.opened_at = None
+                circuits_open.labels(self.name).dec()
+                logger.info(f"Circuit of {self.name} closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            reopen = self._trial_running
+            self._trial_running = False
+            if reopen or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    circuits_open.labels(self.name).inc()
+                self.opened_at = time.monotonic()
+                logger.warning(f"Circuit of {self.name} opened after {self.failures} failures")
+
+
+class Dependency:
+    """
+    Make calls to one upstream service under a shared policy.
+
+    Every call runs on the service's own pool of at most max_concurrent
+    threads, so the calling thread stops waiting once the call's timeout or
+    the current deadline has passed, and a slow service cannot tie up more
+    than max_concurrent threads; further calls fail right away. Failures
+    are retried with jittered backoff within the deadline and its retry
+    budget, and feed a CircuitBreaker that rejects calls while the service
+    keeps failing.
+
+    A call that is not idempotent and fails or times out after reaching the
+    service raises OutcomeUnknown rather than DependencyUnavailable, since
+    it may still take effect and must not be retried blindly.
+    """
+
+    def __init__(self, name, classify=supabase_error_kind, timeout=SUPABASE_TIMEOUT,
+                 max_concurrent=SUPABASE_MAX_CONCURRENCY, attempts=SUPABASE_RETRY_ATTEMPTS,
+                 base_delay=SUPABASE_RETRY_BASE_DELAY, max_delay=SUPABASE_RETRY_MAX_DELAY,
+                 hedge_delay=SUPABASE_HEDGE_DELAY, breaker=None):
+        """
+        Args:
+            name (str): Name of the service in logs and metrics
+            classify (callable): Returns 'unsent', 'transient' or None for an error, see supabase_error_kind()
+            timeout (float): Longest single call in seconds
+            max_concurrent (int): Calls running at the same time
+            attempts (int): Attempts per call
+            base_delay (float): Backoff before the second attempt, doubled for every further one
+            max_delay (float): Longest backoff
+            hedge_delay (float): Seconds after which a hedged call is sent a second time (0 disables)
+            breaker (CircuitBreaker, optional): Breaker of the service
+        """
+        self.name = name
+        self.classify = classify
+        self.timeout = timeout
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker(name)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f'{name}-call')
+
+    def call(self, function, *args, idempotent=True, hedge=False, **kwargs):
+        """
+        Call function(*args, **kwargs) against the service.
+
+        Args:
+            function (callable): Makes the request, e.g. a Supabase client method
+            idempotent (bool): Whether the call may be repeated after the service failed
+                while handling it; calls that are not are only retried when the request
+                never reached the service
+            hedge (bool): Send a second copy of an idempotent call that has not answered
+                after hedge_delay seconds, and use whichever answers first
+
+        Returns:
+            The return value of function
+
+        Raises:
+            DependencyUnavailable: If the circuit is open, all call slots are taken, the deadline
+                passed, or the service failed on every attempt
+            OutcomeUnknown: If a call that is not idempotent failed or timed out after reaching the service
+            Exception: The error of the call if the service answered with one, e.g. a 4xx error
+        """
+        for attempt in range(self.attempts):
+            try:
+                self.breaker.before_call()
+            except CircuitOpen:
+                dependency_calls.labels(self.name, 'rejected').inc()
+                raise
+            try:
+                result = self._attempt(function, args, kwargs, self._time_left(), hedge and idempotent, idempotent)
+            except (DeadlineExceeded, OutcomeUnknown):
+                self.breaker.record_failure()
+                dependency_calls.labels(self.name, 'timeout').inc()
+                raise
+            except DependencyBusy:
+                self.breaker.release_trial()
+                dependency_calls.labels(self.name, 'rejected').inc()
+                raise
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None:
+                    # The service answered; the call itself was wrong
+                    self.breaker.record_success()
+                    dependency_calls.labels(self.name, 'error').inc()
+                    raise
+                self.breaker.record_failure()
+                dependency_calls.labels(self.name, 'failure').inc()
+                if kind == 'transient' and not idempotent:
+                    raise OutcomeUnknown(f"{self.name} failed while handling the call: {str(e)}") from e
+                delay = None
+                if attempt + 1 < self.attempts:
+                    delay = _take_backoff(backoff_delay(attempt, self.base_delay, self.max_delay))
+                if delay is None:
+                    raise DependencyFailed(f"{self.name} failed: {str(e)}") from e
+                logger.warning(f"Call to {self.name} failed, retrying in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            dependency_calls.labels(self.name, 'success').inc()
+            return result
+
+    def _time_left(self):
+        remaining = time_remaining()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise DeadlineExceeded(f"No time left to call {self.name}")
+        return min(self.timeout, remaining)
+
+    def _submit(self, function, args, kwargs):
+        if not self._slots.acquire(blocking=False):
+            return None
+        start = time.perf_counter()
+
+        def run():
+            try:
+                return function(*args, **kwargs)
+            finally:
+                dependency_call_seconds.labels(self.name).observe(time.perf_counter() - start)
+                self._slots.release()
+
+        return self._executor.submit(run)
+
+    def _attempt(self, function, args, kwargs, timeout, hedge, idempotent=True):
+        until = time.monotonic() + timeout
+        first = self._submit(function, args, kwargs)
+        if first is None:
+            raise DependencyBusy(f"Too many calls to {self.name} in progress")
+        pending = {first}
+
+        if hedge and self.hedge_delay and self.hedge_delay < timeout:
+            done, _ = wait(pending, timeout=self.hedge_delay)
+            if not done:
+                second = self._submit(function, args, kwargs)
+                if second is not None:
+                    dependency_calls.labels(self.name, 'hedged').inc()
+                    pending.add(second)
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, until - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                # The call keeps its slot until it returns, which bounds the threads a slow service can hold
+                if not idempotent:
+                    # ...and may still take effect, so the caller must not be told to retry it
+                    raise OutcomeUnknown(f"{self.name} did not answer within {timeout:.1f}s")
+                raise DeadlineExceeded(f"{self.name} did not answer within {timeout:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
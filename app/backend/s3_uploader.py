@@ -1,13 +1,29 @@
+import io
 import os
+import json
+import time
 import boto3
 import logging
+import math
+import threading
+import statistics
 import uuid
+import atexit
+import hashlib
 import warnings
 import urllib3
 import requests
+from collections import deque
+from concurrent.futures import wait, TimeoutError as FutureTimeoutError
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from supabase import create_client
+from media_index import MediaIndex
+from db_batcher import InsertBatcher, BatcherFull
+from transfer_scheduler import TransferScheduler, SchedulerBusy
+from metrics import Counter, Gauge, Histogram
+from storage_encoding import flac_encodable, encode_flac
+from resilience import Dependency, DependencyUnavailable
 
 # Suppress SSL verification warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -30,9 +46,22 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# S3 configuration
-S3_ENDPOINT = "https://gxzsxowfeztwrtidfdru.storage.supabase.co/storage/v1/s3"
-S3_REGION = "ap-south-1"
+# Calls to PostgREST go through a shared timeout, retry and circuit breaker policy
+supabase_db = Dependency('postgrest')
+
+# Coalesce contributions inserts into bulk inserts. In 'sync' mode each caller
+# still waits for its row; in 'async' mode callers return as soon as the row is queued.
+DB_BATCH_INSERTS = os.getenv("DB_BATCH_INSERTS", "false").lower() in ("1", "true", "yes")
+DB_BATCH_MODE = os.getenv("DB_BATCH_MODE", "sync").lower()
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "100"))
+DB_BATCH_DELAY = float(os.getenv("DB_BATCH_DELAY", "0.05"))
+DB_BATCH_QUEUE_SIZE = int(os.getenv("DB_BATCH_QUEUE_SIZE", "10000"))
+DB_INSERT_TIMEOUT = 30  # seconds a caller waits for its row in sync mode
+METADATA_MERGE_ATTEMPTS = 5  # tries to merge into metadata that other writers keep changing
+
+# S3 configuration; the endpoint can point at any S3-compatible server, e.g. benchmarks/fake_s3.py
+S3_ENDPOINT = os.getenv("S3_ENDPOINT", "https://gxzsxowfeztwrtidfdru.storage.supabase.co/storage/v1/s3")
+S3_REGION = os.getenv("S3_REGION", "ap-south-1")
 S3_ACCESS_KEY = os.getenv("SUPABASE_S3_KEY", "2d7d13dc7201b58ef2f9a4f028eb6ea4")
 S3_SECRET_KEY = os.getenv("SUPABASE_S3_SECRET", "447f36651ef7bb1bf4bf38205f1c4e2b6dfe77da574c1ded4caeb9ba36e1c83d")
 
@@ -40,35 +69,82 @@ S3_SECRET_KEY = os.getenv("SUPABASE_S3_SECRET", "447f36651ef7bb1bf4bf38205f1c4e2
 VALID_BUCKETS = ["video", "audio", "images"]
 
 # Public URL format
-PUBLIC_URL_FORMAT = "https://gxzsxowfeztwrtidfdru.storage.supabase.co/storage/v1/object/public/{bucket}/{filename}"
+PUBLIC_URL_FORMAT = os.getenv(
+    "PUBLIC_URL_FORMAT",
+    "https://gxzsxowfeztwrtidfdru.storage.supabase.co/storage/v1/object/public/{bucket}/{filename}"
+)
 
+# Multipart limits of the storage provider. S3 requires every part except the
+# last to be at least 5MB and allows at most 10,000 parts per upload.
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_PART_SIZE = int(os.getenv("S3_MAX_PART_SIZE", str(64 * 1024 * 1024)))
+S3_MAX_PARTS = 10000
 
-def get_s3_client():
+# Upper bound for parallel part uploads chosen by the transfer tuner
+TRANSFER_MAX_CONCURRENCY = int(os.getenv("TRANSFER_MAX_CONCURRENCY", "16"))
+
+# Process-wide limits of the transfer scheduler that runs every upload to storage:
+# worker threads (parallel storage requests), bytes of queued and running requests,
+# open uploads, and how long a new upload waits for capacity before it is rejected
+TRANSFER_WORKERS = int(os.getenv("TRANSFER_WORKERS", "32"))
+TRANSFER_MAX_INFLIGHT_BYTES = int(os.getenv("TRANSFER_MAX_INFLIGHT_BYTES", str(256 * 1024 * 1024)))
+TRANSFER_MAX_UPLOADS = int(os.getenv("TRANSFER_MAX_UPLOADS", "64"))
+TRANSFER_ADMISSION_TIMEOUT = float(os.getenv("TRANSFER_ADMISSION_TIMEOUT", "10"))
+# How long a request of an admitted upload waits for room in the byte budget before it is rejected
+TRANSFER_SUBMIT_TIMEOUT = float(os.getenv("TRANSFER_SUBMIT_TIMEOUT", "60"))
+
+# Resumable uploads keep one scheduler transfer across their part requests; a
+# transfer with no part for this many seconds gives its slot back
+RESUMABLE_TRANSFER_IDLE = 60
+
+# Parallel storage requests of one batch upload
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "16"))
+
+# Validity of presigned upload URLs in seconds
+PRESIGNED_URL_EXPIRY = int(os.getenv("PRESIGNED_URL_EXPIRY", "3600"))
+
+# Reuse stored objects with identical content instead of uploading them again
+MEDIA_DEDUP = os.getenv("MEDIA_DEDUP", "true").lower() in ("1", "true", "yes")
+HASH_CHUNK_SIZE = 1024 * 1024  # Read files in 1MB chunks while hashing
+
+
+# Connection pool size of the shared S3 client. Should be at least TRANSFER_WORKERS
+# plus the requests made outside the transfer scheduler.
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+
+# Error codes that indicate the S3 credentials are no longer valid
+S3_AUTH_ERROR_CODES = {"InvalidAccessKeyId", "SignatureDoesNotMatch", "ExpiredToken", "InvalidToken"}
+
+# Process-wide S3 client, created lazily and shared across threads
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def _create_s3_client():
     """
-    Create and return a boto3 S3 client configured for Supabase Storage.
+    Create a boto3 S3 client configured for Supabase Storage.
+
+    Credentials are read from the environment on every call so that a
+    refreshed client picks up rotated keys.
     """
     try:
         # Create a custom session with SSL verification disabled
         session = boto3.session.Session()
         
-        # Set environment variable to disable SSL verification
-        # This affects the underlying requests library used by boto3
-        import os
-        os.environ['PYTHONHTTPSVERIFY'] = '0'
-        
         # Create S3 client with SSL verification disabled
         s3_client = session.client(
             's3',
             endpoint_url=S3_ENDPOINT,
             region_name=S3_REGION,
-            aws_access_key_id=S3_ACCESS_KEY,
-            aws_secret_access_key=S3_SECRET_KEY,
+            aws_access_key_id=os.getenv("SUPABASE_S3_KEY", S3_ACCESS_KEY),
+            aws_secret_access_key=os.getenv("SUPABASE_S3_SECRET", S3_SECRET_KEY),
             verify=False,  # Disable SSL verification to fix SSL validation errors
             config=boto3.session.Config(
                 signature_version='s3v4',
                 # Significantly increased timeouts for large files
                 connect_timeout=60,               # 60 seconds to establish connection
                 read_timeout=900,                 # 15 minutes to read data
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,  # Shared by all upload threads
+                tcp_keepalive=True,               # Keep pooled connections alive between uploads
                 retries={
                     'max_attempts': 15,           # More retry attempts
                     'mode': 'adaptive',           # Adaptive retry mode
@@ -82,6 +158,465 @@ def get_s3_client():
         raise
 
 
+def get_s3_client():
+    """
+    Return the shared boto3 S3 client for Supabase Storage.
+
+    The client is created on first use and reused afterwards. boto3 clients are
+    thread-safe, so every upload shares one connection pool instead of paying
+    for credential resolution and new TLS handshakes per request.
+    """
+    global _s3_client
+    s3_client = _s3_client
+    if s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = _create_s3_client()
+            s3_client = _s3_client
+    return s3_client
+
+
+def refresh_s3_client():
+    """
+    Replace the shared S3 client with a new one built from the current credentials.
+
+    Returns:
+        The newly created boto3 S3 client
+    """
+    global _s3_client
+    s3_client = _create_s3_client()
+    with _s3_client_lock:
+        _s3_client = s3_client
+    logger.info("S3 client refreshed")
+    return s3_client
+
+
+def _refresh_on_auth_error(error):
+    """
+    Refresh the shared S3 client if a ClientError was caused by invalid credentials.
+    """
+    error_code = error.response.get('Error', {}).get('Code')
+    if error_code in S3_AUTH_ERROR_CODES:
+        logger.warning(f"S3 credentials rejected ({error_code}), refreshing client")
+        try:
+            refresh_s3_client()
+        except Exception:
+            # get_s3_client() will surface the error on the next upload
+            pass
+
+
+def check_s3_health(bucket_name="images"):
+    """
+    Check that the shared S3 client can reach Supabase Storage.
+
+    If the request is rejected because of invalid credentials, the client is
+    refreshed once and the check is retried, so rotated keys are picked up
+    without restarting the process.
+    
+    Args:
+        bucket_name (str): Bucket used for the check (video, audio, or images)
+        
+    Returns:
+        dict: Dictionary containing success status, latency, and any error message
+    """
+    start_time = time.time()
+    try:
+        try:
+            get_s3_client().head_bucket(Bucket=bucket_name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in S3_AUTH_ERROR_CODES:
+                raise
+            refresh_s3_client().head_bucket(Bucket=bucket_name)
+        
+        return {
+            "success": True,
+            "latency_seconds": time.time() - start_time
+        }
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"S3 health check failed: {error_message}")
+        return {
+            "success": False,
+            "error": error_message
+        }
+
+
+class TransferTuner:
+    """
+    Choose multipart part size and concurrency for uploads.
+    
+    Every finished upload reports its throughput with record(). The tuner keeps
+    the most recent samples and the median throughput reached at each
+    concurrency level. It settles on the best level, probing the next higher
+    level while the best one is also the highest tried. Part sizes are chosen so
+    that one part takes about target_part_seconds at the measured per-connection
+    throughput, within the provider's part size and part count limits.
+    """
+
+    # Uploads smaller than this are dominated by latency and are not recorded
+    MIN_SAMPLE_SIZE = 1024 * 1024
+
+    def __init__(self, window=50, target_part_seconds=2.0, default_concurrency=4,
+                 default_stream_speed=2 * 1024 * 1024, max_concurrency=TRANSFER_MAX_CONCURRENCY):
+        """
+        Args:
+            window (int): Number of recent uploads kept for tuning
+            target_part_seconds (float): Desired upload time of a single part
+            default_concurrency (int): Concurrency used before any upload was measured
+            default_stream_speed (int): Assumed bytes/second per connection before any upload was measured
+            max_concurrency (int): Upper bound for the chosen concurrency
+        """
+        self.target_part_seconds = target_part_seconds
+        self.default_concurrency = min(default_concurrency, max_concurrency)
+        self.default_stream_speed = default_stream_speed
+        self.max_concurrency = max_concurrency
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, size_bytes, upload_seconds, concurrency):
+        """
+        Record the outcome of an upload.
+        
+        Args:
+            size_bytes (int): Number of bytes uploaded
+            upload_seconds (float): Wall-clock duration of the upload
+            concurrency (int): Number of parts that were uploaded in parallel
+        """
+        if size_bytes < self.MIN_SAMPLE_SIZE or upload_seconds <= 0:
+            return
+        with self._lock:
+            self._samples.append((max(1, concurrency), size_bytes / upload_seconds))
+
+    def _throughput_by_concurrency(self):
+        with self._lock:
+            samples = list(self._samples)
+        speeds = {}
+        for concurrency, speed in samples:
+            speeds.setdefault(concurrency, []).append(speed)
+        return {concurrency: statistics.median(values) for concurrency, values in speeds.items()}
+
+    def choose(self, file_size):
+        """
+        Choose transfer parameters for an upload.
+        
+        Args:
+            file_size (int): Size of the file in bytes, or None if unknown
+            
+        Returns:
+            dict: part_size_bytes, max_concurrency and part_count (None if the size is unknown)
+        """
+        throughput = self._throughput_by_concurrency()
+        if throughput:
+            concurrency = max(throughput, key=throughput.get)
+            stream_speed = throughput[concurrency] / concurrency
+            # Probe a higher level while the best one is also the highest tried
+            if concurrency == max(throughput) and concurrency < self.max_concurrency:
+                concurrency = min(concurrency * 2, self.max_concurrency)
+        else:
+            concurrency = self.default_concurrency
+            stream_speed = self.default_stream_speed
+
+        part_size = int(stream_speed * self.target_part_seconds)
+        if file_size:
+            # Split small files into enough parts to keep every connection busy
+            part_size = min(part_size, math.ceil(file_size / concurrency))
+            # Never exceed the provider's part count limit
+            part_size = max(part_size, math.ceil(file_size / S3_MAX_PARTS))
+
+        # Round up to a whole MB and stay within the provider's part size limits
+        part_size = math.ceil(part_size / (1024 * 1024)) * 1024 * 1024
+        part_size = max(S3_MIN_PART_SIZE, min(part_size, S3_MAX_PART_SIZE))
+
+        part_count = math.ceil(file_size / part_size) if file_size else None
+        if part_count:
+            concurrency = min(concurrency, part_count)
+
+        return {
+            "part_size_bytes": part_size,
+            "max_concurrency": concurrency,
+            "part_count": part_count
+        }
+
+
+# Process-wide tuner fed by every upload
+transfer_tuner = TransferTuner()
+
+# Process-wide scheduler running the storage requests of every upload
+transfer_scheduler = TransferScheduler(
+    max_workers=TRANSFER_WORKERS,
+    max_inflight_bytes=TRANSFER_MAX_INFLIGHT_BYTES,
+    max_transfers=TRANSFER_MAX_UPLOADS,
+    admission_timeout=TRANSFER_ADMISSION_TIMEOUT,
+    submit_timeout=TRANSFER_SUBMIT_TIMEOUT
+)
+
+# Open transfers of resumable uploads: upload id -> [transfer, last use]
+_part_transfers = {}
+_part_transfers_lock = threading.Lock()
+
+# Storage metrics, exposed at /metrics
+storage_bytes_sent = Counter(
+    'dynocollect_storage_bytes_sent_total', 'Bytes uploaded to storage', ('bucket',)
+)
+storage_request_seconds = Histogram(
+    'dynocollect_storage_request_duration_seconds', 'Duration of storage requests', ('operation',)
+)
+storage_request_errors = Counter(
+    'dynocollect_storage_request_errors_total', 'Storage requests that failed after all retries', ('operation',)
+)
+storage_retries = Counter(
+    'dynocollect_storage_retries_total', 'Storage request attempts retried by the S3 client', ('operation',)
+)
+uploads_total = Counter(
+    'dynocollect_uploads_total', 'Finished uploads, stored or deduplicated', ('bucket', 'result')
+)
+upload_seconds = Histogram(
+    'dynocollect_upload_duration_seconds', 'Duration of stored uploads', ('bucket',)
+)
+upload_throughput = Histogram(
+    'dynocollect_upload_throughput_bytes_per_second', 'Throughput of stored uploads', ('bucket',),
+    buckets=tuple(mb * 1024 * 1024 for mb in (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500))
+)
+for _field, _documentation in (
+    ('workers', 'Worker threads of the transfer scheduler'),
+    ('busy_workers', 'Transfer scheduler workers running a storage request'),
+    ('open_transfers', 'Uploads admitted by the transfer scheduler'),
+    ('inflight_bytes', 'Bytes of queued and running storage requests'),
+    ('max_inflight_bytes', 'Byte budget of the transfer scheduler')
+):
+    Gauge(f'dynocollect_transfer_{_field}', _documentation).set_function(
+        lambda field=_field: transfer_scheduler.stats()[field]
+    )
+
+
+def _storage_request(operation, bucket_name, size, call, **kwargs):
+    """
+    Make a storage request and record its duration, retries and bytes sent.
+    
+    Args:
+        operation (str): Name of the S3 operation, used as metric label
+        bucket_name (str): Name of the bucket
+        size (int): Bytes in the request body
+        call (callable): S3 client method called with kwargs
+        
+    Returns:
+        dict: The S3 response
+    """
+    start = time.perf_counter()
+    try:
+        response = call(**kwargs)
+    except Exception as e:
+        storage_request_errors.labels(operation).inc()
+        response = getattr(e, 'response', None) or {}
+        retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries:
+            storage_retries.labels(operation).inc(retries)
+        raise
+    storage_request_seconds.labels(operation).observe(time.perf_counter() - start)
+    retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    if retries:
+        storage_retries.labels(operation).inc(retries)
+    if size:
+        storage_bytes_sent.labels(bucket_name).inc(size)
+    return response
+
+
+def _observe_upload(bucket_name, size_bytes, upload_time):
+    uploads_total.labels(bucket_name, 'stored').inc()
+    upload_seconds.labels(bucket_name).observe(upload_time)
+    if upload_time > 0:
+        upload_throughput.labels(bucket_name).observe(size_bytes / upload_time)
+
+
+# Content hash -> stored object index used for deduplication
+media_index = MediaIndex() if MEDIA_DEDUP else None
+
+
+def _hash_fileobj(file_obj):
+    """
+    Return the SHA-256 hex digest of a file-like object from its current position.
+    
+    The position is restored afterwards so the object can still be uploaded.
+    """
+    start_pos = file_obj.tell()
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+        sha256.update(chunk)
+    file_obj.seek(start_pos)
+    return sha256.hexdigest()
+
+
+def find_duplicate(sha256, bucket_name):
+    """
+    Look up an already stored object with the given content hash.
+    
+    The object is checked with a HEAD request so that entries for deleted
+    objects are dropped instead of returned. If the check fails, the entry
+    is not trusted and None is returned.
+    
+    Args:
+        sha256 (str): SHA-256 hex digest of the content
+        bucket_name (str): Name of the bucket (video, audio, or images)
+        
+    Returns:
+        dict: The index entry of the stored object, or None
+    """
+    if media_index is None:
+        return None
+
+    entry = media_index.lookup(sha256, bucket_name)
+    if entry is None:
+        return None
+
+    info = get_object_info(bucket_name, entry['object_key'])
+    if not info["success"]:
+        return None
+    if not info["exists"]:
+        media_index.remove(bucket_name, entry['object_key'])
+        return None
+    uploads_total.labels(bucket_name, 'deduplicated').inc()
+    return entry
+
+
+def _index_upload(sha256, bucket_name, key, url, size):
+    if media_index is not None:
+        media_index.add(sha256, bucket_name, key, url, size)
+
+
+def index_stored_object(bucket_name, key, url):
+    """
+    Hash a stored object and add it to the deduplication index.
+    
+    Resumable and presigned uploads reach storage in parts or straight from
+    the client, without passing a hash on the way, so their objects are read
+    back once after completion. Later uploads of the same content then reuse
+    them.
+    
+    Returns:
+        dict: Dictionary containing success status, the SHA-256 of the object, and any error message
+    """
+    if media_index is None:
+        return {"success": True, "sha256": None}
+
+    try:
+        body = get_s3_client().get_object(Bucket=bucket_name, Key=key)['Body']
+        sha256 = hashlib.sha256()
+        size = 0
+        for chunk in body.iter_chunks(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+            size += len(chunk)
+    except Exception as e:
+        return _upload_error_result(e)
+
+    _index_upload(sha256.hexdigest(), bucket_name, key, url, size)
+    return {"success": True, "sha256": sha256.hexdigest()}
+
+
+flac_bytes_saved = Counter(
+    'dynocollect_flac_bytes_saved_total', 'Bytes saved by storing WAV uploads as FLAC'
+)
+
+
+def _encode_audio(file_data, filename, content_type, file_size):
+    """
+    Run the optional WAV to FLAC ingest stage on an audio upload.
+    
+    The position of file_data is restored. If encoding fails or does not make
+    the file smaller, the original is stored.
+    
+    Returns:
+        dict: The FLAC data (a temporary file the caller must close), its filename,
+        content type and size, or None if the upload is stored as it is
+    """
+    if not flac_encodable(file_data, content_type, file_size):
+        return None
+    
+    position = file_data.tell()
+    encoded = encode_flac(file_data)
+    file_data.seek(position)
+    if not encoded["success"]:
+        return None
+    if encoded["size_bytes"] >= file_size:
+        encoded["file"].close()
+        return None
+    
+    logger.info(f"Encoded {filename} as FLAC: {file_size / 1024 / 1024:.2f} MB -> {encoded['size_bytes'] / 1024 / 1024:.2f} MB")
+    flac_bytes_saved.inc(file_size - encoded["size_bytes"])
+    return {
+        "file": encoded["file"],
+        "filename": os.path.splitext(filename)[0] + '.flac',
+        "content_type": 'audio/flac',
+        "size_bytes": encoded["size_bytes"]
+    }
+
+
+def _duplicate_result(entry, size_bytes, start_time):
+    """
+    Build the upload result returned when existing content is reused.
+    """
+    upload_time = time.time() - start_time
+    logger.info(f"Reusing stored object {entry['object_key']} with identical content")
+    return {
+        "success": True,
+        "url": entry['url'],
+        "filename": entry['object_key'],
+        "size_bytes": size_bytes,
+        "upload_time_seconds": upload_time,
+        "upload_speed_mbps": size_bytes / upload_time / 1024 / 1024 if upload_time > 0 else 0.0,
+        "transfer_config": None,
+        "sha256": entry['sha256'],
+        "deduplicated": True
+    }
+
+
+def reconcile_media_index(rebuild=False):
+    """
+    Bring the deduplication index in line with the objects in the buckets.
+    
+    Entries whose objects no longer exist are removed. With rebuild=True,
+    objects missing from the index are looked up with HEAD and added if their
+    metadata carries a sha256.
+    
+    Args:
+        rebuild (bool): Also index stored objects that are missing from the index
+        
+    Returns:
+        dict: Dictionary containing success status, number of removed and added entries, and any error message
+    """
+    if media_index is None:
+        return {"success": True, "removed": 0, "added": 0}
+
+    removed = added = 0
+    try:
+        s3_client = get_s3_client()
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for bucket_name in VALID_BUCKETS:
+            stored = {}
+            for page in paginator.paginate(Bucket=bucket_name):
+                for obj in page.get('Contents', []):
+                    stored[obj['Key']] = obj['Size']
+
+            indexed = media_index.keys(bucket_name)
+            for key in indexed - stored.keys():
+                media_index.remove(bucket_name, key)
+                removed += 1
+
+            if rebuild:
+                for key in stored.keys() - indexed:
+                    metadata = s3_client.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+                    if metadata.get('sha256'):
+                        url = PUBLIC_URL_FORMAT.format(bucket=bucket_name, filename=key)
+                        media_index.add(metadata['sha256'], bucket_name, key, url, stored[key])
+                        added += 1
+
+        logger.info(f"Media index reconciled: {removed} removed, {added} added")
+        return {"success": True, "removed": removed, "added": added}
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"Media index reconciliation failed: {error_message}")
+        return {"success": False, "error": error_message}
+
+
 def upload_file_to_supabase(file_path, bucket_name, custom_filename=None, content_type=None):
     """
     Upload a file to Supabase Storage using boto3 S3 client.
@@ -125,74 +660,31 @@ def upload_file_to_supabase(file_path, bucket_name, custom_filename=None, conten
         
         logger.info(f"Uploading file: {original_filename} ({file_size_mb:.2f} MB) to {bucket_name}")
         
-        # Get S3 client
-        s3_client = get_s3_client()
-        
-        # Prepare upload parameters
-        upload_args = {
-            'Bucket': bucket_name,
-            'Key': filename,
-            'ACL': 'public-read',  # Make file publicly accessible
-        }
-        
-        # Add content type if provided
-        if content_type:
-            upload_args['ContentType'] = content_type
-        
-        # Use TransferConfig for multipart uploads and performance tuning
-        # Optimized settings for large files with smaller chunk sizes for Supabase Storage limits
-        # Adjust chunk size based on file size to avoid EntityTooLarge errors
-        if file_size_mb > 50:  # For files larger than 50MB
-            chunk_size = 256 * 1024  # 256KB chunks for very large files
-        else:
-            chunk_size = 512 * 1024  # 512KB chunks for smaller files
-            
-        config = boto3.s3.transfer.TransferConfig(
-            multipart_threshold=5 * 1024 * 1024,  # 5MB - start multipart upload sooner
-            max_concurrency=30,                 # 30 threads for better parallelism
-            multipart_chunksize=chunk_size,     # Dynamic chunk size based on file size
-            use_threads=True,
-            max_io_queue=200,                   # Increased queue size for better throughput
-            io_chunksize=262144,                # 256KB chunks for reading
-            num_download_attempts=15            # More retry attempts
-        )
-        
-        # Upload file with progress tracking
-        start_time = __import__('time').time()
-        
+        # Skip the upload if identical content is already stored
+        start_time = time.time()
         with open(file_path, 'rb') as file_data:
-            s3_client.upload_fileobj(
-                file_data,
-                upload_args['Bucket'],
-                upload_args['Key'],
-                ExtraArgs={
-                    'ACL': upload_args['ACL'],
-                    **(({'ContentType': upload_args['ContentType']} if 'ContentType' in upload_args else {}))
-                },
-                Config=config
-            )
-        
-        end_time = __import__('time').time()
-        upload_time = end_time - start_time
-        upload_speed = file_size / upload_time / 1024 / 1024  # MB/s
-        
-        logger.info(f"Upload completed in {upload_time:.2f} seconds ({upload_speed:.2f} MB/s)")
-        
-        # Generate public URL
-        public_url = PUBLIC_URL_FORMAT.format(bucket=bucket_name, filename=filename)
+            sha256 = _hash_fileobj(file_data)
+        duplicate = find_duplicate(sha256, bucket_name)
+        if duplicate:
+            return _duplicate_result(duplicate, file_size, start_time)
         
-        return {
-            "success": True,
-            "url": public_url,
-            "filename": filename,
-            "size_bytes": file_size,
-            "upload_time_seconds": upload_time,
-            "upload_speed_mbps": upload_speed
-        }
+        # Upload through the transfer scheduler; part size and concurrency come from the tuner
+        with open(file_path, 'rb') as file_data:
+            # Uncompressed WAV may be stored as FLAC; the object keeps the SHA-256 of the WAV
+            encoded = None if custom_filename or bucket_name != 'audio' else \
+                _encode_audio(file_data, original_filename, content_type, file_size)
+            if encoded:
+                with encoded["file"]:
+                    return _upload_fileobj(
+                        encoded["file"], encoded["filename"], bucket_name, encoded["content_type"],
+                        encoded["size_bytes"], sha256, key=generate_object_key(encoded["filename"])
+                    )
+            return _upload_fileobj(file_data, original_filename, bucket_name, content_type, file_size, sha256, key=filename)
         
     except ClientError as e:
         error_message = str(e)
         logger.error(f"S3 client error: {error_message}")
+        _refresh_on_auth_error(e)
         return {
             "success": False,
             "error": error_message
@@ -262,67 +754,31 @@ def upload_file_from_memory(file_data, filename, bucket_name, content_type=None)
         
         logger.info(f"Uploading file from memory: {filename} ({file_size_mb:.2f} MB) to {bucket_name}")
         
-        # Get S3 client
-        s3_client = get_s3_client()
-        
-        # Use TransferConfig for multipart uploads and performance tuning
-        # Optimized settings for large files with smaller chunk sizes for Supabase Storage limits
-        # Adjust chunk size based on file size to avoid EntityTooLarge errors
-        if file_size_mb > 50:  # For files larger than 50MB
-            chunk_size = 256 * 1024  # 256KB chunks for very large files
-        else:
-            chunk_size = 512 * 1024  # 512KB chunks for smaller files
-            
-        config = boto3.s3.transfer.TransferConfig(
-            multipart_threshold=5 * 1024 * 1024,  # 5MB - start multipart upload sooner
-            max_concurrency=30,                 # 30 threads for better parallelism
-            multipart_chunksize=chunk_size,     # Dynamic chunk size based on file size
-            use_threads=True,
-            max_io_queue=200,                   # Increased queue size for better throughput
-            io_chunksize=262144,                # 256KB chunks for reading
-            num_download_attempts=15            # More retry attempts
-        )
-        
-        # Prepare extra args
-        extra_args = {
-            'ACL': 'public-read'
-        }
-        
-        if content_type:
-            extra_args['ContentType'] = content_type
-        
-        # Upload file with progress tracking
-        start_time = __import__('time').time()
-        
-        s3_client.upload_fileobj(
-            file_data if hasattr(file_data, 'read') else __import__('io').BytesIO(file_data),
-            bucket_name,
-            unique_filename,
-            ExtraArgs=extra_args,
-            Config=config
-        )
-        
-        end_time = __import__('time').time()
-        upload_time = end_time - start_time
-        upload_speed = file_size / upload_time / 1024 / 1024  # MB/s
-        
-        logger.info(f"Upload completed in {upload_time:.2f} seconds ({upload_speed:.2f} MB/s)")
+        # Skip the upload if identical content is already stored
+        start_time = time.time()
+        if not hasattr(file_data, 'read'):
+            file_data = io.BytesIO(file_data)
+        sha256 = _hash_fileobj(file_data)
+        duplicate = find_duplicate(sha256, bucket_name)
+        if duplicate:
+            return _duplicate_result(duplicate, file_size, start_time)
         
-        # Generate public URL
-        public_url = PUBLIC_URL_FORMAT.format(bucket=bucket_name, filename=unique_filename)
+        # Uncompressed WAV may be stored as FLAC; the object keeps the SHA-256 of the WAV
+        encoded = _encode_audio(file_data, filename, content_type, file_size) if bucket_name == 'audio' else None
+        if encoded:
+            with encoded["file"]:
+                return _upload_fileobj(
+                    encoded["file"], encoded["filename"], bucket_name, encoded["content_type"],
+                    encoded["size_bytes"], sha256, key=generate_object_key(encoded["filename"])
+                )
         
-        return {
-            "success": True,
-            "url": public_url,
-            "filename": unique_filename,
-            "size_bytes": file_size,
-            "upload_time_seconds": upload_time,
-            "upload_speed_mbps": upload_speed
-        }
+        # Upload through the transfer scheduler; part size and concurrency come from the tuner
+        return _upload_fileobj(file_data, filename, bucket_name, content_type, file_size, sha256, key=unique_filename)
         
     except ClientError as e:
         error_message = str(e)
         logger.error(f"S3 client error: {error_message}")
+        _refresh_on_auth_error(e)
         return {
             "success": False,
             "error": error_message
@@ -353,47 +809,1119 @@ def upload_file_from_memory(file_data, filename, bucket_name, content_type=None)
         }
 
 
-def save_file_url_to_database(url, field_name):
+def upload_files_batch(files):
     """
-    Save a file URL to the contributions table in the database.
+    Upload many files to Supabase Storage as a single transfer on the transfer scheduler.
+    
+    The batch is admitted once and runs at most BATCH_UPLOAD_CONCURRENCY
+    storage requests at a time. Files that fit into one part are all queued
+    right away as single PUTs; larger files are then uploaded in parts one
+    after another.
     
     Args:
-        url (str): The public URL of the uploaded file
-        field_name (str): The field name in the contributions table (audio_url, video_url, or image_url)
+        files (list): Dictionaries with file_data (bytes or file-like), filename, bucket_name and content_type
         
     Returns:
-        dict: Dictionary containing success status and database response
+        list: One result dictionary per file, in the same order, shaped like the result of upload_file_from_memory
     """
+    results = [None] * len(files)
+    pending = []
+    multipart = []
+    encoded_files = []
+    start_time = time.time()
+    
     try:
-        # Validate field name
-        valid_fields = ['audio_url', 'video_url', 'image_url']
-        if field_name not in valid_fields:
-            return {
-                "success": False,
-                "error": f"Invalid field name. Must be one of: {', '.join(valid_fields)}"
-            }
+        transfer = transfer_scheduler.open(max_parallel=BATCH_UPLOAD_CONCURRENCY)
+    except SchedulerBusy as e:
+        return [_upload_error_result(e) for _ in files]
+    
+    try:
+        for index, item in enumerate(files):
+            bucket_name = item['bucket_name']
+            if bucket_name not in VALID_BUCKETS:
+                results[index] = {
+                    "success": False,
+                    "error": f"Invalid bucket name. Must be one of: {', '.join(VALID_BUCKETS)}"
+                }
+                continue
+            
+            try:
+                file_data = item['file_data']
+                if not hasattr(file_data, 'read'):
+                    file_data = io.BytesIO(file_data)
+                file_data.seek(0, os.SEEK_END)
+                file_size = file_data.tell()
+                file_data.seek(0)
+                
+                # Skip the upload if identical content is already stored
+                sha256 = _hash_fileobj(file_data)
+                duplicate = find_duplicate(sha256, bucket_name)
+                if duplicate:
+                    results[index] = _duplicate_result(duplicate, file_size, start_time)
+                    continue
+                
+                encoded = _encode_audio(file_data, item['filename'], item.get('content_type'), file_size) \
+                    if bucket_name == 'audio' else None
+                if encoded:
+                    encoded_files.append(encoded["file"])
+                    file_data, file_size = encoded["file"], encoded["size_bytes"]
+                    item = dict(item, filename=encoded["filename"], content_type=encoded["content_type"])
+                
+                if (transfer_tuner.choose(file_size)["part_count"] or 1) > 1:
+                    multipart.append((index, item, file_data, file_size, sha256))
+                    continue
+                
+                key = generate_object_key(item['filename'])
+                body = file_data.read()
+                future = transfer.submit(
+                    _put_object, len(body), bucket_name, key, body, item.get('content_type'), sha256
+                )
+                pending.append((index, future, bucket_name, key, file_size, sha256))
+            except Exception as e:
+                results[index] = _upload_error_result(e)
         
-        # Insert into database
-        result = supabase.table('contributions').insert({
-            field_name: url
-        }).execute()
+        for index, item, file_data, file_size, sha256 in multipart:
+            results[index] = _upload_fileobj(
+                file_data, item['filename'], item['bucket_name'], item.get('content_type'),
+                file_size, sha256, transfer=transfer
+            )
         
-        # Check for error in APIResponse object
-        if hasattr(result, 'error') and result.error:
-            return {
-                "success": False,
-                "error": result.error.message
+        for index, future, bucket_name, key, file_size, sha256 in pending:
+            try:
+                future.result()
+            except Exception as e:
+                results[index] = _upload_error_result(e)
+                continue
+            
+            upload_time = time.time() - start_time
+            public_url = PUBLIC_URL_FORMAT.format(bucket=bucket_name, filename=key)
+            _index_upload(sha256, bucket_name, key, public_url, file_size)
+            _observe_upload(bucket_name, file_size, upload_time)
+            results[index] = {
+                "success": True,
+                "url": public_url,
+                "filename": key,
+                "size_bytes": file_size,
+                "upload_time_seconds": upload_time,
+                "upload_speed_mbps": file_size / upload_time / 1024 / 1024 if upload_time > 0 else 0.0,
+                "transfer_config": None,
+                "sha256": sha256,
+                "deduplicated": False
             }
-        
-        return {
-            "success": True,
-            "data": result.data
-        }
-        
+    finally:
+        transfer.close()
+        for encoded_file in encoded_files:
+            encoded_file.close()
+    
+    total_bytes = sum(result["size_bytes"] for result in results if result["success"])
+    logger.info(f"Batch upload of {len(files)} files ({total_bytes / 1024 / 1024:.2f} MB) finished in {time.time() - start_time:.2f} seconds")
+    return results
+
+
+def _object_args(content_type=None, sha256=None):
+    """
+    Return the ACL, content type and metadata arguments of a new object.
+    """
+    extra_args = {'ACL': 'public-read'}
+    if content_type:
+        extra_args['ContentType'] = content_type
+    if sha256:
+        extra_args['Metadata'] = {'sha256': sha256}
+    return extra_args
+
+
+def _put_object(bucket_name, key, body, content_type=None, sha256=None):
+    _storage_request(
+        'put_object',
+        bucket_name,
+        len(body),
+        get_s3_client().put_object,
+        Bucket=bucket_name,
+        Key=key,
+        Body=body,
+        **_object_args(content_type, sha256)
+    )
+
+
+def _upload_fileobj(file_obj, filename, bucket_name, content_type, file_size, sha256, key=None, transfer=None):
+    """
+    Upload a file-like object from its current position through the transfer scheduler.
+    
+    The caller has already hashed the content and checked for duplicates.
+    
+    Returns:
+        dict: Dictionary containing success status, public URL, and any error message
+    """
+    try:
+        upload = StreamingUpload(
+            filename,
+            bucket_name,
+            content_type=content_type,
+            expected_size=file_size,
+            key=key,
+            sha256=sha256,
+            transfer=transfer
+        )
+    except SchedulerBusy as e:
+        return _upload_error_result(e)
+    
+    try:
+        for chunk in iter(lambda: file_obj.read(upload.part_size), b''):
+            upload.write(chunk)
     except Exception as e:
-        error_message = str(e)
-        logger.error(f"Database error: {error_message}")
-        return {
-            "success": False,
-            "error": error_message
-        }
\ No newline at end of file
+        upload.abort()
+        return _upload_error_result(e)
+    return upload.complete()
+
+
+class StreamingUpload:
+    """
+    Upload a file to Supabase Storage while its bytes are still arriving.
+    
+    Data passed to write() is cut into parts of part_size bytes and each part is
+    handed to the transfer scheduler as soon as it is full, so the transfer to
+    storage overlaps with receiving the file. At most max_concurrency parts are
+    in flight; write() blocks when that limit or the scheduler's byte budget
+    is reached.
+    
+    Files smaller than one part are stored with a single PUT on complete().
+    Part size and concurrency are chosen by the transfer tuner from the
+    expected size of the file.
+    
+    The content is hashed as it arrives, unless the caller already knows the
+    hash. If identical content is already stored in the bucket, complete()
+    discards the upload and returns the existing object instead. The data
+    has been transferred by then; only the second stored copy is avoided.
+    """
+
+    def __init__(self, filename, bucket_name, content_type=None, expected_size=None, key=None,
+                 sha256=None, transfer=None):
+        """
+        Args:
+            filename (str): Original filename, prefixed with a UUID in the bucket
+            bucket_name (str): Name of the bucket (video, audio, or images)
+            content_type (str, optional): Content type of the file
+            expected_size (int, optional): Expected file size in bytes, or an upper bound of it, used for tuning
+            key (str, optional): Object key to use instead of the prefixed filename
+            sha256 (str, optional): SHA-256 of the content, if the caller already checked it for duplicates
+            transfer (Transfer, optional): Scheduler transfer to run on; by default the upload opens its own
+            
+        Raises:
+            SchedulerBusy: If the transfer scheduler cannot admit another upload
+        """
+        if bucket_name not in VALID_BUCKETS:
+            raise ValueError(f"Invalid bucket name. Must be one of: {', '.join(VALID_BUCKETS)}")
+
+        self.filename = filename
+        self.bucket_name = bucket_name
+        self.key = key or generate_object_key(filename)
+        self.content_type = content_type
+        self.transfer_params = transfer_tuner.choose(expected_size)
+        self.part_size = self.transfer_params["part_size_bytes"]
+        self.size_bytes = 0
+
+        self._buffer = bytearray()
+        self._known_sha256 = sha256
+        self._sha256 = hashlib.sha256() if sha256 is None else None
+        self._upload_id = None
+        self._parts = []
+        self._error = None
+        self._own_transfer = transfer is None
+        self._transfer = transfer or transfer_scheduler.open(max_parallel=self.transfer_params["max_concurrency"])
+        self._start_time = time.time()
+
+    def write(self, data):
+        """
+        Append data to the upload, sending every completed part to storage.
+        
+        Raises:
+            Exception: The error of a previously failed part upload
+        """
+        if self._error is not None:
+            raise self._error
+
+        if self._sha256 is not None:
+            self._sha256.update(data)
+        self.size_bytes += len(data)
+
+        # Whole parts read straight from a file skip the buffer
+        if not self._buffer and len(data) == self.part_size:
+            self._submit_part(bytes(data))
+            return
+
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+
+    def _submit_part(self, body):
+        if self._upload_id is None:
+            response = _storage_request(
+                'create_multipart_upload',
+                self.bucket_name,
+                0,
+                get_s3_client().create_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=self.key,
+                **_object_args(self.content_type, self._known_sha256)
+            )
+            self._upload_id = response['UploadId']
+
+        # Waits for room so that buffered parts stay bounded
+        part_number = len(self._parts) + 1
+        future = self._transfer.submit(self._upload_part, len(body), part_number, body)
+        self._parts.append((part_number, future))
+
+    def _upload_part(self, part_number, body):
+        try:
+            response = _storage_request(
+                'upload_part',
+                self.bucket_name,
+                len(body),
+                get_s3_client().upload_part,
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=body
+            )
+            return response['ETag']
+        except Exception as e:
+            self._error = e
+            raise
+
+    def complete(self):
+        """
+        Upload the remaining data and finalize the object.
+        
+        Returns:
+            dict: Dictionary containing success status, public URL, and any error message
+        """
+        try:
+            if self._known_sha256 is None:
+                sha256 = self._sha256.hexdigest()
+
+                # Identical content is already stored: drop the parts sent so far
+                duplicate = find_duplicate(sha256, self.bucket_name)
+                if duplicate:
+                    self.abort()
+                    return _duplicate_result(duplicate, self.size_bytes, self._start_time)
+            else:
+                sha256 = self._known_sha256
+
+            if self._upload_id is None:
+                body = bytes(self._buffer)
+                self._transfer.submit(
+                    _put_object, len(body), self.bucket_name, self.key, body, self.content_type, sha256
+                ).result()
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                parts = [
+                    {'PartNumber': part_number, 'ETag': future.result()}
+                    for part_number, future in self._parts
+                ]
+                _storage_request(
+                    'complete_multipart_upload',
+                    self.bucket_name,
+                    0,
+                    get_s3_client().complete_multipart_upload,
+                    Bucket=self.bucket_name,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={'Parts': parts}
+                )
+            self._buffer = bytearray()
+
+            upload_time = time.time() - self._start_time
+            upload_speed = self.size_bytes / upload_time / 1024 / 1024  # MB/s
+
+            logger.info(f"Upload completed in {upload_time:.2f} seconds ({upload_speed:.2f} MB/s)")
+            transfer_tuner.record(self.size_bytes, upload_time, min(len(self._parts) or 1, self.transfer_params["max_concurrency"]))
+
+            public_url = PUBLIC_URL_FORMAT.format(bucket=self.bucket_name, filename=self.key)
+            _index_upload(sha256, self.bucket_name, self.key, public_url, self.size_bytes)
+            _observe_upload(self.bucket_name, self.size_bytes, upload_time)
+
+            return {
+                "success": True,
+                "url": public_url,
+                "filename": self.key,
+                "size_bytes": self.size_bytes,
+                "upload_time_seconds": upload_time,
+                "upload_speed_mbps": upload_speed,
+                "transfer_config": self.transfer_params,
+                "sha256": sha256,
+                "deduplicated": False
+            }
+
+        except Exception as e:
+            self.abort()
+            return _upload_error_result(e)
+        finally:
+            self._release()
+
+    def abort(self):
+        """
+        Cancel the upload and discard any parts already stored.
+        """
+        # Skip parts that have not started and let running ones finish so that the abort removes them too
+        futures = [future for _, future in self._parts]
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        if self._upload_id is not None:
+            try:
+                get_s3_client().abort_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=self.key,
+                    UploadId=self._upload_id
+                )
+            except Exception as e:
+                logger.warning(f"Failed to abort multipart upload {self._upload_id}: {str(e)}")
+            self._upload_id = None
+        self._release()
+
+    def _release(self):
+        # A transfer passed in by the caller stays open for its other uploads
+        if self._own_transfer:
+            self._transfer.close()
+
+
+def generate_object_key(filename):
+    """
+    Return a unique object key for a file by prefixing its name with a UUID.
+    """
+    return f"{uuid.uuid4()}_{filename}"
+
+
+def create_multipart_upload(filename, bucket_name, content_type=None):
+    """
+    Start a multipart upload whose parts are sent separately, e.g. by a resumable client.
+    
+    Args:
+        filename (str): Original filename, prefixed with a UUID in the bucket
+        bucket_name (str): Name of the bucket (video, audio, or images)
+        content_type (str, optional): Content type of the file
+        
+    Returns:
+        dict: Dictionary containing success status, storage upload id, object key, and any error message
+    """
+    if bucket_name not in VALID_BUCKETS:
+        return {
+            "success": False,
+            "error": f"Invalid bucket name. Must be one of: {', '.join(VALID_BUCKETS)}"
+        }
+
+    try:
+        key = generate_object_key(filename)
+        extra_args = {'ACL': 'public-read'}
+        if content_type:
+            extra_args['ContentType'] = content_type
+
+        response = get_s3_client().create_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            **extra_args
+        )
+        return {
+            "success": True,
+            "upload_id": response['UploadId'],
+            "key": key
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def upload_part(bucket_name, key, upload_id, part_number, body):
+    """
+    Upload one part of a multipart upload.
+    
+    Args:
+        bucket_name (str): Name of the bucket
+        key (str): Object key returned by create_multipart_upload()
+        upload_id (str): Storage upload id returned by create_multipart_upload()
+        part_number (int): Part number, starting at 1
+        body (bytes): Part data
+        
+    Returns:
+        dict: Dictionary containing success status, part ETag, and any error message
+    """
+    try:
+        response = _part_transfer(upload_id).submit(
+            _storage_request,
+            len(body),
+            'upload_part',
+            bucket_name,
+            len(body),
+            get_s3_client().upload_part,
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body
+        ).result()
+        return {
+            "success": True,
+            "etag": response['ETag']
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def _part_transfer(upload_id):
+    """
+    Return the scheduler transfer of a resumable upload, opening it on its first part.
+
+    Transfers idle for RESUMABLE_TRANSFER_IDLE seconds are closed here too, so
+    uploads that are never completed or aborted do not keep their slots.
+    """
+    now = time.monotonic()
+    with _part_transfers_lock:
+        for idle_id, (transfer, last_used) in list(_part_transfers.items()):
+            if idle_id != upload_id and now - last_used > RESUMABLE_TRANSFER_IDLE:
+                del _part_transfers[idle_id]
+                transfer.close()
+        entry = _part_transfers.get(upload_id)
+        if entry is not None:
+            entry[1] = now
+            return entry[0]
+
+    # Waiting for admission must not hold up the parts of other uploads
+    transfer = transfer_scheduler.open(max_parallel=TRANSFER_MAX_CONCURRENCY)
+    with _part_transfers_lock:
+        entry = _part_transfers.setdefault(upload_id, [transfer, now])
+    if entry[0] is not transfer:
+        # Another part of the same upload opened one first
+        transfer.close()
+    return entry[0]
+
+
+def _close_part_transfer(upload_id):
+    """
+    Close the scheduler transfer of a resumable upload, if it has one.
+    """
+    with _part_transfers_lock:
+        entry = _part_transfers.pop(upload_id, None)
+    if entry is not None:
+        entry[0].close()
+
+
+def complete_multipart_upload(bucket_name, key, upload_id, parts):
+    """
+    Assemble the uploaded parts into the final object.
+    
+    Args:
+        bucket_name (str): Name of the bucket
+        key (str): Object key returned by create_multipart_upload()
+        upload_id (str): Storage upload id returned by create_multipart_upload()
+        parts (list): (part_number, etag) tuples in ascending part order
+        
+    Returns:
+        dict: Dictionary containing success status, public URL, and any error message
+    """
+    _close_part_transfer(upload_id)
+    try:
+        get_s3_client().complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                'Parts': [{'PartNumber': part_number, 'ETag': etag} for part_number, etag in parts]
+            }
+        )
+        return {
+            "success": True,
+            "url": PUBLIC_URL_FORMAT.format(bucket=bucket_name, filename=key),
+            "filename": key
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def abort_multipart_upload(bucket_name, key, upload_id):
+    """
+    Abort a multipart upload and discard its stored parts.
+    
+    Returns:
+        dict: Dictionary containing success status and any error message
+    """
+    _close_part_transfer(upload_id)
+    try:
+        get_s3_client().abort_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id
+        )
+        return {"success": True}
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def generate_presigned_upload_url(bucket_name, key, content_type=None, expires_in=PRESIGNED_URL_EXPIRY):
+    """
+    Create a presigned URL that lets a client PUT an object directly into storage.
+    
+    Args:
+        bucket_name (str): Name of the bucket (video, audio, or images)
+        key (str): Object key the URL is scoped to
+        content_type (str, optional): Content type the client must send
+        expires_in (int): Validity of the URL in seconds
+        
+    Returns:
+        dict: Dictionary containing success status, URL, headers the client must send, and any error message
+    """
+    if bucket_name not in VALID_BUCKETS:
+        return {
+            "success": False,
+            "error": f"Invalid bucket name. Must be one of: {', '.join(VALID_BUCKETS)}"
+        }
+
+    try:
+        params = {'Bucket': bucket_name, 'Key': key, 'ACL': 'public-read'}
+        headers = {'x-amz-acl': 'public-read'}
+        if content_type:
+            params['ContentType'] = content_type
+            headers['Content-Type'] = content_type
+
+        url = get_s3_client().generate_presigned_url(
+            'put_object',
+            Params=params,
+            ExpiresIn=expires_in
+        )
+        return {
+            "success": True,
+            "url": url,
+            "headers": headers
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def generate_presigned_download_url(bucket_name, key, expires_in=PRESIGNED_URL_EXPIRY):
+    """
+    Create a presigned URL that lets a client GET a stored object.
+    
+    Args:
+        bucket_name (str): Name of the bucket (video, audio, or images)
+        key (str): Object key the URL is scoped to
+        expires_in (int): Validity of the URL in seconds
+        
+    Returns:
+        dict: Dictionary containing success status, URL, and any error message
+    """
+    try:
+        url = get_s3_client().generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket_name, 'Key': key},
+            ExpiresIn=expires_in
+        )
+        return {
+            "success": True,
+            "url": url
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def generate_presigned_part_urls(bucket_name, key, upload_id, part_numbers, expires_in=PRESIGNED_URL_EXPIRY):
+    """
+    Create presigned URLs for uploading parts of a multipart upload directly into storage.
+    
+    Args:
+        bucket_name (str): Name of the bucket
+        key (str): Object key returned by create_multipart_upload()
+        upload_id (str): Storage upload id returned by create_multipart_upload()
+        part_numbers (iterable): Part numbers to sign, starting at 1
+        expires_in (int): Validity of the URLs in seconds
+        
+    Returns:
+        dict: Dictionary containing success status, a list of part URLs, and any error message
+    """
+    try:
+        s3_client = get_s3_client()
+        parts = [
+            {
+                "part_number": part_number,
+                "url": s3_client.generate_presigned_url(
+                    'upload_part',
+                    Params={
+                        'Bucket': bucket_name,
+                        'Key': key,
+                        'UploadId': upload_id,
+                        'PartNumber': part_number
+                    },
+                    ExpiresIn=expires_in
+                )
+            }
+            for part_number in part_numbers
+        ]
+        return {
+            "success": True,
+            "parts": parts
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def list_uploaded_parts(bucket_name, key, upload_id):
+    """
+    List the parts storage has received for a multipart upload.
+    
+    Returns:
+        dict: Dictionary containing success status, a list of (part_number, etag, size) tuples, and any error message
+    """
+    try:
+        paginator = get_s3_client().get_paginator('list_parts')
+        parts = []
+        for page in paginator.paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+            parts.extend((part['PartNumber'], part['ETag'], part['Size']) for part in page.get('Parts', []))
+        return {
+            "success": True,
+            "parts": sorted(parts)
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def get_object_info(bucket_name, key):
+    """
+    Look up a stored object with a HEAD request.
+    
+    Returns:
+        dict: Dictionary containing success status, whether the object exists, its size and content type
+    """
+    try:
+        response = get_s3_client().head_object(Bucket=bucket_name, Key=key)
+        return {
+            "success": True,
+            "exists": True,
+            "size_bytes": response['ContentLength'],
+            "content_type": response.get('ContentType')
+        }
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return {
+                "success": True,
+                "exists": False
+            }
+        return _upload_error_result(e)
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def store_object(bucket_name, key, body, content_type=None):
+    """
+    Store a small object under a fixed key with a single PUT through the transfer scheduler.
+    
+    Args:
+        bucket_name (str): Name of the bucket (video, audio, or images)
+        key (str): Object key; an existing object is replaced
+        body (bytes): Object data
+        content_type (str, optional): Content type of the object
+        
+    Returns:
+        dict: Dictionary containing success status, public URL, and any error message
+    """
+    if bucket_name not in VALID_BUCKETS:
+        return {
+            "success": False,
+            "error": f"Invalid bucket name. Must be one of: {', '.join(VALID_BUCKETS)}"
+        }
+
+    try:
+        transfer_scheduler.run(_put_object, len(body), bucket_name, key, body, content_type)
+        return {
+            "success": True,
+            "url": PUBLIC_URL_FORMAT.format(bucket=bucket_name, filename=key),
+            "filename": key,
+            "size_bytes": len(body)
+        }
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def delete_object(bucket_name, key):
+    """
+    Delete a stored object.
+    
+    Returns:
+        dict: Dictionary containing success status and any error message
+    """
+    try:
+        get_s3_client().delete_object(Bucket=bucket_name, Key=key)
+        return {"success": True}
+    except Exception as e:
+        return _upload_error_result(e)
+
+
+def _upload_error_result(e):
+    """
+    Convert an exception raised during an upload into an error result dictionary.
+    """
+    error_message = str(e)
+    if isinstance(e, SchedulerBusy):
+        logger.warning(f"Upload rejected: {error_message}")
+        return {
+            "success": False,
+            "error": error_message,
+            "busy": True
+        }
+    if isinstance(e, ClientError):
+        logger.error(f"S3 client error: {error_message}")
+        _refresh_on_auth_error(e)
+        return {
+            "success": False,
+            "error": error_message
+        }
+    if isinstance(e, ConnectionError):
+        logger.error(f"Connection error during upload: {error_message}")
+        return {
+            "success": False,
+            "error": "Connection error during upload. Please try again or use a smaller file.",
+            "detailed_error": error_message
+        }
+    if isinstance(e, TimeoutError):
+        logger.error(f"Timeout error during upload: {error_message}")
+        return {
+            "success": False,
+            "error": "Upload timed out. Please try again or use a smaller file.",
+            "detailed_error": error_message
+        }
+    logger.error(f"Unexpected error: {error_message}")
+    return {
+        "success": False,
+        "error": f"Upload failed: {error_message}"
+    }
+
+
+# Database metrics, exposed at /metrics
+db_insert_seconds = Histogram(
+    'dynocollect_db_insert_duration_seconds', 'Duration of bulk and single inserts into contributions'
+)
+db_inserted_rows = Counter('dynocollect_db_inserted_rows_total', 'Rows inserted into contributions')
+db_insert_errors = Counter('dynocollect_db_insert_errors_total', 'Failed inserts into contributions')
+
+
+def insert_contributions(rows):
+    """
+    Insert rows into the contributions table with a single request.
+    
+    Args:
+        rows (list): Rows to insert; all rows must have the same columns
+        
+    Returns:
+        list: The inserted rows, in the same order
+        
+    Raises:
+        Exception: If the insert fails
+    """
+    start = time.perf_counter()
+    try:
+        # An insert is only retried when it never reached the database, so rows are not written twice
+        result = supabase_db.call(supabase.table('contributions').insert(rows).execute, idempotent=False)
+        
+        # Check for error in APIResponse object
+        if hasattr(result, 'error') and result.error:
+            raise RuntimeError(result.error.message)
+    except Exception:
+        db_insert_errors.inc()
+        raise
+    
+    db_insert_seconds.observe(time.perf_counter() - start)
+    db_inserted_rows.inc(len(rows))
+    return result.data
+
+
+# Background batcher for single-row inserts
+contributions_batcher = None
+if DB_BATCH_INSERTS:
+    contributions_batcher = InsertBatcher(
+        insert_contributions,
+        max_batch_size=DB_BATCH_SIZE,
+        max_delay=DB_BATCH_DELAY,
+        max_queue_size=DB_BATCH_QUEUE_SIZE,
+        name='contributions-batcher'
+    )
+    # Flush queued rows on shutdown
+    atexit.register(contributions_batcher.close)
+    Gauge('dynocollect_db_batch_queued_rows', 'Rows waiting for the insert batcher').set_function(
+        lambda: contributions_batcher.stats()["queued"]
+    )
+
+
+def insert_contribution(row):
+    """
+    Insert a single row into the contributions table.
+    
+    Goes through the insert batcher when DB_BATCH_INSERTS is enabled. In async
+    batch mode the row is only queued and no data is returned, as in sync mode
+    when the row is not written within DB_INSERT_TIMEOUT seconds.
+    
+    Args:
+        row (dict): Column values of the new contribution
+        
+    Returns:
+        dict: Dictionary containing success status, inserted rows, whether the row was only queued, and any error message
+    """
+    try:
+        if contributions_batcher is None:
+            return {
+                "success": True,
+                "data": insert_contributions([row])
+            }
+        
+        future = contributions_batcher.submit(row)
+        if DB_BATCH_MODE == 'async':
+            return {
+                "success": True,
+                "data": None,
+                "queued": True
+            }
+        
+        try:
+            return {
+                "success": True,
+                "data": [future.result(timeout=DB_INSERT_TIMEOUT)]
+            }
+        except FutureTimeoutError:
+            # The row stays queued and is still inserted; reporting a failure
+            # would make the client send it again
+            logger.warning(f"Row still queued after {DB_INSERT_TIMEOUT}s, answering as queued")
+            return {
+                "success": True,
+                "data": None,
+                "queued": True
+            }
+        
+    except (BatcherFull, DependencyUnavailable) as e:
+        logger.warning(f"Database insert rejected: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e),
+            "busy": True
+        }
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"Database error: {error_message}")
+        return {
+            "success": False,
+            "error": error_message
+        }
+
+
+def save_file_url_to_database(url, field_name, user_id=None):
+    """
+    Save a file URL to the contributions table in the database.
+    
+    Args:
+        url (str): The public URL of the uploaded file
+        field_name (str): The field name in the contributions table (audio_url, video_url, or image_url)
+        user_id (str, optional): Id of the user who contributed the file
+        
+    Returns:
+        dict: Dictionary containing success status and database response
+    """
+    # Validate field name
+    valid_fields = ['audio_url', 'video_url', 'image_url']
+    if field_name not in valid_fields:
+        return {
+            "success": False,
+            "error": f"Invalid field name. Must be one of: {', '.join(valid_fields)}"
+        }
+    
+    row = {field_name: url}
+    if user_id:
+        row['user_id'] = user_id
+    return insert_contribution(row)
+
+
+def save_file_urls_to_database(entries, user_id=None):
+    """
+    Save many file URLs to the contributions table with a single bulk insert.
+    
+    Args:
+        entries (list): (url, field_name) pairs; field_name is audio_url, video_url, or image_url
+        user_id (str, optional): Id of the user who contributed the files
+        
+    Returns:
+        dict: Dictionary containing success status, inserted rows in the same order, and any error message
+    """
+    valid_fields = ['audio_url', 'video_url', 'image_url']
+    for _, field_name in entries:
+        if field_name not in valid_fields:
+            return {
+                "success": False,
+                "error": f"Invalid field name. Must be one of: {', '.join(valid_fields)}"
+            }
+    
+    if not entries:
+        return {"success": True, "data": []}
+    
+    # PostgREST requires every row of a bulk insert to have the same columns
+    rows = []
+    for url, field_name in entries:
+        row = dict.fromkeys(valid_fields)
+        row[field_name] = url
+        if user_id:
+            row['user_id'] = user_id
+        rows.append(row)
+    
+    try:
+        return {
+            "success": True,
+            "data": insert_contributions(rows)
+        }
+    except DependencyUnavailable as e:
+        logger.warning(f"Database insert rejected: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e),
+            "busy": True
+        }
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"Database error: {error_message}")
+        return {
+            "success": False,
+            "error": error_message
+        }
+
+
+def save_contribution_metadata(contribution_id, metadata):
+    """
+    Merge keys into the metadata of an existing contribution.
+    
+    Keys already in the metadata column and not in metadata are kept, so
+    e.g. the text encoding or file details saved with the row survive. The
+    update only applies if the column still holds what was read, and is
+    retried on a fresh read otherwise, so concurrent merges into the same
+    row do not drop each other's keys.
+    
+    Args:
+        contribution_id: Id of the contribution row
+        metadata (dict): Keys to set in the metadata column
+        
+    Returns:
+        dict: Dictionary containing success status, updated rows, and any error message
+    """
+    try:
+        for _ in range(METADATA_MERGE_ATTEMPTS):
+            current = supabase_db.call(
+                supabase.table('contributions').select('metadata').eq('id', contribution_id).execute
+            )
+            if not current.data:
+                return {
+                    "success": False,
+                    "error": f"Contribution {contribution_id} not found"
+                }
+            previous = current.data[0].get('metadata')
+            update = supabase.table('contributions').update({'metadata': dict(previous or {}, **metadata)}).eq('id', contribution_id)
+            if previous is None:
+                update = update.is_('metadata', 'null')
+            else:
+                update = update.eq('metadata', json.dumps(previous))
+            result = supabase_db.call(update.execute)
+            if result.data:
+                return {
+                    "success": True,
+                    "data": result.data
+                }
+            logger.debug(f"Metadata of contribution {contribution_id} changed while merging, retrying")
+        return {
+            "success": False,
+            "error": f"Metadata of contribution {contribution_id} kept changing while merging"
+        }
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"Database error: {error_message}")
+        return {
+            "success": False,
+            "error": error_message
+        }
+
+
+# Columns of contributions that mark each type of contribution
+CONTRIBUTION_TYPE_COLUMNS = {
+    'text': 'text_data',
+    'audio': 'audio_url',
+    'video': 'video_url',
+    'image': 'image_url'
+}
+
+
+def _postgrest_value(value):
+    # Quote values inside logical filters, where commas, dots and parentheses are syntax
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def fetch_contributions(columns, sort='submitted_at', descending=True, after=None, limit=50,
+                        contribution_type=None, user_id=None):
+    """
+    Read a page of contributions with keyset pagination.
+
+    Rows are ordered by the sort column and then id, so that rows sharing a
+    sort value keep a stable order. The page starts after the (sort value, id)
+    position of the last row of the previous page, which the database finds
+    with an index seek however deep the page is, unlike an offset.
+
+    Args:
+        columns (list): Columns to return
+        sort (str): submitted_at or id
+        descending (bool): Newest (largest) first
+        after (tuple, optional): (sort value, id) of the last row of the previous page
+        limit (int): Most rows to return
+        contribution_type (str, optional): Only text, audio, video, or image contributions
+        user_id (str, optional): Only contributions of this user
+
+    Returns:
+        dict: Dictionary containing success status, the rows, whether the service was busy, and any error message
+    """
+    direction = 'desc' if descending else 'asc'
+    comparison = 'lt' if descending else 'gt'
+    try:
+        query = supabase.table('contributions').select(','.join(columns))
+        if contribution_type:
+            query = query.not_.is_(CONTRIBUTION_TYPE_COLUMNS[contribution_type], 'null')
+        if user_id:
+            query = query.eq('user_id', user_id)
+        if after is not None:
+            sort_value, row_id = after
+            if sort == 'id':
+                query = query.filter('id', comparison, row_id)
+            else:
+                # postgrest-py 0.10, which supabase 1.0.3 pins, has no or_() filter,
+                # so the condition is added as PostgREST's or= parameter itself
+                query.params = query.params.add('or', (
+                    f"({sort}.{comparison}.{_postgrest_value(sort_value)},"
+                    f"and({sort}.eq.{_postgrest_value(sort_value)},id.{comparison}.{_postgrest_value(row_id)}))"
+                ))
+        if sort == 'id':
+            query = query.order('id', desc=descending)
+        else:
+            # order() of postgrest-py 0.10 adds one order= parameter per call, while
+            # PostgREST expects every sort key in a single one
+            query.params = query.params.add('order', f"{sort}.{direction},id.{direction}")
+        query = query.limit(limit)
+
+        # A read, so a slow answer may be hedged with a second request
+        result = supabase_db.call(query.execute, hedge=True)
+        return {
+            "success": True,
+            "data": result.data
+        }
+    except DependencyUnavailable as e:
+        logger.warning(f"Contributions read rejected: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e),
+            "busy": True
+        }
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"Database error: {error_message}")
+        return {
+            "success": False,
+            "error": error_message
+        }
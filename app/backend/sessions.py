@@ -0,0 +1,183 @@
+import os
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+
+# Session storage: 'memory' (in-process LRU), 'filesystem' (Flask-Session files) or
+# 'cookie' (stateless signed cookie, works across workers without shared storage;
+# signed but not encrypted, so the browser can read everything stored in it)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+
+# Limits of the in-memory session store
+MEMORY_SESSION_MAX_ENTRIES = int(os.getenv("MEMORY_SESSION_MAX_ENTRIES", "10000"))
+MEMORY_SESSION_TTL = int(os.getenv("MEMORY_SESSION_TTL", str(24 * 60 * 60)))
+
+SESSION_BACKENDS = ('cookie', 'memory', 'filesystem')
+
+
+class MemorySessionStore:
+    """
+    Thread-safe LRU of session data with a sliding expiry.
+
+    Reading a session renews its expiry. When more than max_entries sessions
+    are stored, the least recently used ones are evicted.
+    """
+
+    def __init__(self, max_entries=MEMORY_SESSION_MAX_ENTRIES, ttl=MEMORY_SESSION_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        """
+        Return a copy of the data of a session, or None if it does not exist or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < now:
+                del self._entries[sid]
+                return None
+            self._entries[sid] = (now + self.ttl, data)
+            self._entries.move_to_end(sid)
+        return dict(data)
+
+    def set(self, sid, data):
+        with self._lock:
+            self._entries[sid] = (time.monotonic() + self.ttl, dict(data))
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemorySession(CallbackDict, SessionMixin):
+    """
+    Session whose data lives in a MemorySessionStore under a random id.
+    """
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class MemorySessionInterface(SessionInterface):
+    """
+    Keep sessions in process memory; the cookie only carries the signed session id.
+
+    Requests that do not modify the session neither touch the store nor set a
+    cookie. Sessions are not shared between worker processes.
+    """
+
+    salt = 'memory-session'
+
+    def __init__(self, store=None):
+        self.store = store or MemorySessionStore()
+
+    def _signer(self, app):
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def open_session(self, app, request):
+        signer = self._signer(app)
+        if signer is None:
+            return None
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = signer.unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            data = self.store.get(sid) if sid else None
+            if data is not None:
+                return MemorySession(data, sid=sid)
+
+        return MemorySession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        self.store.set(session.sid, session)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def stores_on_server(backend=SESSION_BACKEND):
+    """
+    Return whether session data stays on the server, with only a signed id in the cookie.
+    """
+    return backend != 'cookie'
+
+
+def init_session(app, backend=SESSION_BACKEND, secret_key_configured=True):
+    """
+    Install the session backend on a Flask app.
+
+    Args:
+        app (Flask): The application; app.secret_key must be set
+        backend (str): One of 'cookie', 'memory' or 'filesystem'
+        secret_key_configured (bool): Whether app.secret_key was configured rather than generated
+
+    Raises:
+        ValueError: If the backend is unknown, or is 'cookie' without a configured secret key
+    """
+    if backend == 'cookie':
+        if not secret_key_configured:
+            # A generated key differs per worker and restart, so cookies would stop being accepted
+            raise ValueError("SESSION_BACKEND=cookie requires SECRET_KEY to be set")
+        app.session_interface = SecureCookieSessionInterface()
+    elif backend == 'memory':
+        app.session_interface = MemorySessionInterface()
+    elif backend == 'filesystem':
+        # Only needed for this backend
+        from flask_session import Session
+
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config['SESSION_USE_SIGNER'] = True
+        app.config.setdefault(
+            'SESSION_FILE_DIR',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session')
+        )
+        Session(app)
+    else:
+        raise ValueError(f"Invalid session backend. Must be one of: {', '.join(SESSION_BACKENDS)}")
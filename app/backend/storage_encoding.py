@@ -0,0 +1,291 @@
+import os
+import gzip
+import base64
+import shutil
+import logging
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# zstandard is optional; without it text is compressed with gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Re-encode uncompressed PCM WAV uploads to FLAC before they are stored. FLAC is
+# lossless; the SHA-256 of the original WAV is kept in the object metadata.
+AUDIO_FLAC_ENCODING = os.getenv("AUDIO_FLAC_ENCODING", "false").lower() in ("1", "true", "yes")
+
+# WAV files smaller than this are stored as they are
+AUDIO_FLAC_MIN_BYTES = int(os.getenv("AUDIO_FLAC_MIN_BYTES", str(256 * 1024)))
+
+# ffmpeg processes encoding FLAC at the same time, and the longest one encode may take in seconds
+AUDIO_ENCODE_WORKERS = int(os.getenv("AUDIO_ENCODE_WORKERS", str(os.cpu_count() or 2)))
+AUDIO_ENCODE_TIMEOUT = float(os.getenv("AUDIO_ENCODE_TIMEOUT", "300"))
+
+# ffmpeg encodes FLAC; without it WAV files are stored as they are
+FFMPEG = shutil.which(os.getenv("FFMPEG_PATH", "ffmpeg"))
+
+# Compress text_data of at least TEXT_COMPRESSION_MIN_BYTES with 'gzip' or 'zstd' ('none' disables)
+TEXT_COMPRESSION = os.getenv("TEXT_COMPRESSION", "none").lower()
+TEXT_COMPRESSION_MIN_BYTES = int(os.getenv("TEXT_COMPRESSION_MIN_BYTES", "4096"))
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "6"))
+
+if AUDIO_FLAC_ENCODING and FFMPEG is None:
+    logger.warning("ffmpeg not found, WAV uploads are stored without FLAC encoding")
+
+if TEXT_COMPRESSION == 'zstd' and zstandard is None:
+    logger.warning("zstandard is not installed, compressing text with gzip")
+    TEXT_COMPRESSION = 'gzip'
+
+WAV_CONTENT_TYPES = {'audio/wav', 'audio/x-wav', 'audio/wave', 'audio/vnd.wave'}
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_EXTENSIBLE = 0xfffe
+_WAV_HEADER_SIZE = 4096  # The fmt chunk is expected within the first bytes
+_COPY_SIZE = 1024 * 1024
+
+# Encoding runs on these threads, each driving one ffmpeg process
+_flac_encoders = ThreadPoolExecutor(max_workers=AUDIO_ENCODE_WORKERS, thread_name_prefix='flac-encode')
+
+
+class ContentDecodingError(Exception):
+    """Raised when a compressed request body is invalid or too large."""
+
+
+def wav_format(head):
+    """
+    Read the sample format of a WAV file from its first bytes.
+
+    Args:
+        head (bytes): Start of the file
+
+    Returns:
+        tuple: (format tag, channels, bits per sample), or None if head is not a WAV file with a fmt chunk
+    """
+    if head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+        return None
+
+    pos = 12
+    while pos + 8 <= len(head):
+        chunk_id = head[pos:pos + 4]
+        chunk_size = int.from_bytes(head[pos + 4:pos + 8], 'little')
+        if chunk_id == b'fmt ':
+            fmt = head[pos + 8:pos + 8 + chunk_size]
+            if len(fmt) < 16:
+                return None
+            format_tag = int.from_bytes(fmt[0:2], 'little')
+            channels = int.from_bytes(fmt[2:4], 'little')
+            bits_per_sample = int.from_bytes(fmt[14:16], 'little')
+            if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                # The sub format GUID starts with the actual format tag
+                format_tag = int.from_bytes(fmt[24:26], 'little')
+            return format_tag, channels, bits_per_sample
+        # Chunks are padded to an even size
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def flac_encodable(file_obj, content_type, file_size):
+    """
+    Check whether an upload is a WAV file that AUDIO_FLAC_ENCODING re-encodes to FLAC.
+
+    Only integer PCM of up to 24 bits and 8 channels qualifies, which FLAC
+    stores losslessly; float and 32-bit WAV files are stored as they are.
+    The position of file_obj is restored.
+    """
+    if not AUDIO_FLAC_ENCODING or FFMPEG is None:
+        return False
+    if content_type not in WAV_CONTENT_TYPES or file_size < AUDIO_FLAC_MIN_BYTES:
+        return False
+
+    position = file_obj.tell()
+    head = file_obj.read(_WAV_HEADER_SIZE)
+    file_obj.seek(position)
+    fmt = wav_format(head)
+    if fmt is None:
+        return False
+    format_tag, channels, bits_per_sample = fmt
+    return format_tag == _WAVE_FORMAT_PCM and 1 <= channels <= 8 and 8 <= bits_per_sample <= 24
+
+
+def _encode_flac(file_obj):
+    # FLAC keeps the sample count and the MD5 of the samples in a header that is
+    # written last, so ffmpeg needs a seekable output file
+    output = tempfile.NamedTemporaryFile(suffix='.flac')
+    try:
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(
+                [FFMPEG, '-hide_banner', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+                 '-map', '0:a', '-c:a', 'flac', '-compression_level', '5', '-y', '-f', 'flac', output.name],
+                stdin=subprocess.PIPE,
+                stderr=errors
+            )
+            try:
+                shutil.copyfileobj(file_obj, process.stdin, _COPY_SIZE)
+                process.stdin.close()
+            except BrokenPipeError:
+                # ffmpeg gave up early; its exit status and messages tell why
+                pass
+            try:
+                returncode = process.wait(timeout=AUDIO_ENCODE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                raise TimeoutError(f"FLAC encoding took longer than {AUDIO_ENCODE_TIMEOUT} seconds")
+            if returncode != 0:
+                errors.seek(0)
+                raise RuntimeError(f"ffmpeg failed: {errors.read().decode(errors='replace').strip()[-500:]}")
+
+        output.seek(0, os.SEEK_END)
+        size = output.tell()
+        output.seek(0)
+        return output, size
+    except Exception:
+        output.close()
+        raise
+
+
+def encode_flac(file_obj):
+    """
+    Losslessly re-encode a PCM WAV file to FLAC on the encoder pool.
+
+    Reads file_obj from its current position to the end.
+
+    Returns:
+        dict: Dictionary containing success status, the FLAC data as a seekable
+        temporary file the caller must close, its size, and any error message
+    """
+    try:
+        output, size = _flac_encoders.submit(_encode_flac, file_obj).result()
+        return {
+            "success": True,
+            "file": output,
+            "size_bytes": size
+        }
+    except Exception as e:
+        logger.error(f"FLAC encoding failed: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+def compress_text(text):
+    """
+    Compress a text with TEXT_COMPRESSION if it is at least TEXT_COMPRESSION_MIN_BYTES long.
+
+    The compressed bytes are base64 encoded so they fit the text_data column.
+    Texts that would not get smaller are left as they are.
+
+    Returns:
+        tuple: (text_data, metadata); metadata describes the encoding, or is None if the text was not compressed
+    """
+    data = text.encode('utf-8')
+    if TEXT_COMPRESSION not in ('gzip', 'zstd') or len(data) < TEXT_COMPRESSION_MIN_BYTES:
+        return text, None
+
+    if TEXT_COMPRESSION == 'zstd':
+        compressed = zstandard.ZstdCompressor(level=TEXT_COMPRESSION_LEVEL).compress(data)
+    else:
+        compressed = gzip.compress(data, compresslevel=TEXT_COMPRESSION_LEVEL, mtime=0)
+    encoded = base64.b64encode(compressed).decode('ascii')
+    if len(encoded) >= len(data):
+        return text, None
+    return encoded, {'text_encoding': f'{TEXT_COMPRESSION}+base64', 'text_size': len(data)}
+
+
+def decompress_text(text_data, metadata):
+    """
+    Return the original text of a text_data value written by compress_text().
+
+    Args:
+        text_data (str): Value of the text_data column
+        metadata (dict): Value of the metadata column
+
+    Raises:
+        ValueError: If the text uses an unknown encoding
+    """
+    encoding = (metadata or {}).get('text_encoding')
+    if not encoding or text_data is None:
+        return text_data
+
+    compressed = base64.b64decode(text_data)
+    if encoding == 'gzip+base64':
+        return gzip.decompress(compressed).decode('utf-8')
+    if encoding == 'zstd+base64':
+        if zstandard is None:
+            raise ValueError("zstandard is not installed, cannot decompress text")
+        return zstandard.ZstdDecompressor().decompress(compressed).decode('utf-8')
+    raise ValueError(f"Unknown text encoding: {encoding}")
+
+
+def text_row(text, user_id=None):
+    """
+    Return the contributions row of a text, compressed where TEXT_COMPRESSION applies.
+
+    With compression enabled every row has a metadata column, since all rows
+    of a bulk insert need the same columns. The row has a user_id column when
+    the text has an owner.
+    """
+    if TEXT_COMPRESSION not in ('gzip', 'zstd'):
+        row = {'text_data': text}
+    else:
+        text_data, metadata = compress_text(text)
+        row = {'text_data': text_data, 'metadata': metadata or {}}
+    if user_id:
+        row['user_id'] = user_id
+    return row
+
+
+class _DecodedBody:
+    """
+    Read a decompressing stream and stop once more than max_size bytes came out of it.
+    """
+
+    def __init__(self, reader, encoding, max_size):
+        self._reader = reader
+        self._encoding = encoding
+        self._remaining = max_size
+
+    def read(self, size=-1):
+        try:
+            data = self._reader.read(size)
+        except (OSError, EOFError) as e:
+            raise ContentDecodingError(f"Invalid {self._encoding} request body: {str(e)}")
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise ContentDecodingError(f"Invalid {self._encoding} request body: {str(e)}")
+            raise
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ContentDecodingError("Decompressed request body too large")
+        return data
+
+
+def decoded_body(stream, content_encoding, max_size):
+    """
+    Wrap a request body stream so that it yields the decompressed body.
+
+    Args:
+        stream: Binary file-like object with the request body
+        content_encoding (str): Value of the Content-Encoding header (identity, gzip, or zstd)
+        max_size (int): Most decompressed bytes that may be read
+
+    Returns:
+        A binary file-like object
+
+    Raises:
+        ContentDecodingError: If the encoding is not supported
+    """
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return stream
+    if encoding in ('gzip', 'x-gzip'):
+        return _DecodedBody(gzip.GzipFile(fileobj=stream, mode='rb'), 'gzip', max_size)
+    if encoding == 'zstd' and zstandard is not None:
+        return _DecodedBody(zstandard.ZstdDecompressor().stream_reader(stream), 'zstd', max_size)
+    raise ContentDecodingError(f"Unsupported Content-Encoding: {content_encoding}")
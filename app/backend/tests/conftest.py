@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+# The backend modules are imported flat, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings read when the modules are first imported; nothing here reaches a real service
+_state_dir = tempfile.mkdtemp(prefix='dynocollect-tests-')
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.test")
+os.environ.setdefault("SUPABASE_S3_KEY", "test")
+os.environ.setdefault("SUPABASE_S3_SECRET", "test")
+os.environ["UPLOAD_STATE_DB"] = os.path.join(_state_dir, 'upload_state.db')
+os.environ["MEDIA_INDEX_DB"] = os.path.join(_state_dir, 'media_index.db')
+os.environ["MEDIA_INDEX_RECONCILE_INTERVAL"] = "0"
+os.environ["DERIVATIVES_EAGER"] = "false"
+os.environ["REQUIRE_AUTH"] = "false"
+os.environ["LOG_LEVEL"] = "ERROR"
+
+import pytest
+
+
+@pytest.fixture
+def backend():
+    # Imported on first use, so the unit tests do not pay for the app's setup
+    import app as backend
+    backend.app.testing = True
+    return backend
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
@@ -0,0 +1,130 @@
+import hmac
+import json
+import time
+import base64
+import hashlib
+
+import pytest
+
+from auth_tokens import TokenVerifier, InvalidToken
+from resilience import DependencyBusy
+
+SECRET = 'test-jwt-secret'
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def make_token(secret=SECRET, algorithm='HS256', **claims):
+    claims = dict({'sub': 'user-1', 'aud': 'authenticated', 'exp': time.time() + 3600}, **claims)
+    header = _b64encode(json.dumps({'alg': algorithm, 'typ': 'JWT'}).encode())
+    payload = _b64encode(json.dumps(claims).encode())
+    signature = hmac.new(secret.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+    return f"{header}.{payload}.{_b64encode(signature)}"
+
+
+def make_verifier(**kwargs):
+    return TokenVerifier(**dict({'secret': SECRET, 'jwks_url': None, 'issuer': None, 'leeway': 0}, **kwargs))
+
+
+def test_valid_hs256_token_returns_its_claims():
+    claims = make_verifier().verify(make_token(email='a@example.com'))
+
+    assert claims['sub'] == 'user-1'
+    assert claims['email'] == 'a@example.com'
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    with pytest.raises(InvalidToken, match='Invalid signature'):
+        make_verifier().verify(make_token(secret='other-secret'))
+
+
+def test_tampered_claims_are_rejected():
+    header, _, signature = make_token().split('.')
+    payload = _b64encode(json.dumps({'sub': 'admin', 'aud': 'authenticated', 'exp': time.time() + 3600}).encode())
+
+    with pytest.raises(InvalidToken, match='Invalid signature'):
+        make_verifier().verify(f"{header}.{payload}.{signature}")
+
+
+def test_malformed_token_is_rejected():
+    with pytest.raises(InvalidToken, match='Malformed token'):
+        make_verifier().verify('not-a-token')
+
+
+def test_expired_token_is_rejected():
+    with pytest.raises(InvalidToken, match='Token expired'):
+        make_verifier().verify(make_token(exp=time.time() - 60))
+
+
+def test_expiry_within_the_leeway_is_accepted():
+    assert make_verifier(leeway=120).verify(make_token(exp=time.time() - 60))['sub'] == 'user-1'
+
+
+def test_token_without_expiry_is_rejected():
+    with pytest.raises(InvalidToken, match='no expiry'):
+        make_verifier().verify(make_token(exp=None))
+
+
+def test_token_not_yet_valid_is_rejected():
+    with pytest.raises(InvalidToken, match='not yet valid'):
+        make_verifier().verify(make_token(nbf=time.time() + 600))
+
+
+def test_wrong_audience_and_issuer_are_rejected():
+    with pytest.raises(InvalidToken, match='Invalid audience'):
+        make_verifier().verify(make_token(aud='anon'))
+    with pytest.raises(InvalidToken, match='Invalid issuer'):
+        make_verifier(issuer='https://project.supabase.co/auth/v1').verify(make_token(iss='https://evil'))
+
+
+def test_revoked_token_is_rejected_even_when_cached():
+    verifier = make_verifier()
+    token = make_token()
+    verifier.verify(token)
+
+    verifier.revoke(token)
+
+    with pytest.raises(InvalidToken, match='Token was revoked'):
+        verifier.verify(token)
+    assert verifier.verify(make_token(sub='user-2'))['sub'] == 'user-2'
+
+
+def test_verified_tokens_are_cached_until_they_expire(monkeypatch):
+    verifier = make_verifier()
+    token = make_token(exp=time.time() + 3600)
+    verifier.verify(token)
+
+    def fail(token):
+        raise AssertionError('token verified again')
+    monkeypatch.setattr(verifier, '_verify_uncached', fail)
+
+    assert verifier.verify(token)['sub'] == 'user-1'
+
+
+def test_tokens_that_cannot_be_checked_locally_go_to_the_fallback():
+    checked = []
+    verifier = make_verifier(secret=None, fallback=checked.append)
+    token = make_token()
+
+    assert verifier.verify(token)['sub'] == 'user-1'
+    assert checked == [token]
+
+
+def test_fallback_rejection_is_an_invalid_token_but_an_outage_is_not():
+    def reject(token):
+        raise ValueError('invalid JWT')
+
+    def unavailable(token):
+        raise DependencyBusy('supabase_auth')
+
+    with pytest.raises(InvalidToken, match='Token rejected'):
+        make_verifier(secret=None, fallback=reject).verify(make_token())
+    with pytest.raises(DependencyBusy):
+        make_verifier(secret=None, fallback=unavailable).verify(make_token())
+
+
+def test_tokens_that_cannot_be_checked_at_all_are_rejected():
+    with pytest.raises(InvalidToken, match='Cannot verify'):
+        make_verifier(secret=None).verify(make_token())
@@ -0,0 +1,92 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import s3_uploader
+
+
+class FakeContributions:
+    """Contributions table answering the select/update chains of save_contribution_metadata."""
+
+    def __init__(self, metadata, before_update=None):
+        self.metadata = metadata
+        self.before_update = before_update
+        self.updates = 0
+
+    def table(self, name):
+        return FakeQuery(self)
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+        self.values = None
+        self.expected = []
+
+    def select(self, columns):
+        return self
+
+    def update(self, values):
+        self.values = values
+        return self
+
+    def eq(self, column, value):
+        if column == 'metadata':
+            self.expected.append(json.loads(value))
+        return self
+
+    def is_(self, column, value):
+        self.expected.append(None)
+        return self
+
+    def execute(self):
+        if self.values is None:
+            return SimpleNamespace(data=[{'metadata': self.table.metadata}])
+        if self.table.before_update:
+            # Another writer gets in between this read and this update
+            self.table.before_update(self.table)
+            self.table.before_update = None
+        self.table.updates += 1
+        if any(expected != self.table.metadata for expected in self.expected):
+            return SimpleNamespace(data=[])
+        self.table.metadata = self.values['metadata']
+        return SimpleNamespace(data=[{'id': 1, 'metadata': self.table.metadata}])
+
+
+@pytest.fixture
+def contributions(monkeypatch):
+    def install(metadata, before_update=None):
+        table = FakeContributions(metadata, before_update)
+        monkeypatch.setattr(s3_uploader, 'supabase', table)
+        return table
+    return install
+
+
+def test_metadata_is_merged_into_the_existing_keys(contributions):
+    table = contributions({'encoding': 'flac'})
+
+    result = s3_uploader.save_contribution_metadata(1, {'derivatives': {'thumbnail': 'http://s3/t.jpg'}})
+
+    assert result["success"]
+    assert table.metadata == {'encoding': 'flac', 'derivatives': {'thumbnail': 'http://s3/t.jpg'}}
+
+
+def test_concurrent_merge_is_retried_instead_of_overwritten(contributions):
+    def other_writer(table):
+        table.metadata = dict(table.metadata, size=12)
+
+    table = contributions({'encoding': 'flac'}, before_update=other_writer)
+
+    result = s3_uploader.save_contribution_metadata(1, {'derivatives': {}})
+
+    assert result["success"]
+    assert table.metadata == {'encoding': 'flac', 'size': 12, 'derivatives': {}}
+    assert table.updates == 2
+
+
+def test_empty_metadata_is_only_replaced_while_still_empty(contributions):
+    table = contributions(None)
+
+    assert s3_uploader.save_contribution_metadata(1, {'size': 3})["success"]
+    assert table.metadata == {'size': 3}
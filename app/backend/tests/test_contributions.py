@@ -0,0 +1,144 @@
+import pytest
+
+
+ROWS = [
+    {'id': 3, 'text_data': 'c', 'submitted_at': '2024-01-03T00:00:00+00:00'},
+    {'id': 2, 'text_data': 'b', 'submitted_at': '2024-01-02T00:00:00+00:00'},
+    {'id': 1, 'text_data': 'a', 'submitted_at': '2024-01-01T00:00:00+00:00'},
+]
+
+
+@pytest.fixture
+def contributions(backend, monkeypatch):
+    """Serve ROWS from a fake database and record the reads."""
+    reads = []
+
+    def fetch_contributions(columns, sort, descending, after, limit, contribution_type, user_id):
+        reads.append(after)
+        position = lambda row: (row[sort], row['id'])
+        rows = sorted(ROWS, key=position, reverse=descending)
+        if after:
+            after = tuple(after)
+            rows = [row for row in rows if (position(row) < after if descending else position(row) > after)]
+        return {"success": True, "data": [{column: row.get(column) for column in columns} for row in rows[:limit]]}
+
+    monkeypatch.setattr(backend, 'fetch_contributions', fetch_contributions)
+    backend.contributions_cache.clear()
+    yield reads
+    backend.contributions_cache.clear()
+
+
+def test_cursor_round_trips_the_position_of_a_row(backend):
+    cursor = backend.encode_cursor('submitted_at', 'desc', ROWS[1])
+
+    assert backend.decode_cursor(cursor, 'submitted_at', 'desc') == (ROWS[1]['submitted_at'], 2)
+
+
+def test_cursor_of_another_sort_order_is_rejected(backend):
+    cursor = backend.encode_cursor('submitted_at', 'desc', ROWS[1])
+
+    with pytest.raises(ValueError, match='another sort order'):
+        backend.decode_cursor(cursor, 'submitted_at', 'asc')
+    with pytest.raises(ValueError, match='another sort order'):
+        backend.decode_cursor(cursor, 'id', 'desc')
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'bm90IGpzb24', 'WzEsMl0'])
+def test_malformed_cursor_is_rejected(backend, cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        backend.decode_cursor(cursor, 'id', 'desc')
+
+
+def test_pages_follow_the_cursor(client, contributions):
+    first = client.get('/contributions?limit=2&fields=id,text_data')
+    assert first.status_code == 200
+    assert first.json['data'] == [{'id': 3, 'text_data': 'c'}, {'id': 2, 'text_data': 'b'}]
+    assert first.json['has_more'] is True
+
+    second = client.get(f"/contributions?limit=2&fields=id,text_data&cursor={first.json['next_cursor']}")
+    assert second.json['data'] == [{'id': 1, 'text_data': 'a'}]
+    assert second.json['has_more'] is False
+    assert second.json['next_cursor'] is None
+
+
+def test_bad_cursor_is_answered_with_400(client, contributions):
+    response = client.get('/contributions?cursor=garbage')
+
+    assert response.status_code == 400
+    assert contributions == []
+
+
+def test_unchanged_page_is_answered_with_304(client, contributions):
+    first = client.get('/contributions?limit=2')
+    etag = first.headers['ETag']
+    assert etag
+
+    second = client.get('/contributions?limit=2', headers={'If-None-Match': etag})
+
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+    # The second request was served from the page cache
+    assert len(contributions) == 1
+
+
+def test_changed_page_is_sent_in_full(backend, client, contributions):
+    etag = client.get('/contributions?limit=2').headers['ETag']
+    backend.contributions_cache.clear()
+    ROWS.insert(0, {'id': 4, 'text_data': 'd', 'submitted_at': '2024-01-04T00:00:00+00:00'})
+    try:
+        response = client.get('/contributions?limit=2', headers={'If-None-Match': etag})
+    finally:
+        ROWS.pop(0)
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json['data'][0]['id'] == 4
+
+
+def test_busy_database_is_answered_with_503(backend, client, monkeypatch):
+    backend.contributions_cache.clear()
+    monkeypatch.setattr(backend, 'fetch_contributions',
+                        lambda *args, **kwargs: {"success": False, "busy": True, "error": "busy"})
+
+    response = client.get('/contributions')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+
+def test_user_id_me_reads_the_contributions_of_the_token_user(backend, client, monkeypatch):
+    reads = []
+    backend.contributions_cache.clear()
+    monkeypatch.setattr(backend, 'REQUIRE_AUTH', True)
+    monkeypatch.setattr(backend.token_verifier, 'verify', lambda token: {'sub': 'user-1'})
+    monkeypatch.setattr(backend, 'fetch_contributions',
+                        lambda *args, **kwargs: reads.append(kwargs['user_id']) or {"success": True, "data": []})
+
+    response = client.get('/contributions?user_id=me', headers={'Authorization': 'Bearer token'})
+
+    assert response.status_code == 200
+    assert reads == ['user-1']
+
+
+@pytest.mark.parametrize('sort, descending, params', [
+    ('id', True, {'order': 'id.desc', 'id': 'lt.2'}),
+    ('submitted_at', False, {
+        'order': 'submitted_at.asc,id.asc',
+        'or': '(submitted_at.gt."2024-01-02",and(submitted_at.eq."2024-01-02",id.gt."2"))'
+    }),
+])
+def test_pages_are_read_with_a_keyset_query(monkeypatch, sort, descending, params):
+    import s3_uploader
+    queries = []
+    monkeypatch.setattr(s3_uploader.supabase_db, 'call',
+                        lambda execute, **kwargs: queries.append(execute.__self__) or type('Result', (), {'data': []}))
+
+    result = s3_uploader.fetch_contributions(['id'], sort=sort, descending=descending,
+                                             after=('2024-01-02', 2), limit=3, user_id='user-1')
+
+    assert result == {"success": True, "data": []}
+    sent = dict(queries[0].params)
+    assert {key: sent[key] for key in params} == params
+    assert sent['user_id'] == 'eq.user-1'
+    assert sent['limit'] == '3'
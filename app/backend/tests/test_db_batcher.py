@@ -0,0 +1,140 @@
+import threading
+
+import pytest
+
+from db_batcher import InsertBatcher, BatcherFull
+
+
+class RecordingInsert:
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    def __call__(self, rows):
+        self.batches.append(list(rows))
+        if self.error:
+            raise self.error
+        return [dict(row, id=len(self.batches) * 1000 + i) for i, row in enumerate(rows)]
+
+
+def test_close_flushes_queued_rows():
+    insert = RecordingInsert()
+    batcher = InsertBatcher(insert, max_batch_size=100, max_delay=0.2)
+    futures = [batcher.submit({'text_data': str(i)}) for i in range(5)]
+
+    batcher.close()
+
+    assert all(future.done() for future in futures)
+    assert [future.result()['text_data'] for future in futures] == ['0', '1', '2', '3', '4']
+    assert sum(len(batch) for batch in insert.batches) == 5
+
+
+def test_submit_after_close_is_rejected():
+    batcher = InsertBatcher(RecordingInsert())
+    batcher.close()
+
+    with pytest.raises(RuntimeError):
+        batcher.submit({'text_data': 'late'})
+
+
+def test_rows_are_coalesced_up_to_the_batch_size():
+    insert = RecordingInsert()
+    batcher = InsertBatcher(insert, max_batch_size=3, max_delay=0.5)
+    futures = [batcher.submit({'text_data': str(i)}) for i in range(7)]
+    for future in futures:
+        future.result(timeout=5)
+    batcher.close()
+
+    assert all(len(batch) <= 3 for batch in insert.batches)
+    assert len(insert.batches) < 7
+
+
+def test_rows_with_different_columns_go_in_separate_inserts():
+    insert = RecordingInsert()
+    batcher = InsertBatcher(insert, max_batch_size=10, max_delay=0.2)
+    text = batcher.submit({'text_data': 'a'})
+    audio = batcher.submit({'audio_url': 'https://example.com/a.wav'})
+    batcher.close()
+
+    assert text.result()['text_data'] == 'a'
+    assert audio.result()['audio_url'] == 'https://example.com/a.wav'
+    assert all(len({tuple(sorted(row)) for row in batch}) == 1 for batch in insert.batches)
+
+
+def test_insert_errors_reach_every_row_of_the_batch():
+    batcher = InsertBatcher(RecordingInsert(error=RuntimeError('database down')), max_delay=0.2)
+    futures = [batcher.submit({'text_data': str(i)}) for i in range(3)]
+    batcher.close()
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match='database down'):
+            future.result()
+
+
+def test_submit_raises_batcher_full_when_the_queue_stays_full():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_insert(rows):
+        started.set()
+        release.wait(5)
+        return rows
+
+    batcher = InsertBatcher(slow_insert, max_batch_size=1, max_delay=0, max_queue_size=1, enqueue_timeout=0.05)
+    batcher.submit({'text_data': 'in flight'})
+    assert started.wait(2)
+    batcher.submit({'text_data': 'queued'})
+
+    with pytest.raises(BatcherFull):
+        batcher.submit({'text_data': 'rejected'})
+
+    release.set()
+    batcher.close()
+
+
+def test_rows_submitted_while_closing_are_inserted_or_rejected():
+    insert = RecordingInsert()
+    batcher = InsertBatcher(insert, max_batch_size=10, max_delay=0.001)
+    futures = []
+    rejected = []
+    start = threading.Barrier(5)
+
+    def submit_many():
+        start.wait()
+        for i in range(200):
+            try:
+                futures.append(batcher.submit({'text_data': str(i)}))
+            except RuntimeError:
+                rejected.append(i)
+
+    workers = [threading.Thread(target=submit_many) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    batcher.close()
+    for worker in workers:
+        worker.join()
+
+    # No row is left queued with a future nobody resolves
+    assert all(future.done() for future in futures)
+    assert len(futures) + len(rejected) == 800
+
+
+def test_sync_insert_that_outlasts_the_wait_is_answered_as_queued(monkeypatch):
+    import s3_uploader
+    release = threading.Event()
+
+    def slow_insert(rows):
+        release.wait(5)
+        return rows
+
+    batcher = InsertBatcher(slow_insert, max_delay=0)
+    monkeypatch.setattr(s3_uploader, 'contributions_batcher', batcher)
+    monkeypatch.setattr(s3_uploader, 'DB_BATCH_MODE', 'sync')
+    monkeypatch.setattr(s3_uploader, 'DB_INSERT_TIMEOUT', 0.05)
+
+    result = s3_uploader.insert_contribution({'text_data': 'slow'})
+
+    release.set()
+    batcher.close()
+    assert result == {"success": True, "data": None, "queued": True}
@@ -0,0 +1,63 @@
+import io
+import sys
+import json
+import queue
+import logging
+
+import pytest
+
+from logging_config import configure_logging, stop_logging, DroppingQueueHandler
+
+
+@pytest.fixture
+def log_output():
+    output = io.StringIO()
+    yield output
+    stop_logging()
+    configure_logging(level='ERROR')
+
+
+def test_records_are_queued_unformatted():
+    handler = DroppingQueueHandler(queue.Queue())
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logging.getLogger('test').makeRecord('test', logging.ERROR, __file__, 1, 'failed %s', ('upload',),
+                                                       exc_info=sys.exc_info())
+    handler.handle(record)
+
+    queued = handler.queue.get_nowait()
+    assert queued.args == ('upload',)
+    assert queued.exc_info is not None
+    assert queued.exc_text is None
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    logger = logging.getLogger('test.dropping')
+    for _ in range(3):
+        handler.handle(logger.makeRecord('test', logging.INFO, __file__, 1, 'line', (), None))
+
+    assert handler.dropped == 2
+
+
+def test_json_lines_carry_the_exception_and_extra_fields(log_output):
+    configure_logging(level='INFO', fmt='json', stream=log_output)
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logging.getLogger('test.json').exception('upload %s failed', 'a.wav', extra={'bucket': 'audio'})
+    stop_logging()
+
+    entry = json.loads(log_output.getvalue().splitlines()[-1])
+    assert entry['message'] == 'upload a.wav failed'
+    assert entry['bucket'] == 'audio'
+    assert 'ValueError: boom' in entry['exception']
+
+
+def test_text_is_the_default_format(log_output):
+    configure_logging(level='INFO', stream=log_output)
+    logging.getLogger('test.text').info('hello')
+    stop_logging()
+
+    assert log_output.getvalue().rstrip().endswith(' - test.text - INFO - hello')
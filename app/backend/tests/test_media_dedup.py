@@ -0,0 +1,61 @@
+import io
+import hashlib
+
+import pytest
+
+import s3_uploader
+from media_index import MediaIndex
+
+SHA256 = hashlib.sha256(b'content').hexdigest()
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    media_index = MediaIndex(str(tmp_path / 'media_index.db'))
+    media_index.add(SHA256, 'audio', 'audio/a.wav', 'https://example.com/a.wav', 7)
+    monkeypatch.setattr(s3_uploader, 'media_index', media_index)
+    return media_index
+
+
+def test_duplicate_is_returned_while_its_object_exists(index, monkeypatch):
+    monkeypatch.setattr(s3_uploader, 'get_object_info', lambda bucket, key: {"success": True, "exists": True})
+
+    assert s3_uploader.find_duplicate(SHA256, 'audio')['url'] == 'https://example.com/a.wav'
+    assert s3_uploader.find_duplicate(SHA256, 'video') is None
+
+
+def test_entry_of_a_deleted_object_is_dropped(index, monkeypatch):
+    monkeypatch.setattr(s3_uploader, 'get_object_info', lambda bucket, key: {"success": True, "exists": False})
+
+    assert s3_uploader.find_duplicate(SHA256, 'audio') is None
+    assert index.lookup(SHA256, 'audio') is None
+
+
+def test_entry_is_not_trusted_when_its_object_cannot_be_checked(index, monkeypatch):
+    monkeypatch.setattr(s3_uploader, 'get_object_info', lambda bucket, key: {"success": False, "error": "timeout"})
+
+    assert s3_uploader.find_duplicate(SHA256, 'audio') is None
+    # The object may well exist, so the entry is kept for the next upload
+    assert index.lookup(SHA256, 'audio') is not None
+
+
+class FakeBody:
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def iter_chunks(self, chunk_size):
+        return iter(lambda: self._data.read(chunk_size), b'')
+
+
+def test_completed_uploads_are_hashed_into_the_index(index, monkeypatch):
+    class FakeS3:
+        def get_object(self, Bucket, Key):
+            return {'Body': FakeBody(b'other content')}
+
+    monkeypatch.setattr(s3_uploader, 'get_s3_client', lambda: FakeS3())
+
+    result = s3_uploader.index_stored_object('images', 'images/b.png', 'https://example.com/b.png')
+
+    assert result == {"success": True, "sha256": hashlib.sha256(b'other content').hexdigest()}
+    entry = index.lookup(result['sha256'], 'images')
+    assert (entry['object_key'], entry['size']) == ('images/b.png', 13)
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import derivatives
+from derivatives import DerivativePipeline
+from rate_limit import RateLimiter
+
+
+def test_limiter_allows_limit_events_per_window():
+    limiter = RateLimiter(2, period=30)
+
+    assert limiter.acquire('a') == 0
+    assert limiter.acquire('a') == 0
+    assert 1 <= limiter.acquire('a') <= 30
+    assert limiter.acquire('b') == 0
+
+
+def test_limiter_starts_a_new_window_after_the_period():
+    limiter = RateLimiter(1, period=0.05)
+    assert limiter.acquire('a') == 0
+    assert limiter.acquire('a') > 0
+
+    time.sleep(0.06)
+
+    assert limiter.acquire('a') == 0
+
+
+def test_limit_of_zero_disables_the_limiter():
+    limiter = RateLimiter(0)
+
+    assert all(limiter.acquire('a') == 0 for _ in range(100))
+
+
+@pytest.fixture
+def pipeline(backend, monkeypatch):
+    """Serve renders of existing originals from a pipeline that records them."""
+    stored = {'images/photo.jpg', 'images/other.jpg', 'images/ready.jpg', 'images/ready.jpg.thumb.jpg'}
+    renders = []
+
+    pipeline = DerivativePipeline(
+        source_url=lambda bucket, key: {"success": True, "url": f'http://s3/{bucket}/{key}'},
+        object_info=lambda bucket, key: {"success": True, "exists": f'{bucket}/{key}' in stored},
+        store=lambda bucket, key, body, content_type: {"success": True, "url": f'http://s3/{bucket}/{key}'},
+        public_url_format='http://s3/{bucket}/{filename}',
+        use_processes=False
+    )
+    monkeypatch.setattr(derivatives, 'missing_dependency', lambda bucket_name, kind: None)
+    monkeypatch.setattr(pipeline, '_render', lambda bucket_name, kind, url: renders.append(url) or b'jpeg')
+    monkeypatch.setattr(backend, 'derivative_pipeline', pipeline)
+    monkeypatch.setattr(backend, 'derivative_limiter', RateLimiter(1, period=60))
+    return renders
+
+
+def test_renders_beyond_the_limit_are_refused_without_auth(client, pipeline):
+    first = client.get('/derivatives/images/thumbnail/photo.jpg')
+    assert first.status_code == 302
+
+    second = client.get('/derivatives/images/thumbnail/other.jpg')
+    assert second.status_code == 429
+    assert int(second.headers['Retry-After']) >= 1
+    assert pipeline == ['http://s3/images/photo.jpg']
+
+    # Refusals are not cached, and served derivatives do not count against the limit
+    assert client.get('/derivatives/images/thumbnail/other.jpg').status_code == 429
+    assert client.get('/derivatives/images/thumbnail/photo.jpg').status_code == 302
+    assert client.get('/derivatives/images/thumbnail/ready.jpg').status_code == 302
@@ -0,0 +1,262 @@
+import time
+import threading
+
+import httpx
+import pytest
+
+import resilience
+from resilience import (
+    CircuitBreaker, Dependency, CircuitOpen, DeadlineExceeded, DependencyBusy, DependencyFailed,
+    OutcomeUnknown, deadline, start_deadline, end_deadline, time_remaining
+)
+
+
+def make_dependency(**kwargs):
+    settings = dict(timeout=1, max_concurrent=4, attempts=3, base_delay=0.01, max_delay=0.01,
+                    breaker=CircuitBreaker('test', failure_threshold=3, reset_timeout=0.1))
+    settings.update(kwargs)
+    return Dependency('test', **settings)
+
+
+def fail_with(error, calls):
+    def call():
+        calls.append(1)
+        raise error
+    return call
+
+
+# ---------- CircuitBreaker ----------
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('opens', failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after >= 1
+
+
+def test_breaker_success_resets_the_failure_count():
+    breaker = CircuitBreaker('resets', failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == 'closed'
+
+
+def test_half_open_breaker_lets_one_trial_call_through():
+    breaker = CircuitBreaker('trial', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_failed_trial_call_opens_the_breaker_again():
+    breaker = CircuitBreaker('reopens', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_released_trial_lets_the_next_call_be_the_trial():
+    breaker = CircuitBreaker('released', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+
+    breaker.release_trial()
+
+    breaker.before_call()
+
+
+# ---------- Dependency ----------
+
+def test_unsent_errors_are_retried_until_the_call_succeeds():
+    dependency = make_dependency()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise httpx.ConnectError('refused')
+        return 'ok'
+
+    assert dependency.call(flaky, idempotent=False) == 'ok'
+    assert len(calls) == 3
+    assert dependency.breaker.state == 'closed'
+
+
+def test_errors_the_service_answered_with_are_not_retried():
+    dependency = make_dependency()
+    calls = []
+
+    with pytest.raises(ValueError):
+        dependency.call(fail_with(ValueError('bad request'), calls))
+    assert len(calls) == 1
+    assert dependency.breaker.failures == 0
+
+
+def test_repeated_failures_raise_dependency_failed_and_open_the_circuit():
+    dependency = make_dependency()
+    calls = []
+
+    with pytest.raises(DependencyFailed) as raised:
+        dependency.call(fail_with(httpx.ConnectError('refused'), calls))
+    assert isinstance(raised.value.__cause__, httpx.ConnectError)
+    assert len(calls) == 3
+    assert dependency.breaker.state == 'open'
+
+    with pytest.raises(CircuitOpen):
+        dependency.call(fail_with(httpx.ConnectError('refused'), calls))
+    assert len(calls) == 3
+
+
+def test_transient_failure_of_a_write_is_not_retried_and_not_reported_as_busy():
+    dependency = make_dependency()
+    calls = []
+
+    with pytest.raises(OutcomeUnknown):
+        dependency.call(fail_with(httpx.ReadTimeout('slow'), calls), idempotent=False)
+    assert len(calls) == 1
+
+
+def test_transient_failure_of_a_read_is_retried():
+    dependency = make_dependency()
+    calls = []
+
+    with pytest.raises(DependencyFailed):
+        dependency.call(fail_with(httpx.ReadTimeout('slow'), calls))
+    assert len(calls) == 3
+
+
+def test_timed_out_read_raises_deadline_exceeded():
+    dependency = make_dependency(timeout=0.05)
+
+    with pytest.raises(DeadlineExceeded):
+        dependency.call(time.sleep, 0.5)
+
+
+def test_timed_out_write_raises_outcome_unknown():
+    dependency = make_dependency(timeout=0.05)
+
+    with pytest.raises(OutcomeUnknown):
+        dependency.call(time.sleep, 0.5, idempotent=False)
+
+
+def test_calls_beyond_the_concurrency_limit_are_rejected():
+    dependency = make_dependency(max_concurrent=1)
+    release = threading.Event()
+    worker = threading.Thread(target=dependency.call, args=(release.wait, 2))
+    worker.start()
+    time.sleep(0.05)
+
+    try:
+        with pytest.raises(DependencyBusy):
+            dependency.call(lambda: 'ok')
+    finally:
+        release.set()
+        worker.join()
+    assert dependency.call(lambda: 'ok') == 'ok'
+
+
+def test_hedged_read_returns_the_first_answer():
+    dependency = make_dependency(hedge_delay=0.05)
+    calls = []
+
+    def slow_then_fast():
+        calls.append(1)
+        time.sleep(0.5 if len(calls) == 1 else 0)
+        return len(calls)
+
+    start = time.monotonic()
+    assert dependency.call(slow_then_fast, hedge=True) == 2
+    assert time.monotonic() - start < 0.4
+
+
+# ---------- Deadlines ----------
+
+def test_nested_deadline_can_only_shorten_the_enclosing_one():
+    with deadline(0.5):
+        with deadline(10):
+            assert time_remaining() <= 0.5
+        with deadline(0.1):
+            assert time_remaining() <= 0.1
+    assert time_remaining() is None
+
+
+def test_calls_after_the_deadline_fail_without_being_made():
+    dependency = make_dependency()
+    calls = []
+
+    with deadline(0.01):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceeded):
+            dependency.call(lambda: calls.append(1))
+    assert calls == []
+
+
+def test_the_deadline_bounds_the_call_timeout():
+    dependency = make_dependency(timeout=5)
+
+    start = time.monotonic()
+    with deadline(0.05):
+        with pytest.raises(DeadlineExceeded):
+            dependency.call(time.sleep, 0.5)
+    assert time.monotonic() - start < 0.4
+
+
+def test_lazy_deadline_starts_at_its_first_check():
+    token = start_deadline(0.2, lazy=True)
+    try:
+        time.sleep(0.3)
+        assert 0.1 < time_remaining() <= 0.2
+    finally:
+        end_deadline(token)
+
+
+def test_retry_budget_is_shared_by_the_calls_under_a_deadline():
+    dependency = make_dependency(attempts=10, base_delay=0.04, max_delay=0.04,
+                                 breaker=CircuitBreaker('budget', failure_threshold=100))
+    calls = []
+
+    token = start_deadline(30)
+    try:
+        # A budget smaller than two backoffs lets each call retry at most once
+        resilience._deadline.get().retry_budget = 0.05
+        start = time.monotonic()
+        for _ in range(3):
+            with pytest.raises(DependencyFailed):
+                dependency.call(fail_with(httpx.ConnectError('refused'), calls))
+    finally:
+        end_deadline(token)
+
+    assert time.monotonic() - start < 0.2
+    assert len(calls) < 30
+
+
+def test_deadline_is_not_shared_between_threads():
+    seen = []
+    with deadline(0.5):
+        worker = threading.Thread(target=lambda: seen.append(time_remaining()))
+        worker.start()
+        worker.join()
+    assert seen == [None]
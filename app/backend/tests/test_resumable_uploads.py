@@ -0,0 +1,81 @@
+import pytest
+
+PART_SIZE = 8
+WAV_HEADER = b'RIFF\x00\x00\x00\x00WAVE'
+
+
+@pytest.fixture
+def stored_parts(backend, monkeypatch):
+    """Accept parts without reaching storage and record the ones sent to it."""
+    parts = []
+
+    def upload_part(bucket, object_key, storage_upload_id, part_number, body):
+        parts.append((part_number, len(body)))
+        return {"success": True, "etag": f"etag-{part_number}"}
+
+    monkeypatch.setattr(backend, 'upload_part', upload_part)
+    monkeypatch.setattr(backend, 'sniff_content_type',
+                        lambda head, bucket: {"success": True, "content_type": 'audio/wav'})
+    return parts
+
+
+def create_upload(backend, total_size=None):
+    session = backend.upload_sessions.create('storage-upload', 'audio', 'audio/a.wav', 'audio_url', 'a.wav',
+                                             'audio/wav', PART_SIZE, total_size)
+    return session['upload_id']
+
+
+def put_part(client, upload_id, part_number, size):
+    return client.put(f'/uploads/{upload_id}/parts/{part_number}', data=(WAV_HEADER * 2)[:size])
+
+
+def test_parts_of_the_announced_sizes_are_stored(backend, client, stored_parts):
+    upload_id = create_upload(backend, total_size=20)
+
+    assert put_part(client, upload_id, 1, 8).status_code == 200
+    assert put_part(client, upload_id, 2, 8).status_code == 200
+    assert put_part(client, upload_id, 3, 4).status_code == 200
+    assert stored_parts == [(1, 8), (2, 8), (3, 4)]
+
+
+def test_short_part_before_the_last_is_rejected(backend, client, stored_parts):
+    upload_id = create_upload(backend, total_size=20)
+
+    response = put_part(client, upload_id, 2, 5)
+
+    assert response.status_code == 400
+    assert 'must be 8 bytes' in response.json['error']
+    assert stored_parts == []
+
+
+def test_last_part_must_hold_the_rest_of_the_file(backend, client, stored_parts):
+    upload_id = create_upload(backend, total_size=20)
+
+    assert put_part(client, upload_id, 3, 8).status_code == 400
+    assert put_part(client, upload_id, 4, 4).status_code == 400
+    assert stored_parts == []
+
+
+def test_part_larger_than_the_part_size_is_rejected(backend, client, stored_parts):
+    upload_id = create_upload(backend, total_size=20)
+
+    assert put_part(client, upload_id, 1, 9).status_code == 413
+    assert stored_parts == []
+
+
+def test_without_a_total_size_only_the_last_part_may_be_short(backend, client, stored_parts):
+    upload_id = create_upload(backend)
+
+    assert put_part(client, upload_id, 1, 8).status_code == 200
+    assert put_part(client, upload_id, 3, 8).status_code == 200
+    # A short part 2 would be followed by the full part 3
+    assert put_part(client, upload_id, 2, 5).status_code == 400
+    assert put_part(client, upload_id, 2, 8).status_code == 200
+    assert put_part(client, upload_id, 4, 3).status_code == 200
+    # Part 4 was short, so no part may follow it
+    assert put_part(client, upload_id, 5, 8).status_code == 400
+    assert stored_parts == [(1, 8), (3, 8), (2, 8), (4, 3)]
+
+
+def test_parts_of_an_unknown_upload_are_rejected(client, stored_parts):
+    assert put_part(client, 'missing', 1, 8).status_code == 404
@@ -0,0 +1,66 @@
+import io
+
+import pytest
+
+BOUNDARY = 'test-boundary'
+WAV_HEADER = b'RIFF\x00\x00\x00\x00WAVE'
+
+
+class RecordingUpload:
+    """Stands in for StreamingUpload and records what reaches storage."""
+    created = []
+
+    def __init__(self, filename, bucket_name, content_type=None, expected_size=None):
+        self.written = 0
+        self.aborted = False
+        self.created.append(self)
+
+    def write(self, data):
+        self.written += len(data)
+
+    def complete(self):
+        raise AssertionError('the upload should not complete')
+
+    def abort(self):
+        self.aborted = True
+
+
+@pytest.fixture
+def streaming(backend, monkeypatch):
+    RecordingUpload.created = []
+    monkeypatch.setitem(backend.app.config, 'STREAMING_UPLOADS', True)
+    monkeypatch.setitem(backend.app.config, 'MAX_CONTENT_LENGTH', 4096)
+    monkeypatch.setattr(backend, 'StreamingUpload', RecordingUpload)
+    monkeypatch.setattr(backend, 'sniff_content_type',
+                        lambda head, bucket: {"success": True, "content_type": 'audio/wav'})
+    return RecordingUpload.created
+
+
+def multipart_body(size):
+    data = (WAV_HEADER * (size // len(WAV_HEADER) + 1))[:size]
+    return (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="a.wav"\r\n'
+            f'Content-Type: audio/wav\r\n\r\n').encode() + data + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+def test_announced_body_over_the_limit_is_rejected_before_reading_it(client, streaming):
+    response = client.post('/upload-audio', data=multipart_body(8192),
+                           content_type=f'multipart/form-data; boundary={BOUNDARY}')
+
+    assert response.status_code == 413
+    assert streaming == []
+
+
+def test_chunked_body_over_the_limit_aborts_the_upload(backend, client, streaming, monkeypatch):
+    # Over the limit with the second read, after the upload has started
+    monkeypatch.setitem(backend.app.config, 'MAX_CONTENT_LENGTH', backend.STREAM_READ_SIZE + 1024)
+
+    response = client.post('/upload-audio', input_stream=io.BytesIO(multipart_body(3 * 1024 * 1024)),
+                           content_type=f'multipart/form-data; boundary={BOUNDARY}',
+                           headers={'Transfer-Encoding': 'chunked'},
+                           # What a server sets once it decodes the chunks itself
+                           environ_overrides={'wsgi.input_terminated': True})
+
+    assert response.status_code == 413
+    [upload] = streaming
+    assert upload.aborted
+    assert upload.written <= backend.STREAM_READ_SIZE + 1024
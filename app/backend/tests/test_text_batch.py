@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture
+def inserted_rows(backend, monkeypatch):
+    """Record the rows bulk inserted by /submit-text/batch, two per insert."""
+    rows = []
+
+    def insert_contributions(batch):
+        rows.extend(batch)
+        return [dict(row, id=len(rows) + i) for i, row in enumerate(batch)]
+
+    monkeypatch.setattr(backend, 'insert_contributions', insert_contributions)
+    monkeypatch.setattr(backend, 'TEXT_BATCH_CHUNK_SIZE', 2)
+    return rows
+
+
+def post_array(client, body):
+    return client.post('/submit-text/batch', data=body, content_type='application/json')
+
+
+def test_body_breaking_off_after_inserts_is_a_partial_success(client, inserted_rows):
+    response = post_array(client, b'["a", "b", "c", {"text_data": ')
+
+    assert response.status_code == 207
+    assert response.json['partial'] is True
+    assert response.json['inserted'] == 3
+    assert [result['index'] for result in response.json['results']] == [0, 1, 2]
+    assert 'error' in response.json
+    assert [row['text_data'] for row in inserted_rows] == ['a', 'b', 'c']
+
+
+def test_body_breaking_off_before_any_insert_is_rejected(client, inserted_rows):
+    response = post_array(client, b'[{"text_data": ')
+
+    assert response.status_code == 400
+    assert response.json['partial'] is False
+    assert inserted_rows == []
+
+
+def test_complete_body_is_not_partial(client, inserted_rows):
+    response = post_array(client, b'["a", "b", "c"]')
+
+    assert response.status_code == 201
+    assert response.json['partial'] is False
+    assert response.json['inserted'] == 3
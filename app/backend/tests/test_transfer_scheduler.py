@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+import s3_uploader
+from transfer_scheduler import TransferScheduler, SchedulerBusy
+
+
+def test_open_raises_busy_when_all_transfer_slots_are_taken():
+    scheduler = TransferScheduler(max_workers=2, max_transfers=1, admission_timeout=0.05)
+    first = scheduler.open()
+
+    with pytest.raises(SchedulerBusy):
+        scheduler.open()
+
+    first.close()
+    scheduler.open().close()
+    assert scheduler.stats()["open_transfers"] == 0
+
+
+def test_open_waits_for_a_slot_within_the_timeout():
+    scheduler = TransferScheduler(max_workers=1, max_transfers=1)
+    first = scheduler.open()
+    threading.Timer(0.05, first.close).start()
+
+    scheduler.open(timeout=2).close()
+
+
+def test_open_raises_busy_while_the_byte_budget_is_used_up():
+    scheduler = TransferScheduler(max_workers=1, max_inflight_bytes=100, admission_timeout=0.05)
+    release = threading.Event()
+    transfer = scheduler.open()
+    future = transfer.submit(release.wait, 100)
+
+    with pytest.raises(SchedulerBusy):
+        scheduler.open()
+
+    release.set()
+    assert future.result(timeout=2) is True
+    transfer.close()
+    scheduler.open().close()
+    assert scheduler.stats()["inflight_bytes"] == 0
+
+
+def test_run_returns_the_result_and_errors_of_the_request():
+    scheduler = TransferScheduler(max_workers=2)
+
+    assert scheduler.run(lambda a, b: a + b, 10, 2, 3) == 5
+    with pytest.raises(ZeroDivisionError):
+        scheduler.run(lambda: 1 / 0, 10)
+    assert scheduler.stats()["open_transfers"] == 0
+
+
+def test_submit_after_close_is_rejected():
+    scheduler = TransferScheduler(max_workers=1)
+    transfer = scheduler.open()
+    transfer.close()
+
+    with pytest.raises(RuntimeError):
+        transfer.submit(lambda: None, 1)
+
+
+def test_transfers_are_served_round_robin():
+    scheduler = TransferScheduler(max_workers=1)
+    release = threading.Event()
+    order = []
+    first = scheduler.open(max_parallel=3)
+    second = scheduler.open(max_parallel=3)
+
+    # Hold the only worker so both transfers queue up behind it
+    blocker = first.submit(release.wait, 1)
+    futures = [first.submit(order.append, 1, 'a1'), first.submit(order.append, 1, 'a2'),
+               second.submit(order.append, 1, 'b1'), second.submit(order.append, 1, 'b2')]
+    release.set()
+    for future in [blocker] + futures:
+        future.result(timeout=2)
+
+    # Requests of the two transfers alternate rather than run one transfer after the other
+    assert sorted(order) == ['a1', 'a2', 'b1', 'b2']
+    assert all(order[i][0] != order[i + 1][0] for i in range(3))
+    first.close()
+    second.close()
+
+
+def test_submit_raises_busy_when_the_byte_budget_stays_used_up():
+    scheduler = TransferScheduler(max_workers=1, max_inflight_bytes=100, submit_timeout=0.05)
+    release = threading.Event()
+    transfer = scheduler.open()
+    blocker = transfer.submit(release.wait, 100)
+
+    with pytest.raises(SchedulerBusy):
+        transfer.submit(lambda: None, 1)
+
+    release.set()
+    blocker.result(timeout=2)
+    assert transfer.submit(lambda: 'ok', 1).result(timeout=2) == 'ok'
+    transfer.close()
+
+
+def test_parts_of_a_resumable_upload_share_one_transfer(monkeypatch):
+    class FakeS3:
+        def upload_part(self, **kwargs):
+            return {'ETag': f'"{kwargs["PartNumber"]}"'}
+
+        def abort_multipart_upload(self, **kwargs):
+            return {}
+
+    scheduler = TransferScheduler(max_workers=2)
+    monkeypatch.setattr(s3_uploader, 'transfer_scheduler', scheduler)
+    monkeypatch.setattr(s3_uploader, 'get_s3_client', lambda: FakeS3())
+
+    for part_number in (1, 2, 3):
+        result = s3_uploader.upload_part('audio', 'audio/a.wav', 'upload-1', part_number, b'part')
+        assert result == {"success": True, "etag": f'"{part_number}"'}
+    s3_uploader.upload_part('audio', 'audio/b.wav', 'upload-2', 1, b'part')
+    assert scheduler.stats()["open_transfers"] == 2
+
+    assert s3_uploader.abort_multipart_upload('audio', 'audio/a.wav', 'upload-1')["success"]
+    assert scheduler.stats()["open_transfers"] == 1
+    s3_uploader._close_part_transfer('upload-2')
+    assert scheduler.stats()["open_transfers"] == 0
@@ -0,0 +1,49 @@
+import time
+
+from ttl_cache import TTLCache
+
+
+def test_returns_cached_values_and_the_default_for_missing_keys():
+    cache = TTLCache(max_entries=10, ttl=60)
+    cache.set('a', 1)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('b', 'missing') == 'missing'
+
+
+def test_entries_expire_after_the_ttl():
+    cache = TTLCache(max_entries=10, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=60)
+    time.sleep(0.06)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert len(cache) == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_delete_and_clear_remove_entries():
+    cache = TTLCache(max_entries=10, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+
+    cache.delete('a')
+    cache.delete('missing')
+    assert cache.get('a') is None
+    assert len(cache) == 1
+
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,114 @@
+import time
+import threading
+
+import pytest
+
+from upload_sessions import UploadSessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadSessionStore(str(tmp_path / 'upload_state.db'))
+
+
+def create_session(store):
+    return store.create('storage-upload', 'audio', 'audio/a.wav', 'audio_file', 'a.wav', 'audio/wav',
+                        5 * 1024 * 1024, total_size=6 * 1024 * 1024)
+
+
+def test_parts_are_recorded_in_order_and_replaced_on_retry(store):
+    session = create_session(store)
+    store.record_part(session['upload_id'], 2, 'etag-2', 100)
+    store.record_part(session['upload_id'], 1, 'etag-1', 200)
+    store.record_part(session['upload_id'], 1, 'etag-1b', 200)
+
+    assert store.list_parts(session['upload_id']) == [
+        {'part_number': 1, 'etag': 'etag-1b', 'size': 200},
+        {'part_number': 2, 'etag': 'etag-2', 'size': 100},
+    ]
+
+
+def test_an_upload_is_claimed_for_completion_once(store):
+    upload_id = create_session(store)['upload_id']
+
+    before, claimed = store.begin_completion(upload_id)
+    assert claimed and before['status'] == 'in_progress'
+    before, claimed = store.begin_completion(upload_id)
+    assert not claimed and before['status'] == 'completing'
+    assert store.begin_completion('missing') == (None, False)
+
+
+def test_concurrent_completions_claim_an_upload_once(store):
+    upload_id = create_session(store)['upload_id']
+    results = []
+    start = threading.Barrier(8)
+
+    def complete():
+        start.wait()
+        results.append(store.begin_completion(upload_id)[1])
+
+    workers = [threading.Thread(target=complete) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert results.count(True) == 1
+
+
+def test_released_claim_leaves_the_upload_in_the_given_status(store):
+    upload_id = create_session(store)['upload_id']
+    store.begin_completion(upload_id)
+
+    store.end_completion(upload_id, 'in_progress')
+
+    assert store.get(upload_id)['status'] == 'in_progress'
+    assert store.begin_completion(upload_id)[1]
+
+
+def test_release_does_not_undo_a_completed_upload(store):
+    upload_id = create_session(store)['upload_id']
+    store.begin_completion(upload_id)
+    store.mark_stored(upload_id, 'https://example.com/a.wav')
+    store.mark_completed(upload_id)
+
+    store.end_completion(upload_id, 'stored')
+
+    session = store.get(upload_id)
+    assert session['status'] == 'completed'
+    assert session['url'] == 'https://example.com/a.wav'
+    assert not store.begin_completion(upload_id)[1]
+
+
+def test_stored_upload_can_be_claimed_again_to_save_its_url(store):
+    upload_id = create_session(store)['upload_id']
+    store.record_part(upload_id, 1, 'etag-1', 200)
+    store.begin_completion(upload_id)
+    store.mark_stored(upload_id, 'https://example.com/a.wav')
+    store.end_completion(upload_id, 'stored')
+
+    before, claimed = store.begin_completion(upload_id)
+
+    assert claimed
+    assert before['url'] == 'https://example.com/a.wav'
+    assert store.list_parts(upload_id) == []
+
+
+def test_abandoned_claim_can_be_taken_over_after_the_timeout(store):
+    upload_id = create_session(store)['upload_id']
+    store.begin_completion(upload_id)
+
+    assert not store.begin_completion(upload_id, timeout=60)[1]
+    time.sleep(0.02)
+    assert store.begin_completion(upload_id, timeout=0.01)[1]
+
+
+def test_stale_returns_sessions_not_touched_within_max_age(store):
+    upload_id = create_session(store)['upload_id']
+
+    assert store.stale(max_age=60) == []
+    time.sleep(0.02)
+    assert [session['upload_id'] for session in store.stale(max_age=0.01)] == [upload_id]
+
+    store.delete(upload_id)
+    assert store.get(upload_id) is None
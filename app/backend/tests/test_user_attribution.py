@@ -0,0 +1,71 @@
+import hmac
+import json
+import time
+import base64
+import hashlib
+
+import pytest
+
+from auth_tokens import TokenVerifier
+
+SECRET = 'test-jwt-secret'
+
+
+def make_token(sub):
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+    signing_input = f"{encode({'alg': 'HS256'})}.{encode({'sub': sub, 'aud': 'authenticated', 'exp': time.time() + 3600})}"
+    signature = hmac.new(SECRET.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return f"{signing_input}.{base64.urlsafe_b64encode(signature).rstrip(b'=').decode()}"
+
+
+@pytest.fixture
+def inserted_rows(backend, monkeypatch):
+    """Require auth and record the rows inserted into contributions."""
+    rows = []
+
+    def insert_contributions(batch):
+        rows.extend(batch)
+        return [dict(row, id=len(rows) + i) for i, row in enumerate(batch)]
+
+    monkeypatch.setattr(backend, 'REQUIRE_AUTH', True)
+    monkeypatch.setattr(backend, 'token_verifier', TokenVerifier(secret=SECRET, jwks_url=None, issuer=None))
+    monkeypatch.setattr(backend, 'insert_contributions', insert_contributions)
+    monkeypatch.setattr(backend, 'insert_contribution', lambda row: {"success": True, "data": insert_contributions([row])})
+    return rows
+
+
+def test_requests_without_a_token_are_rejected(client, inserted_rows):
+    assert client.post('/submit-text', json={'text_data': 'hello'}).status_code == 401
+    assert inserted_rows == []
+
+
+def test_texts_are_stored_with_the_user_of_the_token(client, inserted_rows):
+    headers = {'Authorization': f"Bearer {make_token('user-1')}"}
+
+    assert client.post('/submit-text', json={'text_data': 'hello'}, headers=headers).status_code == 201
+    assert client.post('/submit-text/batch', json=['a', {'text_data': 'b'}], headers=headers).status_code == 201
+
+    assert [row['user_id'] for row in inserted_rows] == ['user-1', 'user-1', 'user-1']
+
+
+def test_rows_have_no_owner_when_auth_is_off(backend, client, inserted_rows, monkeypatch):
+    monkeypatch.setattr(backend, 'REQUIRE_AUTH', False)
+
+    assert client.post('/submit-text', json={'text_data': 'hello'}).status_code == 201
+
+    assert 'user_id' not in inserted_rows[0]
+
+
+def test_file_urls_are_stored_with_their_owner(monkeypatch):
+    import s3_uploader
+    rows = []
+    monkeypatch.setattr(s3_uploader, 'insert_contributions', lambda batch: rows.extend(batch) or batch)
+    monkeypatch.setattr(s3_uploader, 'contributions_batcher', None)
+
+    s3_uploader.save_file_url_to_database('https://example.com/a.wav', 'audio_url', 'user-1')
+    s3_uploader.save_file_urls_to_database([('https://example.com/b.png', 'image_url')], 'user-2')
+
+    assert [(row['user_id'], row.get('audio_url') or row.get('image_url')) for row in rows] == [
+        ('user-1', 'https://example.com/a.wav'), ('user-2', 'https://example.com/b.png')
+    ]
@@ -0,0 +1,121 @@
+import json
+import codecs
+
+# Bytes read from the request body at a time
+READ_SIZE = 64 * 1024
+
+# Longest JSON array item, in characters. An item that does not parse is only
+# known to be invalid rather than incomplete once this much of it was read,
+# so this bounds the body read into memory for a malformed item.
+MAX_ITEM_SIZE = 1024 * 1024
+
+
+def iter_ndjson(stream, read_size=READ_SIZE):
+    """
+    Yield the records of a newline-delimited JSON stream one at a time.
+
+    Lines that are not valid JSON are yielded as ValueError instances, so that
+    the caller can report them per record and continue. Blank lines are skipped.
+
+    Args:
+        stream: Binary file-like object
+        read_size (int): Bytes read at a time
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if pending.strip():
+        yield _parse_line(pending)
+
+
+def _parse_line(line):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {str(e)}")
+
+
+def iter_json_array(stream, read_size=READ_SIZE, max_item_size=MAX_ITEM_SIZE):
+    """
+    Yield the elements of a JSON array one at a time without loading the whole document.
+
+    Args:
+        stream: Binary file-like object containing a single JSON array
+        read_size (int): Bytes read at a time
+        max_item_size (int): Longest item in characters; reading stops at a longer or invalid one
+
+    Raises:
+        ValueError: If the document is not a well-formed JSON array
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    eof = False
+    state = 'start'  # start -> first -> (item -> separator)* -> done
+
+    while True:
+        # Skip whitespace between tokens
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+            continue
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise ValueError("Expected a JSON array")
+            pos += 1
+            state = 'first'
+        elif state == 'separator':
+            if char == ',':
+                pos += 1
+                state = 'item'
+            elif char == ']':
+                return
+            else:
+                raise ValueError("Expected ',' or ']' between array items")
+        elif state == 'first' and char == ']':
+            return
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # A value ending at the buffer boundary may continue in the next chunk
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if not complete:
+                if len(buffer) - pos > max_item_size:
+                    # Stop here rather than read the rest of the body looking for the item's end
+                    raise ValueError(f"Array item is invalid or longer than {max_item_size} characters")
+                chunk = stream.read(read_size)
+                eof = not chunk
+                buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+                pos = 0
+                continue
+
+            yield item
+            pos = end
+            state = 'separator'
+
+            # Drop consumed text so the buffer stays small
+            if pos > read_size:
+                buffer = buffer[pos:]
+                pos = 0
@@ -0,0 +1,192 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    """Raised when a transfer cannot be admitted because the scheduler is at capacity."""
+
+
+class TransferScheduler:
+    """
+    Run storage requests of all uploads on one fixed pool of worker threads.
+
+    Every upload opens a Transfer and submits its requests (parts or single
+    PUTs) to it. Workers serve transfers round-robin, one request at a time,
+    so concurrent uploads share the workers and the bandwidth evenly no matter
+    how many parts each one has queued.
+
+    The bytes of submitted requests count against max_inflight_bytes until the
+    request finishes; submit() blocks while the budget is used up, for at most
+    submit_timeout seconds before SchedulerBusy is raised. New
+    transfers are admitted only while fewer than max_transfers are open and the
+    budget is not exhausted, waiting at most admission_timeout seconds before
+    SchedulerBusy is raised.
+    """
+
+    def __init__(self, max_workers=32, max_inflight_bytes=256 * 1024 * 1024, max_transfers=64,
+                 admission_timeout=10.0, submit_timeout=60.0, name='transfer'):
+        """
+        Args:
+            max_workers (int): Number of worker threads, i.e. parallel storage requests
+            max_inflight_bytes (int): Bytes of queued and running requests across all transfers
+            max_transfers (int): Maximum number of open transfers
+            admission_timeout (float): Seconds open() waits for capacity
+            submit_timeout (float): Seconds Transfer.submit() waits for room for a request
+            name (str): Prefix of the worker thread names
+        """
+        self.max_workers = max_workers
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_transfers = max_transfers
+        self.admission_timeout = admission_timeout
+        self.submit_timeout = submit_timeout
+        self.inflight_bytes = 0
+        self.open_transfers = 0
+        self.busy_workers = 0
+        self._ready = deque()  # transfers with queued requests, in serving order
+        self._changed = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._run, name=f'{name}-{i}', daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def open(self, max_parallel=None, timeout=None):
+        """
+        Admit a new transfer.
+
+        Args:
+            max_parallel (int, optional): Most requests of this transfer queued or running at once
+            timeout (float, optional): Seconds to wait for capacity, defaults to admission_timeout
+
+        Returns:
+            Transfer: Handle used to submit the transfer's requests
+
+        Raises:
+            SchedulerBusy: If no capacity became available in time
+        """
+        timeout = self.admission_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self.open_transfers >= self.max_transfers or self.inflight_bytes >= self.max_inflight_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SchedulerBusy("Too many uploads in progress")
+                self._changed.wait(remaining)
+            self.open_transfers += 1
+        return Transfer(self, max_parallel or self.max_workers)
+
+    def run(self, fn, size, *args, **kwargs):
+        """
+        Run a single request as its own transfer and return its result.
+        """
+        transfer = self.open(max_parallel=1)
+        try:
+            return transfer.submit(fn, size, *args, **kwargs).result()
+        finally:
+            transfer.close()
+
+    def stats(self):
+        """
+        Return the current load of the scheduler.
+        """
+        with self._changed:
+            return {
+                "workers": self.max_workers,
+                "busy_workers": self.busy_workers,
+                "open_transfers": self.open_transfers,
+                "inflight_bytes": self.inflight_bytes,
+                "max_inflight_bytes": self.max_inflight_bytes
+            }
+
+    def _next_request(self):
+        # Called with the lock held
+        while not self._ready:
+            self._changed.wait()
+        transfer = self._ready.popleft()
+        request = transfer._queue.popleft()
+        if transfer._queue:
+            # Back of the line, behind every other transfer with work
+            self._ready.append(transfer)
+        return transfer, request
+
+    def _run(self):
+        while True:
+            with self._changed:
+                transfer, (future, size, fn, args, kwargs) = self._next_request()
+                self.busy_workers += 1
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except Exception as e:
+                    future.set_exception(e)
+
+            with self._changed:
+                self.busy_workers -= 1
+                self.inflight_bytes -= size
+                transfer._inflight -= 1
+                self._changed.notify_all()
+
+
+class Transfer:
+    """
+    Handle of one upload on a TransferScheduler, created by TransferScheduler.open().
+    """
+
+    def __init__(self, scheduler, max_parallel):
+        self._scheduler = scheduler
+        self._max_parallel = max_parallel
+        self._queue = deque()
+        self._inflight = 0
+        self._closed = False
+
+    def submit(self, fn, size, *args, **kwargs):
+        """
+        Queue a storage request of size bytes, waiting for room in the byte budget.
+
+        A request larger than the whole budget is accepted once nothing else is in
+        flight. Cancelling the returned future before the request starts skips it.
+
+        Returns:
+            Future: Resolves to the return value of fn
+
+        Raises:
+            SchedulerBusy: If no room became available within the scheduler's submit_timeout
+        """
+        scheduler = self._scheduler
+        future = Future()
+        deadline = time.monotonic() + scheduler.submit_timeout
+        with scheduler._changed:
+            if self._closed:
+                raise RuntimeError("Transfer is closed")
+            while (self._inflight >= self._max_parallel or
+                   (scheduler.inflight_bytes and scheduler.inflight_bytes + size > scheduler.max_inflight_bytes)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SchedulerBusy("Storage requests are backed up")
+                scheduler._changed.wait(remaining)
+
+            scheduler.inflight_bytes += size
+            self._inflight += 1
+            self._queue.append((future, size, fn, args, kwargs))
+            if len(self._queue) == 1:
+                scheduler._ready.append(self)
+            scheduler._changed.notify_all()
+        return future
+
+    def close(self):
+        """
+        Release the transfer's admission slot. Requests already submitted still run.
+        """
+        scheduler = self._scheduler
+        with scheduler._changed:
+            if not self._closed:
+                self._closed = True
+                scheduler.open_transfers -= 1
+                scheduler._changed.notify_all()
@@ -0,0 +1,132 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when no more jobs can be accepted."""
+
+
+class UploadJobManager:
+    """
+    Run upload jobs on a bounded pool of background threads and track their status.
+
+    A job is a function returning a result dictionary. Its status moves from
+    queued to running to succeeded or failed; finished jobs are kept for
+    result_ttl seconds so clients can fetch the outcome.
+    """
+
+    def __init__(self, max_workers=4, max_pending=100, result_ttl=3600):
+        """
+        Args:
+            max_workers (int): Number of jobs running at the same time
+            max_pending (int): Maximum number of queued and running jobs
+            result_ttl (float): Seconds finished jobs are kept
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-job')
+        self._jobs = {}
+        self._pending = 0
+        self._changed = threading.Condition()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a job.
+
+        Returns:
+            str: The job id
+
+        Raises:
+            JobQueueFull: If max_pending jobs are already queued or running
+        """
+        with self._changed:
+            self._expire_finished()
+            if self._pending >= self.max_pending:
+                raise JobQueueFull("Too many upload jobs in progress")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None
+            }
+            self._pending += 1
+
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def stats(self):
+        """
+        Return the number of workers and of queued and running jobs.
+        """
+        with self._changed:
+            return {
+                "workers": self.max_workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending
+            }
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status="running", started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+            status = "succeeded" if result.get("success") else "failed"
+        except Exception as e:
+            logger.error(f"Upload job {job_id} failed: {str(e)}")
+            result = {"success": False, "error": f"Unexpected error: {str(e)}"}
+            status = "failed"
+
+        with self._changed:
+            self._pending -= 1
+        self._update(job_id, status=status, finished_at=time.time(), result=result)
+
+    def _update(self, job_id, **fields):
+        with self._changed:
+            self._jobs[job_id].update(fields)
+            self._changed.notify_all()
+
+    def _expire_finished(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id, wait=0):
+        """
+        Return a copy of a job, optionally waiting for it to finish.
+
+        Args:
+            job_id (str): The job id
+            wait (float): Seconds to wait for the job to finish (long polling)
+
+        Returns:
+            dict: The job, or None if it does not exist
+        """
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job["finished_at"] is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return dict(job) if job else None
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting jobs and optionally wait for running ones to finish.
+        """
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,216 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+
+# SQLite database holding resumable upload state, so uploads survive a backend restart
+UPLOAD_STATE_DB = os.getenv(
+    "UPLOAD_STATE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_state.db')
+)
+
+# Uploads that are neither completed nor aborted within this time are expired
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 60 * 60)))
+
+# A request completing an upload that has not finished within this time is
+# assumed dead, and another request may complete the upload instead
+UPLOAD_COMPLETION_TIMEOUT = int(os.getenv("UPLOAD_COMPLETION_TIMEOUT", "600"))
+
+
+class UploadSessionStore:
+    """
+    Persistent state of resumable uploads.
+
+    Each upload session maps the upload id handed to clients to the storage
+    multipart upload behind it, and records every part that was stored
+    successfully together with its ETag. Presigned single PUT uploads have
+    no storage multipart upload and an empty storage_upload_id.
+    """
+
+    def __init__(self, path=UPLOAD_STATE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                upload_id TEXT PRIMARY KEY,
+                storage_upload_id TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                object_key TEXT NOT NULL,
+                field_name TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                content_type TEXT,
+                part_size INTEGER NOT NULL,
+                total_size INTEGER,
+                status TEXT NOT NULL,
+                url TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS upload_parts (
+                upload_id TEXT NOT NULL,
+                part_number INTEGER NOT NULL,
+                etag TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (upload_id, part_number)
+            );
+        """)
+
+    def create(self, storage_upload_id, bucket, object_key, field_name, filename,
+               content_type, part_size, total_size=None):
+        """
+        Register a new upload session.
+
+        Returns:
+            dict: The stored session
+        """
+        now = time.time()
+        session = {
+            "upload_id": uuid.uuid4().hex,
+            "storage_upload_id": storage_upload_id,
+            "bucket": bucket,
+            "object_key": object_key,
+            "field_name": field_name,
+            "filename": filename,
+            "content_type": content_type,
+            "part_size": part_size,
+            "total_size": total_size,
+            "status": "in_progress",
+            "url": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO upload_sessions VALUES (:upload_id, :storage_upload_id, :bucket, :object_key, "
+                ":field_name, :filename, :content_type, :part_size, :total_size, :status, :url, "
+                ":created_at, :updated_at)",
+                session
+            )
+        return session
+
+    def get(self, upload_id):
+        """
+        Return the session with the given id, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM upload_sessions WHERE upload_id = ?", (upload_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record_part(self, upload_id, part_number, etag, size):
+        """
+        Record a stored part, replacing an earlier upload of the same part number.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO upload_parts VALUES (?, ?, ?, ?)",
+                (upload_id, part_number, etag, size)
+            )
+            self._conn.execute(
+                "UPDATE upload_sessions SET updated_at = ? WHERE upload_id = ?",
+                (time.time(), upload_id)
+            )
+
+    def list_parts(self, upload_id):
+        """
+        Return the recorded parts of an upload in ascending part order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT part_number, etag, size FROM upload_parts WHERE upload_id = ? ORDER BY part_number",
+                (upload_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def begin_completion(self, upload_id, timeout=UPLOAD_COMPLETION_TIMEOUT):
+        """
+        Claim an upload for completion, so that a single request completes it.
+
+        Uploads in progress or stored are marked completing. So are uploads a
+        request claimed more than timeout seconds ago and never released. The
+        check and the update run in one transaction, so concurrent requests,
+        in this process or another, cannot both claim an upload.
+
+        Returns:
+            tuple: (the session as it was before the claim, or None if it does not exist; whether it was claimed)
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM upload_sessions WHERE upload_id = ?", (upload_id,)
+                ).fetchone()
+                claimed = row is not None and (
+                    row['status'] in ('in_progress', 'stored')
+                    or (row['status'] == 'completing' and row['updated_at'] < now - timeout)
+                )
+                if claimed:
+                    self._conn.execute(
+                        "UPDATE upload_sessions SET status = 'completing', updated_at = ? WHERE upload_id = ?",
+                        (now, upload_id)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return (dict(row) if row else None), claimed
+
+    def end_completion(self, upload_id, status):
+        """
+        Release an upload claimed by begin_completion() that was not completed, leaving it in status.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE upload_sessions SET status = ?, updated_at = ? WHERE upload_id = ? AND status = 'completing'",
+                (status, time.time(), upload_id)
+            )
+
+    def mark_stored(self, upload_id, url):
+        """
+        Record the URL of an upload whose object was assembled in storage and drop its part records.
+
+        The upload stays claimed; if saving it fails, end_completion() leaves it stored.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE upload_sessions SET url = ?, updated_at = ? WHERE upload_id = ?",
+                (url, time.time(), upload_id)
+            )
+            self._conn.execute("DELETE FROM upload_parts WHERE upload_id = ?", (upload_id,))
+
+    def mark_completed(self, upload_id):
+        """
+        Mark an upload whose URL was saved to the database.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE upload_sessions SET status = 'completed', updated_at = ? WHERE upload_id = ?",
+                (time.time(), upload_id)
+            )
+
+    def delete(self, upload_id):
+        """
+        Remove an upload session and its part records.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM upload_parts WHERE upload_id = ?", (upload_id,))
+            self._conn.execute("DELETE FROM upload_sessions WHERE upload_id = ?", (upload_id,))
+
+    def stale(self, max_age=UPLOAD_SESSION_TTL):
+        """
+        Return sessions that were not touched within max_age seconds.
+
+        Completed sessions are included so that their records are eventually removed.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM upload_sessions WHERE updated_at < ?", (time.time() - max_age,)
+            ).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,15 @@
+"""
+Python client for the DynoCollect API.
+
+    from dynocollect_client import Client
+
+    client = Client("https://dynocollect.onrender.com")
+    client.login(email, password)
+    client.upload("recording.wav")
+    client.upload_many(["a.jpg", "b.jpg", "talk.mp4"], workers=8)
+    client.submit_texts(texts)
+"""
+from .transport import ApiError, Transport
+from .client import Client, DEFAULT_API_URL
+
+__all__ = ['Client', 'ApiError', 'Transport', 'DEFAULT_API_URL']
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import logging
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import upload_type_of
+from .transport import ApiError
+
+UPLOAD_TYPES = ('audio', 'video', 'image')
+
+# Bucket names accepted where an upload type is expected, as example_upload.py used them
+_BUCKET_TYPES = {'audio': 'audio', 'video': 'video', 'images': 'image', 'image': 'image'}
+
+# How often the running totals are printed, in seconds
+REPORT_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_type(upload_type):
+    """
+    Return the upload type of an upload type or bucket name, or None if it is neither.
+    """
+    return _BUCKET_TYPES.get((upload_type or '').strip().lower())
+
+
+def collect_files(paths, upload_type=None):
+    """
+    List the media files to import from files and directories.
+
+    Directories are walked recursively, in sorted order so that every run of
+    an import sees the files in the same order. Hidden files are skipped, and
+    without an upload_type so are files that are not audio, video, or images.
+
+    Returns:
+        list: (path, upload_type) pairs; upload_type is None where it is guessed from the file
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append((path, upload_type))
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+            for name in sorted(names):
+                if name.startswith('.'):
+                    continue
+                if upload_type or upload_type_of(mimetypes.guess_type(name)[0]):
+                    files.append((os.path.join(root, name), upload_type))
+    return files
+
+
+def read_manifest(manifest_path, upload_type=None):
+    """
+    List the files to import from a manifest.
+
+    Every line holds a path, optionally followed by a comma and its type
+    (audio, video, or image). Relative paths are relative to the manifest.
+    Blank lines and lines starting with # are skipped.
+
+    Returns:
+        list: (path, upload_type) pairs
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    files = []
+    with open(manifest_path, encoding='utf-8') as manifest:
+        for number, line in enumerate(manifest, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path, line_type = line, None
+            if ',' in line:
+                head, tail = line.rsplit(',', 1)
+                if normalize_type(tail):
+                    path, line_type = head.strip(), normalize_type(tail)
+                elif tail.strip():
+                    raise ValueError(f"{manifest_path}:{number}: unknown type {tail.strip()!r}")
+            files.append((os.path.join(base, path), line_type or upload_type))
+    return files
+
+
+def _file_key(path):
+    # A file counts as the same file while its size and modification time are unchanged
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+class ImportJournal:
+    """
+    Append-only journal of the files an import has finished.
+
+    Each line is a JSON object for one file, so a journal cut short by a
+    crash loses at most its last line. When a file appears more than once,
+    its last line counts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['path']] = entry
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _entry(self, key):
+        path, size, mtime_ns = key
+        entry = self.entries.get(path)
+        if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            return entry
+        return None
+
+    def is_done(self, key):
+        entry = self._entry(key)
+        return bool(entry) and entry['status'] == 'done'
+
+    def upload_id(self, key):
+        """
+        Return the resumable upload a previous run left behind for a file, if any.
+        """
+        entry = self._entry(key)
+        return entry.get('upload_id') if entry and entry['status'] == 'failed' else None
+
+    def record(self, key, result):
+        path, size, mtime_ns = key
+        entry = {
+            'path': path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'status': 'done' if result['success'] else 'failed',
+            'url': result.get('url'),
+            'id': ((result.get('data') or [{}])[0] or {}).get('id'),
+            'error': result.get('error'),
+            'upload_id': result.get('upload_id'),
+            'time': time.time()
+        }
+        self.entries[path] = entry
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BulkImporter:
+    """
+    Import many files through a Client, resuming where an earlier run stopped.
+
+    Files already recorded as done in the journal are skipped. Large files
+    that an earlier run left part way are continued with Client.resume();
+    everything else goes through Client.upload_iter(), which uploads small
+    files in /upload-batch requests saved with one bulk insert each.
+    """
+
+    def __init__(self, client, journal, workers=8, batch_max_files=None, report=None, failed=None):
+        """
+        Args:
+            client (Client): Client to upload with, shared by all workers
+            journal (ImportJournal): Journal of finished files
+            workers (int): Batches and large files sent at the same time
+            batch_max_files (int, optional): Most small files per /upload-batch request
+            report (callable, optional): Called with a stats dict every REPORT_INTERVAL seconds and at the end
+            failed (callable, optional): Called with the path and error of each file that could not be
+                imported; failures are logged as warnings if not given
+        """
+        self.client = client
+        self.journal = journal
+        self.workers = workers
+        self.batch_max_files = batch_max_files
+        self.report = report
+        self.failed = failed
+
+    def run(self, files):
+        """
+        Import files.
+
+        Args:
+            files (list): (path, upload_type) pairs, from collect_files() or read_manifest()
+
+        Returns:
+            dict: Totals of the import: files, skipped, uploaded, failed, bytes, elapsed seconds
+        """
+        stats = {'files': len(files), 'skipped': 0, 'uploaded': 0, 'failed': 0, 'bytes': 0, 'started': time.time()}
+        self._last_report = stats['started']
+
+        keys = {}
+        pending = []
+        resumable = []
+        for path, upload_type in files:
+            try:
+                key = _file_key(path)
+            except OSError as e:
+                self._fail(path, str(e), stats)
+                continue
+            if self.journal.is_done(key):
+                stats['skipped'] += 1
+                continue
+            keys[path] = key
+            upload_id = self.journal.upload_id(key)
+            if upload_id:
+                resumable.append((path, upload_type, upload_id))
+            else:
+                pending.append((path, upload_type))
+
+        pending.extend(self._resume(resumable, keys, stats))
+
+        kwargs = {'batch_max_files': self.batch_max_files} if self.batch_max_files else {}
+        for index, result in self.client.upload_iter(pending, workers=self.workers, **kwargs):
+            self._finish(pending[index][0], keys[pending[index][0]], result, stats)
+
+        stats['elapsed'] = time.time() - stats['started']
+        if self.report:
+            self.report(stats)
+        return stats
+
+    def _resume(self, resumable, keys, stats):
+        """
+        Continue the uploads an earlier run left part way; return the files whose uploads are gone.
+        """
+        restart = []
+
+        def resume(path, upload_id):
+            try:
+                result = self.client.resume(upload_id, path)
+                return {'success': True, 'url': result.get('url'), 'data': result.get('data')}
+            except ApiError as e:
+                if e.status_code == 404:
+                    # The backend expired the upload; start the file over
+                    return None
+                return {'success': False, 'error': str(e), 'upload_id': upload_id}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import-resume') as executor:
+            futures = [(path, upload_type, executor.submit(resume, path, upload_id))
+                       for path, upload_type, upload_id in resumable]
+            for path, upload_type, future in futures:
+                result = future.result()
+                if result is None:
+                    restart.append((path, upload_type))
+                else:
+                    self._finish(path, keys[path], result, stats)
+        return restart
+
+    def _finish(self, path, key, result, stats):
+        self.journal.record(key, result)
+        if result['success']:
+            stats['uploaded'] += 1
+            stats['bytes'] += key[1]
+        else:
+            self._fail(path, result['error'], stats)
+
+        now = time.time()
+        if self.report and now - self._last_report >= REPORT_INTERVAL:
+            self._last_report = now
+            self.report({**stats, 'elapsed': now - stats['started']})
+
+    def _fail(self, path, error, stats):
+        stats['failed'] += 1
+        if self.failed:
+            self.failed(path, error)
+        else:
+            logger.warning(f"Importing {path} failed: {error}")
+
+
+def format_stats(stats):
+    """
+    Describe the totals of an import and its throughput in one line.
+    """
+    elapsed = max(stats['elapsed'], 1e-6)
+    done = stats['uploaded'] + stats['failed'] + stats['skipped']
+    return (
+        f"{done}/{stats['files']} files: {stats['uploaded']} uploaded, {stats['skipped']} skipped, "
+        f"{stats['failed']} failed | {stats['bytes'] / (1024 * 1024):.1f} MB in {elapsed:.1f} s, "
+        f"{stats['bytes'] / (1024 * 1024) / elapsed:.2f} MB/s, {stats['uploaded'] / elapsed:.1f} files/s"
+    )
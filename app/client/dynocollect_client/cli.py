@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import argparse
+
+from . import Client, ApiError, DEFAULT_API_URL
+from .bulk_import import BulkImporter, ImportJournal, collect_files, read_manifest, normalize_type, format_stats
+
+
+def _client(args):
+    client = Client(args.api_url, token=args.token)
+    if not client.token and args.email:
+        client.login(args.email, args.password)
+    return client
+
+
+def _upload(client, args):
+    started = time.time()
+
+    def progress(finished, total):
+        print(f"\r{finished}/{total} files", end='', file=sys.stderr, flush=True)
+
+    results = client.upload_many(args.paths, upload_type=args.type, workers=args.workers, progress=progress)
+    print(file=sys.stderr)
+    for result in results:
+        if result['success']:
+            print(f"OK     {result['filename']}  {result.get('url')}")
+        else:
+            print(f"FAILED {result['filename']}  {result['error']}")
+            if result.get('upload_id'):
+                print(f"       resume with: python -m dynocollect_client resume {result['upload_id']} PATH")
+
+    failed = sum(1 for result in results if not result['success'])
+    total_bytes = sum(os.path.getsize(path) for path in args.paths if os.path.isfile(path))
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"{len(results) - failed} uploaded, {failed} failed, "
+          f"{total_bytes / (1024 * 1024) / elapsed:.1f} MB/s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _resume(client, args):
+    result = client.resume(args.upload_id, args.path)
+    print(f"OK     {args.path}  {result.get('url')}")
+    return 0
+
+
+def _text(client, args):
+    texts = list(args.texts)
+    if args.file:
+        with open(args.file, encoding='utf-8') as file:
+            texts.extend(line.rstrip('\n') for line in file if line.strip())
+    if not texts:
+        print("No texts given", file=sys.stderr)
+        return 2
+
+    result = client.submit_texts(texts, batch_size=args.batch_size)
+    for item in result['results']:
+        if not item['success']:
+            print(f"FAILED text {item['index']}: {item['error']}")
+    print(f"{result['inserted']} inserted, {result['failed']} failed", file=sys.stderr)
+    return 1 if result['failed'] else 0
+
+
+def _import(client, args):
+    files = read_manifest(args.manifest, args.type) if args.manifest else []
+    files.extend(collect_files(args.paths, args.type))
+    if not files:
+        print("No files to import", file=sys.stderr)
+        return 2
+
+    print(f"Importing {len(files)} files, journal {args.journal}", file=sys.stderr)
+    journal = ImportJournal(args.journal)
+    try:
+        importer = BulkImporter(
+            client,
+            journal,
+            workers=args.workers,
+            batch_max_files=args.batch_files,
+            report=lambda stats: print(format_stats(stats), file=sys.stderr),
+            failed=lambda path, error: print(f"FAILED {path}: {error}")
+        )
+        stats = importer.run(files)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    finally:
+        journal.close()
+    return 1 if stats['failed'] else 0
+
+
+def _upload_type(value):
+    upload_type = normalize_type(value)
+    if not upload_type:
+        raise argparse.ArgumentTypeError("must be audio, video, or image")
+    return upload_type
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dynocollect_client', description='DynoCollect API client')
+    parser.add_argument('--api-url', default=DEFAULT_API_URL, help='Base URL of the backend (DYNOCOLLECT_API_URL)')
+    parser.add_argument('--token', default=os.getenv('DYNOCOLLECT_TOKEN'), help='Access token (DYNOCOLLECT_TOKEN)')
+    parser.add_argument('--email', default=os.getenv('DYNOCOLLECT_EMAIL'), help='Log in as this user (DYNOCOLLECT_EMAIL)')
+    parser.add_argument('--password', default=os.getenv('DYNOCOLLECT_PASSWORD'), help='Password (DYNOCOLLECT_PASSWORD)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    upload = commands.add_parser('upload', help='Upload files in parallel')
+    upload.add_argument('paths', nargs='+', help='Files to upload')
+    upload.add_argument('--type', type=_upload_type, help='Type of all files (audio, video, or image); guessed per file by default')
+    upload.add_argument('--workers', type=int, default=4, help='Batches and large files sent at the same time')
+    upload.set_defaults(run=_upload)
+
+    resume = commands.add_parser('resume', help='Continue an interrupted resumable upload')
+    resume.add_argument('upload_id', help='Upload ID printed when the upload failed')
+    resume.add_argument('path', help='The file that was being uploaded')
+    resume.set_defaults(run=_resume)
+
+    bulk = commands.add_parser('import', help='Import files and directories in bulk, resuming an interrupted import')
+    bulk.add_argument('paths', nargs='*', help='Files and directories to import')
+    bulk.add_argument('--manifest', help='File listing a path, optionally followed by ",type", per line')
+    bulk.add_argument('--type', type=_upload_type, help='Type of all files (audio, video, or image); guessed per file by default')
+    bulk.add_argument('--workers', type=int, default=8, help='Batches and large files sent at the same time')
+    bulk.add_argument('--batch-files', type=int, help='Most small files per /upload-batch request')
+    bulk.add_argument('--journal', default='dynocollect-import.jsonl', help='Journal of finished files, read to resume')
+    bulk.set_defaults(run=_import)
+
+    text = commands.add_parser('text', help='Submit texts')
+    text.add_argument('texts', nargs='*', help='Texts to submit')
+    text.add_argument('--file', help='File with one text per line')
+    text.add_argument('--batch-size', type=int, default=1000, help='Texts per request')
+    text.set_defaults(run=_text)
+
+    args = parser.parse_args(argv)
+    try:
+        with _client(args) as client:
+            return args.run(client, args)
+    except ApiError as e:
+        message = f"Error: {str(e)}"
+        if e.upload_id:
+            message += f" (resume with: python -m dynocollect_client resume {e.upload_id} PATH)"
+        print(message, file=sys.stderr)
+        return 1
+    except (ValueError, OSError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
@@ -0,0 +1,516 @@
+import os
+import gzip
+import json
+import math
+import mmap
+import mimetypes
+import threading
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .transport import Transport, ApiError, error_message, REQUEST_ATTEMPTS, REQUEST_TIMEOUT
+
+# Backend used when no api_url is given
+DEFAULT_API_URL = os.getenv("DYNOCOLLECT_API_URL", "https://dynocollect.onrender.com")
+
+# Parts sent at the same time per resumable upload
+UPLOAD_CONCURRENCY = 4
+
+# Files up to this size are sent in one request; larger ones through the resumable /uploads API
+SINGLE_UPLOAD_MAX_BYTES = 8 * 1024 * 1024
+
+# Small files sent together in one /upload-batch request, by count and total size
+BATCH_MAX_FILES = 50
+BATCH_MAX_BYTES = 32 * 1024 * 1024
+
+# Texts per /submit-text/batch request
+TEXT_BATCH_SIZE = 1000
+
+# How often progress is reported, in seconds
+PROGRESS_INTERVAL = 0.2
+
+# Resumable upload types by the major part of a content type
+_UPLOAD_TYPES = {'audio': 'audio', 'video': 'video', 'image': 'image'}
+_SINGLE_UPLOAD_PATHS = {'audio': '/upload-audio', 'video': '/upload-video', 'image': '/upload-image'}
+
+
+def _source_name(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(os.fspath(source))
+    name = getattr(source, 'name', None)
+    return os.path.basename(name) if isinstance(name, str) else None
+
+
+def _source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if hasattr(source, 'getbuffer'):
+        return source.getbuffer().nbytes
+    if hasattr(source, 'fileno'):
+        return os.fstat(source.fileno()).st_size
+    return memoryview(source).nbytes
+
+
+@contextmanager
+def _open_view(source):
+    """
+    Yield a memoryview of a file without copying it into memory.
+
+    Paths and open files are memory mapped; bytes, bytearrays and in-memory
+    files (io.BytesIO, Streamlit's UploadedFile) are viewed in place.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            with _open_view(file) as view:
+                yield view
+        return
+
+    if hasattr(source, 'getbuffer'):
+        buffer = source.getbuffer()
+    elif hasattr(source, 'fileno'):
+        if not os.fstat(source.fileno()).st_size:
+            buffer = b''
+        else:
+            buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        buffer = source
+
+    view = memoryview(buffer)
+    try:
+        yield view
+    finally:
+        view.release()
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+
+def upload_type_of(content_type):
+    """
+    Return the upload type (audio, video, or image) of a content type, or None.
+    """
+    return _UPLOAD_TYPES.get((content_type or '').split('/', 1)[0])
+
+
+class Client:
+    """
+    Client for the DynoCollect API.
+
+    Requests go through a pooled, retrying Transport. Small files are sent in
+    one request, several at a time through /upload-batch when uploading many;
+    large files are sent in parts through the resumable /uploads API, so a
+    dropped connection costs one part, not the file.
+
+    A Client is safe to use from several threads. with_token() returns a Client
+    for another user that shares the same connections.
+    """
+
+    def __init__(self, api_url=None, token=None, concurrency=UPLOAD_CONCURRENCY,
+                 attempts=REQUEST_ATTEMPTS, timeout=REQUEST_TIMEOUT, transport=None):
+        """
+        Args:
+            api_url (str, optional): Base URL of the backend, DYNOCOLLECT_API_URL by default
+            token (str, optional): Access token sent as the Bearer token
+            concurrency (int): Parts sent at the same time per resumable upload
+            attempts (int): Attempts per request before giving up
+            timeout (float): Seconds a single request may take
+            transport (Transport, optional): Connections to share with another Client
+        """
+        self.transport = transport or Transport(api_url or DEFAULT_API_URL, attempts=attempts, timeout=timeout)
+        self.token = token
+        self.concurrency = concurrency
+
+    @property
+    def api_url(self):
+        return self.transport.api_url
+
+    def with_token(self, token):
+        """
+        Return a Client that authenticates with token and shares this Client's connections.
+        """
+        return Client(token=token, concurrency=self.concurrency, transport=self.transport)
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _headers(self, headers=None):
+        headers = dict(headers or {})
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        return headers
+
+    def _request(self, method, path, expected=(200, 201), headers=None, **kwargs):
+        response = self.transport.request(method, path, headers=self._headers(headers), **kwargs)
+        if response.status_code not in expected:
+            raise ApiError(error_message(response), status_code=response.status_code)
+        return response
+
+    # ---------- Auth ----------
+    def register(self, email, password):
+        """
+        Create an account.
+
+        Returns:
+            dict: The backend's response
+        """
+        response = self._request('POST', '/auth/register', expected=(201,), idempotent=False,
+                                 json={'email': email, 'password': password})
+        return response.json()
+
+    def login(self, email, password):
+        """
+        Log in and authenticate further requests of this Client with the session's access token.
+
+        Returns:
+            dict: The backend's response, with the user and the session
+        """
+        response = self._request('POST', '/auth/login', expected=(200,), json={'email': email, 'password': password})
+        data = response.json()
+        self.token = (data.get('session') or {}).get('access_token')
+        return data
+
+    def user(self):
+        """
+        Return the logged-in user.
+        """
+        return self._request('GET', '/auth/user').json()
+
+    # ---------- Text ----------
+    def submit_text(self, text):
+        """
+        Save a text as a contribution.
+
+        Returns:
+            dict: The backend's response (the inserted row, or queued when inserts are batched)
+        """
+        response = self._request('POST', '/submit-text', expected=(201, 202), idempotent=False,
+                                 json={'text_data': text})
+        return response.json()
+
+    def submit_texts(self, texts, batch_size=TEXT_BATCH_SIZE, compress=True):
+        """
+        Save many texts through /submit-text/batch.
+
+        The texts are sent as gzip compressed NDJSON, batch_size per request,
+        and the backend inserts each request's texts in bulk.
+
+        Args:
+            texts (iterable): Texts to save
+            batch_size (int): Texts per request
+            compress (bool): Whether to gzip the request bodies
+
+        Returns:
+            dict: Counts of inserted and failed texts, and a result per text with its
+            index in texts, success status, and the id of its row or an error message
+        """
+        results = []
+        batch = []
+        offset = 0
+
+        def send(batch, offset):
+            body = b''.join(json.dumps(text).encode('utf-8') + b'\n' for text in batch)
+            headers = {'Content-Type': 'application/x-ndjson'}
+            if compress:
+                body = gzip.compress(body, compresslevel=5)
+                headers['Content-Encoding'] = 'gzip'
+            try:
+                response = self._request('POST', '/submit-text/batch', expected=(200, 201, 207), idempotent=False,
+                                         headers=headers, data=body)
+            except ApiError as e:
+                return [{'index': offset + index, 'success': False, 'error': str(e)} for index in range(len(batch))]
+            payload = response.json()
+            results = [{**result, 'index': offset + result['index']} for result in payload['results']]
+            # A partial response has no results for the texts after the point the body broke at
+            for index in range(len(payload['results']), len(batch)):
+                results.append({'index': offset + index, 'success': False, 'error': payload.get('error')})
+            return results
+
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                results.extend(send(batch, offset))
+                offset += len(batch)
+                batch = []
+        if batch:
+            results.extend(send(batch, offset))
+
+        inserted = sum(1 for result in results if result['success'])
+        return {
+            'success': inserted == len(results),
+            'inserted': inserted,
+            'failed': len(results) - inserted,
+            'results': results
+        }
+
+    # ---------- Files ----------
+    def _describe(self, source, upload_type=None, filename=None, content_type=None):
+        filename = filename or _source_name(source)
+        if not filename:
+            raise ValueError("A filename is needed for data without a name")
+        content_type = content_type or getattr(source, 'type', None) or mimetypes.guess_type(filename)[0]
+        upload_type = upload_type or upload_type_of(content_type)
+        if upload_type not in _SINGLE_UPLOAD_PATHS:
+            raise ValueError(f"Cannot tell whether {filename} is audio, video, or an image; pass upload_type")
+        return filename, content_type or 'application/octet-stream', upload_type
+
+    def upload(self, source, upload_type=None, filename=None, content_type=None, progress=None, resumable=False):
+        """
+        Upload a file and save it as a contribution.
+
+        Args:
+            source: A path, an open binary file, bytes, or an in-memory file (io.BytesIO, Streamlit UploadedFile)
+            upload_type (str, optional): audio, video, or image; guessed from the content type by default
+            filename (str, optional): Name of the file, taken from source by default
+            content_type (str, optional): Content type of the file, guessed from the filename by default
+            progress (callable, optional): Called as progress(sent_bytes, total_bytes) from the calling thread
+            resumable (bool): Keep a failed resumable upload on the backend so it can be continued
+                with resume(), instead of aborting it
+
+        Returns:
+            dict: The backend's response (url and the inserted row, or queued when inserts are batched)
+
+        Raises:
+            ApiError: If the upload fails; for a kept resumable upload its upload_id is set
+        """
+        filename, content_type, upload_type = self._describe(source, upload_type, filename, content_type)
+        with _open_view(source) as view:
+            total = len(view)
+            if not total:
+                raise ApiError(f"{filename} is empty")
+            if total <= SINGLE_UPLOAD_MAX_BYTES:
+                # requests copies the file into the multipart body; at this size that is cheap
+                response = self._request('POST', _SINGLE_UPLOAD_PATHS[upload_type], expected=(201, 202),
+                                         idempotent=False, files={'file': (filename, view, content_type)})
+                if progress:
+                    progress(total, total)
+                return response.json()
+
+            response = self._request('POST', '/uploads', expected=(201,), idempotent=False, json={
+                'type': upload_type,
+                'filename': filename,
+                'size': total,
+                'content_type': content_type
+            })
+            upload_id = response.json()['upload_id']
+            part_size = response.json()['part_size']
+            part_numbers = range(1, math.ceil(total / part_size) + 1)
+            try:
+                return self._finish(view, upload_id, part_size, part_numbers, 0, progress)
+            except ApiError as e:
+                if resumable:
+                    e.upload_id = upload_id
+                else:
+                    self._abort(upload_id)
+                raise
+            except BaseException:
+                self._abort(upload_id)
+                raise
+
+    def resume(self, upload_id, source, progress=None):
+        """
+        Continue a resumable upload kept by upload(..., resumable=True), sending only the missing parts.
+
+        Args:
+            upload_id (str): The upload, from ApiError.upload_id
+            source: The same file that was being uploaded
+
+        Returns:
+            dict: The backend's response to completing the upload
+        """
+        status = self._request('GET', f'/uploads/{upload_id}').json()
+        if status['status'] == 'completed':
+            return {'success': True, 'url': status['url']}
+
+        with _open_view(source) as view:
+            total = len(view)
+            if status.get('total_size') not in (None, total):
+                raise ApiError(f"The file is {total} bytes, the upload expects {status['total_size']}")
+            part_size = status['part_size']
+            part_count = math.ceil(total / part_size)
+            received = {
+                part['part_number']: part['size']
+                for part in status['parts']
+                if part['size'] == min(part_size, total - (part['part_number'] - 1) * part_size)
+            }
+            missing = [number for number in range(1, part_count + 1) if number not in received]
+            try:
+                return self._finish(view, upload_id, part_size, missing, sum(received.values()), progress)
+            except ApiError as e:
+                e.upload_id = upload_id
+                raise
+
+    def _finish(self, view, upload_id, part_size, part_numbers, already_sent, progress):
+        self._send_parts(view, upload_id, part_size, part_numbers, already_sent, progress)
+        return self._request('POST', f'/uploads/{upload_id}/complete', expected=(200, 201, 202)).json()
+
+    def _send_parts(self, view, upload_id, part_size, part_numbers, already_sent, progress):
+        total = len(view)
+        sent = [already_sent]
+        lock = threading.Lock()
+        headers = {'Content-Type': 'application/octet-stream'}
+
+        def on_read(size):
+            with lock:
+                sent[0] += size
+
+        def send_part(part_number):
+            part = view[(part_number - 1) * part_size:part_number * part_size]
+            try:
+                response = self.transport.request(
+                    'PUT',
+                    f'/uploads/{upload_id}/parts/{part_number}',
+                    headers=self._headers(headers),
+                    body=part,
+                    on_read=on_read
+                )
+            finally:
+                part.release()
+            if response.status_code != 200:
+                raise ApiError(f"Part {part_number}: {error_message(response)}", status_code=response.status_code)
+
+        def report():
+            if progress:
+                with lock:
+                    done = min(sent[0], total)
+                progress(done, total)
+
+        def run(executor, numbers):
+            pending = {executor.submit(send_part, number) for number in numbers}
+            try:
+                while pending:
+                    done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                    report()
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='upload-part') as executor:
+            # The backend checks the file type on the first part, so nothing else is sent before it is accepted
+            if 1 in part_numbers:
+                run(executor, [1])
+            run(executor, [number for number in part_numbers if number != 1])
+
+    def _abort(self, upload_id):
+        try:
+            self.transport.request('DELETE', f'/uploads/{upload_id}', headers=self._headers(), timeout=30)
+        except ApiError:
+            pass
+
+    def upload_many(self, sources, upload_type=None, workers=4, progress=None):
+        """
+        Upload many files in parallel.
+
+        Small files are grouped into /upload-batch requests, which the backend
+        stores in parallel and saves with one bulk insert; large files are
+        sent through the resumable API. Up to workers requests run at a time.
+
+        Args:
+            sources (iterable): Paths, or (source, upload_type) pairs for files of different types
+            upload_type (str, optional): Type of every file without its own; guessed per file by default
+            workers (int): Batches and large files sent at the same time
+            progress (callable, optional): Called as progress(finished_files, total_files) from the calling thread
+
+        Returns:
+            list: A result per source, in order, with filename, success status, and the url
+            and inserted row, or an error message. A large file that failed part way
+            has the upload_id to continue it with resume().
+        """
+        sources = list(sources)
+        results = [None] * len(sources)
+        for finished, (index, result) in enumerate(self.upload_iter(sources, upload_type, workers), 1):
+            results[index] = result
+            if progress:
+                progress(finished, len(sources))
+        return results
+
+    def upload_iter(self, sources, upload_type=None, workers=4,
+                    batch_max_files=BATCH_MAX_FILES, batch_max_bytes=BATCH_MAX_BYTES):
+        """
+        Upload many files in parallel like upload_many(), yielding results as they finish.
+
+        Args:
+            sources (iterable): Paths, or (source, upload_type) pairs for files of different types
+            upload_type (str, optional): Type of every file without its own; guessed per file by default
+            workers (int): Batches and large files sent at the same time
+            batch_max_files (int): Most small files per /upload-batch request
+            batch_max_bytes (int): Most bytes per /upload-batch request
+
+        Yields:
+            tuple: (index of the source, result as returned by upload_many())
+        """
+        items = []
+        for index, source in enumerate(sources):
+            source, item_type = source if isinstance(source, tuple) else (source, upload_type)
+            try:
+                filename, content_type, item_type = self._describe(source, item_type)
+                size = _source_size(source)
+                if not size:
+                    raise ValueError(f"{filename} is empty")
+                items.append((index, source, filename, content_type, item_type, size))
+            except (ValueError, OSError) as e:
+                yield index, {'filename': _source_name(source), 'success': False, 'error': str(e)}
+
+        tasks = []
+        batch, batch_bytes = [], 0
+        for item in items:
+            size = item[5]
+            if size > SINGLE_UPLOAD_MAX_BYTES:
+                tasks.append((self._upload_one, item))
+                continue
+            # Filenames key the manifest, so they must be unique within a batch
+            if batch and (len(batch) >= batch_max_files or batch_bytes + size > batch_max_bytes
+                          or any(other[2] == item[2] for other in batch)):
+                tasks.append((self._upload_batch, batch))
+                batch, batch_bytes = [], 0
+            batch.append(item)
+            batch_bytes += size
+        if batch:
+            tasks.append((self._upload_batch, batch))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload-file') as executor:
+            pending = {executor.submit(task, arg) for task, arg in tasks}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            finally:
+                # Stop promptly when the caller gives up, e.g. on Ctrl-C
+                for future in pending:
+                    future.cancel()
+
+    def _upload_one(self, item):
+        index, source, filename, content_type, upload_type, _ = item
+        try:
+            result = self.upload(source, upload_type, filename, content_type, resumable=True)
+            return [(index, {'filename': filename, 'success': True, 'url': result.get('url'), 'data': result.get('data')})]
+        except ApiError as e:
+            return [(index, {'filename': filename, 'success': False, 'error': str(e), 'upload_id': e.upload_id})]
+        except OSError as e:
+            return [(index, {'filename': filename, 'success': False, 'error': str(e)})]
+
+    def _upload_batch(self, batch):
+        with ExitStack() as stack:
+            try:
+                files = [
+                    ('files', (filename, stack.enter_context(_open_view(source)), content_type))
+                    for _, source, filename, content_type, _, _ in batch
+                ]
+                manifest = {filename: upload_type for _, _, filename, _, upload_type, _ in batch}
+                response = self._request('POST', '/upload-batch', idempotent=False,
+                                         files=files, data={'manifest': json.dumps(manifest)})
+            except (ApiError, OSError) as e:
+                return [(item[0], {'filename': item[2], 'success': False, 'error': str(e)}) for item in batch]
+
+        return [
+            (item[0], {'filename': item[2], **result})
+            for item, result in zip(batch, response.json()['results'])
+        ]
@@ -0,0 +1,174 @@
+import time
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Attempts per request before giving up, and the backoff between them in seconds
+REQUEST_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20
+
+# Seconds a single request may take
+REQUEST_TIMEOUT = 300
+
+# Pooled connections kept open to the backend
+POOL_SIZE = 16
+
+# Responses worth retrying for requests that are safe to repeat; other errors
+# (e.g. 415 for a rejected file type) fail right away
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Responses that tell a request was not processed at all, so even requests
+# that would create rows twice if repeated can be retried
+NOT_PROCESSED_STATUSES = {429, 503}
+
+
+class ApiError(Exception):
+    """Raised when the backend rejects a request or cannot be reached."""
+
+    def __init__(self, message, status_code=None, upload_id=None):
+        """
+        Args:
+            message (str): What went wrong
+            status_code (int, optional): HTTP status of the last response, if there was one
+            upload_id (str, optional): Resumable upload left behind by a failed upload, see Client.resume()
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.upload_id = upload_id
+
+
+class _PartBody:
+    """
+    File-like body over a slice of a memoryview.
+
+    The HTTP client reads it in blocks straight from the caller's buffer, so no
+    copy of the part is made, and every block read is reported to on_read.
+    """
+
+    def __init__(self, view, on_read):
+        self._view = view
+        self._on_read = on_read
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        block = self._view[self._pos:end]
+        self._pos = end
+        if block:
+            self._on_read(len(block))
+        return block
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        # Only rewinding is needed, when requests resends the body
+        self._pos = offset
+        return self._pos
+
+
+def retry_delay(attempt, response=None):
+    """
+    Exponential backoff with full jitter, or the server's Retry-After if it sent one.
+    """
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def error_message(response):
+    try:
+        return response.json().get('error') or response.reason
+    except ValueError:
+        return f"{response.status_code} {response.reason}"
+
+
+class Transport:
+    """
+    A pooled HTTP session to the backend that retries failed requests with backoff.
+
+    One Transport is meant to be shared by every thread and every Client of a
+    process, so connections to the backend are reused rather than opened per request.
+    """
+
+    def __init__(self, api_url, attempts=REQUEST_ATTEMPTS, timeout=REQUEST_TIMEOUT, pool_size=POOL_SIZE):
+        """
+        Args:
+            api_url (str): Base URL of the backend
+            attempts (int): Attempts per request before giving up
+            timeout (float): Seconds a single request may take
+            pool_size (int): Pooled connections kept open to the backend
+        """
+        self.api_url = api_url.rstrip('/')
+        self.attempts = attempts
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, idempotent=True, body=None, on_read=None, **kwargs):
+        """
+        Send a request, retrying connection errors and retryable statuses.
+
+        Requests that are not idempotent, such as a POST that inserts rows, are
+        only retried when the backend tells it did not process them (429, 503)
+        or when the connection could not be opened at all.
+
+        Args:
+            method (str): HTTP method
+            path (str): Path below the API URL
+            idempotent (bool): Whether repeating the request is harmless
+            body (memoryview, optional): Raw body; it is wrapped anew for every attempt
+            on_read (callable, optional): Called with the size of every block of body sent.
+                Bytes reported by a failed attempt are reported again with a negative count.
+            **kwargs: Passed on to requests (json, data, files, headers, ...)
+
+        Returns:
+            requests.Response: The last response, whatever its status
+
+        Raises:
+            ApiError: If no response was received after all attempts
+        """
+        retry_statuses = RETRY_STATUSES if idempotent else NOT_PROCESSED_STATUSES
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.attempts):
+            sent = [0]
+
+            def count(size):
+                sent[0] += size
+                if on_read:
+                    on_read(size)
+
+            response = None
+            try:
+                if body is not None:
+                    kwargs['data'] = _PartBody(body, count)
+                response = self.session.request(method, f"{self.api_url}{path}", **kwargs)
+                if response.status_code not in retry_statuses or attempt + 1 == self.attempts:
+                    return response
+                error = error_message(response)
+            except requests.ConnectTimeout as e:
+                error = str(e)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent:
+                    # The backend may have received and processed the request
+                    raise ApiError(f"{method} {path} failed: {str(e)}")
+                error = str(e)
+
+            if on_read and sent[0]:
+                on_read(-sent[0])
+            if attempt + 1 < self.attempts:
+                time.sleep(retry_delay(attempt, response))
+
+        raise ApiError(f"{method} {path} failed after {self.attempts} attempts: {error}")
+
+    def close(self):
+        self.session.close()
@@ -1,10 +1,16 @@
+import os
+import sys
 import streamlit as st
-import requests
 import json
 import time
 
+# The API client package lives next to the frontend, in app/client
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "client"))
+from dynocollect_client import Client, ApiError
+
 # ---------- Config ----------
 API_URL = "https://dynocollect.onrender.com"
+MAX_UPLOAD_MB = 500
 
 st.set_page_config( 
     page_title="Swecha Media Upload",
@@ -30,18 +36,23 @@ if "show_login" not in st.session_state:
     st.session_state.show_login = True
 
 # ---------- API Calls ----------
+@st.cache_resource
+def get_client():
+    """One API client, and so one pool of connections to the backend, shared by all sessions."""
+    return Client(API_URL)
+
+def api():
+    """The shared client, authenticated as the logged-in user, which the backend requires when REQUIRE_AUTH is on."""
+    session = (st.session_state.user or {}).get("session") or {}
+    return get_client().with_token(session.get("access_token"))
+
 def login(email, password):
     try:
-        response = requests.post(
-            f"{API_URL}/auth/login",
-            json={"email": email, "password": password},
-            headers={"Content-Type": "application/json"}
-        )
-        if response.status_code == 200:
-            st.session_state.authenticated = True
-            st.session_state.user = response.json()
-            return True, "Login successful!"
-        return False, response.json().get("error", "Login failed. Please check your credentials.")
+        st.session_state.user = get_client().with_token(None).login(email, password)
+        st.session_state.authenticated = True
+        return True, "Login successful!"
+    except ApiError as e:
+        return False, str(e) or "Login failed. Please check your credentials."
     except Exception as e:
         return False, f"Error: {str(e)}"
 
@@ -49,15 +60,11 @@ def register(email, password, confirm_password):
     if password != confirm_password:
         return False, "Passwords do not match."
     try:
-        response = requests.post(
-            f"{API_URL}/auth/register",
-            json={"email": email, "password": password},
-            headers={"Content-Type": "application/json"}
-        )
-        if response.status_code == 201:
-            st.session_state.show_login = True
-            return True, "Registration successful! Please login."
-        return False, response.json().get("error", "Registration failed.")
+        get_client().with_token(None).register(email, password)
+        st.session_state.show_login = True
+        return True, "Registration successful! Please login."
+    except ApiError as e:
+        return False, str(e) or "Registration failed."
     except Exception as e:
         return False, f"Error: {str(e)}"
 
@@ -66,6 +73,38 @@ def logout():
     st.session_state.user = None
     return True, "Logout successful!"
 
+def upload_media(uploaded_file, upload_type, label):
+    """Upload a file from st.file_uploader, large files in parts, showing the bytes sent so far."""
+    size_mb = uploaded_file.size / (1024 * 1024)
+    if size_mb > MAX_UPLOAD_MB:
+        st.error(f"File size ({size_mb:.2f} MB) exceeds {MAX_UPLOAD_MB} MB limit.")
+        return
+
+    progress_bar = st.progress(0.0, text="Uploading...")
+
+    def show_progress(sent, total):
+        progress_bar.progress(sent / total, text=f"Uploading... {sent / (1024 * 1024):.1f} of {total / (1024 * 1024):.1f} MB")
+
+    try:
+        # Parts of large files are sent straight from the file's buffer; files up to
+        # the single upload size are copied once into a multipart body
+        result = api().upload(
+            uploaded_file,
+            upload_type,
+            filename=uploaded_file.name,
+            content_type=uploaded_file.type,
+            progress=show_progress
+        )
+        progress_bar.empty()
+        st.success(f"✅ {label} uploaded successfully!")
+        st.json(result)
+    except ApiError as e:
+        progress_bar.empty()
+        st.error(str(e))
+    except Exception as e:
+        progress_bar.empty()
+        st.error(f"Upload error: {str(e)}")
+
 # ---------- UI ----------
 st.title("Swecha Media Upload")
 
@@ -129,16 +168,11 @@ else:
         if st.button("Submit Text"):
             if text_data:
                 try:
-                    response = requests.post(
-                        f"{API_URL}/submit-text",
-                        json={"text_data": text_data},
-                        headers={"Content-Type": "application/json"}
-                    )
-                    if response.status_code == 201:
-                        st.success("Text submitted successfully!")
-                        st.json(response.json())
-                    else:
-                        st.error(f"Error: {response.json().get('error', 'Unknown error')}")
+                    result = api().submit_text(text_data)
+                    st.success("Text submitted successfully!")
+                    st.json(result)
+                except ApiError as e:
+                    st.error(f"Error: {str(e)}")
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
             else:
@@ -151,28 +185,12 @@ else:
         audio_file = st.file_uploader("Choose an audio file", type=["mp3", "wav", "ogg"])
 
         if audio_file:
-            size_mb = len(audio_file.getvalue()) / (1024 * 1024)
+            size_mb = audio_file.size / (1024 * 1024)
             st.info(f"File size: {size_mb:.2f} MB")
-        
+
         if st.button("Submit Audio"):
             if audio_file:
-                size_mb = len(audio_file.getvalue()) / (1024 * 1024)
-                if size_mb > 500:
-                    st.error(f"File size ({size_mb:.2f} MB) exceeds 500 MB limit.")
-                else:
-                    try:
-                        with st.spinner("Uploading..."):
-                            files = {"file": (audio_file.name, audio_file.getvalue(), audio_file.type)}
-                            response = requests.post(f"{API_URL}/upload-audio", files=files, timeout=600)
-                        if response.status_code == 201:
-                            st.success("✅ Audio uploaded successfully!")
-                            st.json(response.json())
-                        else:
-                            st.error(response.json().get('error', 'Unknown error'))
-                    except requests.exceptions.Timeout:
-                        st.error("Upload timed out.")
-                    except Exception as e:
-                        st.error(f"Upload error: {str(e)}")
+                upload_media(audio_file, "audio", "Audio")
             else:
                 st.warning("Please select an audio file.")
 
@@ -183,28 +201,12 @@ else:
         video_file = st.file_uploader("Choose a video file", type=["mp4", "mov", "avi"])
         
         if video_file:
-            size_mb = len(video_file.getvalue()) / (1024 * 1024)
+            size_mb = video_file.size / (1024 * 1024)
             st.info(f"File size: {size_mb:.2f} MB")
 
         if st.button("Submit Video"):
             if video_file:
-                size_mb = len(video_file.getvalue()) / (1024 * 1024)
-                if size_mb > 500:
-                    st.error(f"File size ({size_mb:.2f} MB) exceeds 500 MB limit.")
-                else:
-                    try:
-                        with st.spinner("Uploading..."):
-                            files = {"file": (video_file.name, video_file.getvalue(), video_file.type)}
-                            response = requests.post(f"{API_URL}/upload-video", files=files, timeout=600)
-                        if response.status_code == 201:
-                            st.success("✅ Video uploaded successfully!")
-                            st.json(response.json())
-                        else:
-                            st.error(response.json().get('error', 'Unknown error'))
-                    except requests.exceptions.Timeout:
-                        st.error("Upload timed out.")
-                    except Exception as e:
-                        st.error(f"Upload error: {str(e)}")
+                upload_media(video_file, "video", "Video")
             else:
                 st.warning("Please select a video file.")
 
@@ -215,27 +217,11 @@ else:
         image_file = st.file_uploader("Choose an image file", type=["jpg", "jpeg", "png", "gif"])
         
         if image_file:
-            size_mb = len(image_file.getvalue()) / (1024 * 1024)
+            size_mb = image_file.size / (1024 * 1024)
             st.info(f"File size: {size_mb:.2f} MB")
 
         if st.button("Submit Image"):
             if image_file:
-                size_mb = len(image_file.getvalue()) / (1024 * 1024)
-                if size_mb > 500:
-                    st.error(f"File size ({size_mb:.2f} MB) exceeds 500 MB limit.")
-                else:
-                    try:
-                        with st.spinner("Uploading..."):
-                            files = {"file": (image_file.name, image_file.getvalue(), image_file.type)}
-                            response = requests.post(f"{API_URL}/upload-image", files=files, timeout=600)
-                        if response.status_code == 201:
-                            st.success("✅ Image uploaded successfully!")
-                            st.json(response.json())
-                        else:
-                            st.error(response.json().get('error', 'Unknown error'))
-                    except requests.exceptions.Timeout:
-                        st.error("Upload timed out.")
-                    except Exception as e:
-                        st.error(f"Upload error: {str(e)}")
+                upload_media(image_file, "image", "Image")
             else:
                 st.warning("Please select an image file.")